@@ -0,0 +1,69 @@
+"""Сравнение all_passengers как таблицы-копии и как представления UNION ALL.
+
+Для каждого режима измеряются время загрузки, размер файла базы и
+задержка запросов 5, 6, 8 и 9, которые читают all_passengers.
+
+Запуск: python benchmarks/bench_all_passengers.py --rows 200000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+import zad  # noqa: E402
+
+COMBINED_QUERIES = (5, 6, 8, 9)
+
+
+def run_mode(work_dir: str, mode: str, repeats: int) -> None:
+    db_path = os.path.join(work_dir, zad.DATABASE_PATH)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    conn = sqlite3.connect(db_path)
+    started = time.perf_counter()
+    zad.load_data(conn, zad.RunOptions(combined_mode=mode))
+    load_s = time.perf_counter() - started
+    size_mb = os.path.getsize(db_path) / 2**20
+
+    catalog = zad.load_catalog()
+    latencies = []
+    for n in COMBINED_QUERIES:
+        query = catalog[n - 1]
+        best = float("inf")
+        for _ in range(repeats):
+            started = time.perf_counter()
+            conn.execute(query.sql, query.params).fetchall()
+            best = min(best, time.perf_counter() - started)
+        latencies.append(best * 1000)
+    conn.close()
+
+    query_cells = " ".join(f"{ms:>9.2f}" for ms in latencies)
+    print(f"{mode:>6} {load_s:>10.2f} {size_mb:>9.1f} {query_cells}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    query_header = " ".join(f"{'Q' + str(n) + ', мс':>9}" for n in COMBINED_QUERIES)
+    print(f"{'режим':>6} {'загрузка,с':>10} {'база, МБ':>9} {query_header}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_synthetic_dataset(work_dir, args.rows)
+        os.chdir(work_dir)
+        for mode in ("table", "view"):
+            run_mode(work_dir, mode, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Время агрегатных запросов каталога в SQLite и в бэкенде numpy.
+
+Для numpy отдельно показаны чтение колонок из базы (один раз на таблицу)
+и сами векторные вычисления.
+
+Запуск: python benchmarks/bench_backends.py --rows 1000000 10000000 50000000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+from synthetic import write_synthetic_dataset
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+import zad  # noqa: E402
+
+
+def run_backend(conn: sqlite3.Connection, catalog, backend: str) -> dict[str, float]:
+    runner = zad.QueryRunner(conn, backend)
+    totals = {"columns_s": 0.0, "compute_s": 0.0}
+    for query in catalog:
+        result = runner.run(query)
+        totals["columns_s"] += result.timings.get("columns_s", 0.0)
+        totals["compute_s"] += result.timings["execute_s"] + result.timings.get(
+            "fetch_s", 0.0
+        )
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[1_000_000, 10_000_000, 50_000_000]
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'строк':>11} {'sqlite, с':>10} {'numpy: колонки, с':>18} "
+        f"{'numpy: расчет, с':>17} {'ускорение расчета':>18}"
+    )
+    original_dir = os.getcwd()
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work_dir:
+            write_synthetic_dataset(work_dir, rows)
+            os.chdir(work_dir)
+            try:
+                conn = sqlite3.connect(zad.DATABASE_PATH)
+                zad.load_data(conn, zad.RunOptions(loader="bulk"))
+                catalog = [query for query in zad.load_catalog() if query.kernel]
+
+                sqlite_s = run_backend(conn, catalog, "sqlite")["compute_s"]
+                numpy_times = run_backend(conn, catalog, "numpy")
+                conn.close()
+            finally:
+                os.chdir(original_dir)
+
+        speedup = sqlite_s / numpy_times["compute_s"]
+        print(
+            f"{rows:>11} {sqlite_s:>10.3f} {numpy_times['columns_s']:>18.3f} "
+            f"{numpy_times['compute_s']:>17.3f} {speedup:>17.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
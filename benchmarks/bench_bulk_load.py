@@ -0,0 +1,59 @@
+"""Сравнение скорости загрузки: DataFrame.to_sql и массовая загрузка executemany.
+
+Запуск: python benchmarks/bench_bulk_load.py --rows 100000 1000000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+import zad  # noqa: E402
+
+
+def measure(loader: str) -> tuple[int, float]:
+    """Загружает датасет в пустую базу, возвращает (строк, секунд)"""
+    if os.path.exists(zad.DATABASE_PATH):
+        os.remove(zad.DATABASE_PATH)
+    conn = sqlite3.connect(zad.DATABASE_PATH)
+    started = time.perf_counter()
+    counts = zad.load_data(conn, zad.RunOptions(loader=loader))
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return sum(counts.values()), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(
+        f"{'строк':>10} {'to_sql, с':>10} {'to_sql, стр/с':>14}"
+        f" {'bulk, с':>10} {'bulk, стр/с':>14} {'ускорение':>10}"
+    )
+    original_dir = os.getcwd()
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work_dir:
+            write_synthetic_dataset(work_dir, rows)
+            os.chdir(work_dir)
+            try:
+                total, pandas_s = measure("pandas")
+                _, bulk_s = measure("bulk")
+            finally:
+                os.chdir(original_dir)
+        print(
+            f"{rows:>10} {pandas_s:>10.2f} {total / pandas_s:>14,.0f}"
+            f" {bulk_s:>10.2f} {total / bulk_s:>14,.0f} {pandas_s / bulk_s:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
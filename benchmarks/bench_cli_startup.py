@@ -0,0 +1,83 @@
+"""Холодный старт команд zad.py: время процесса и импортируются ли pandas и numpy.
+
+Каждая команда запускается в новом процессе над уже загруженной базой;
+CSV не меняются, поэтому load только сверяет манифест.
+Запуск: python benchmarks/bench_cli_startup.py --rows 100000 --repeat 5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "zad.py")
+
+COMMANDS = [
+    ["report"],
+    ["query", "--name", "query_02"],
+    ["query"],
+    ["export"],
+    ["load"],
+    [],
+]
+
+# Запуск скрипта как __main__ с выводом импортированных тяжелых модулей
+WRAPPER = """
+import runpy, sys
+sys.argv = [{script!r}, *{command!r}]
+runpy.run_path({script!r}, run_name="__main__")
+print(sorted({{"pandas", "numpy"}} & set(sys.modules)), file=sys.stderr)
+"""
+
+
+def run(work_dir: str, command: list[str]) -> float:
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, SCRIPT, *command],
+        cwd=work_dir,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - started
+
+
+def heavy_imports(work_dir: str, command: list[str]) -> str:
+    code = WRAPPER.format(script=os.path.abspath(SCRIPT), command=command)
+    process = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=work_dir,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return process.stderr.strip().splitlines()[-1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_synthetic_dataset(work_dir, args.rows)
+        run(work_dir, ["load", "--loader", "bulk"])
+
+        print(f"Строк в исходных данных: {args.rows}")
+        print(f"{'команда':>28} {'лучшее, с':>10} {'медиана, с':>11}  импорты")
+        for command in COMMANDS:
+            timings = sorted(run(work_dir, command) for _ in range(args.repeat))
+            label = " ".join(command) or "(все этапы)"
+            print(
+                f"{label:>28} {timings[0]:>10.3f} {timings[len(timings) // 2]:>11.3f}"
+                f"  {heavy_imports(work_dir, command)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
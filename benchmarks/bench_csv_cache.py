@@ -0,0 +1,48 @@
+"""Время получения DataFrame: разбор CSV, холодный и теплый двоичный кэш.
+
+Запуск: python benchmarks/bench_csv_cache.py --rows 1000000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+import zad  # noqa: E402
+
+
+def timed(func) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_synthetic_dataset(work_dir, args.rows)
+        path = os.path.join(work_dir, "train.csv")
+
+        parse_s = timed(lambda: zad.read_source(path))
+        shutil.rmtree(os.path.join(work_dir, zad.CSV_CACHE_DIR), ignore_errors=True)
+        cold_s = timed(lambda: zad.read_source(path, use_cache=True))
+        warm_s = timed(lambda: zad.read_source(path, use_cache=True))
+
+    print(f"строк: {args.rows}")
+    print(f"  pd.read_csv:           {parse_s:8.2f} с")
+    print(f"  холодный кэш (+запись): {cold_s:8.2f} с")
+    print(f"  теплый кэш (mmap):      {warm_s:8.2f} с  ({parse_s / warm_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Экспорт одного результата в несколько форматов: по очереди и с раздачей по потокам.
+
+Для каждого формата выводятся время и размер файла.
+Запуск: python benchmarks/bench_export_fanout.py --rows 1000000 --formats csv csv.xz
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import zad  # noqa: E402
+
+FORMATS = [
+    "csv",
+    "json",
+    "ndjson",
+    "csv.gz",
+    "json.gz",
+    "ndjson.gz",
+    "ndjson.bz2",
+    "ndjson.xz",
+]
+
+
+def export(
+    conn: sqlite3.Connection, outputs: list[str], batch_rows: int, threads: bool
+) -> float:
+    """Выбирает все строки all_passengers порциями и экспортирует, возвращает секунды"""
+    query = zad.CatalogQuery(
+        "export", "Все пассажиры", "SELECT * FROM all_passengers", outputs=outputs
+    )
+    started = time.perf_counter()
+    cursor = conn.execute(query.sql)
+    result = zad.ResultExport(
+        query, [column[0] for column in cursor.description], threads
+    )
+    while batch := cursor.fetchmany(batch_rows):
+        result.write(batch)
+    result.close()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--batch-rows", type=int, default=10_000)
+    parser.add_argument("--formats", nargs="+", default=FORMATS)
+    args = parser.parse_args()
+    print(f"Ядер: {os.cpu_count()}")
+
+    original_dir = os.getcwd()
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work_dir:
+            write_synthetic_dataset(work_dir, rows)
+            os.chdir(work_dir)
+            try:
+                conn = sqlite3.connect(zad.DATABASE_PATH)
+                zad.load_data(conn, zad.RunOptions(loader="bulk"))
+
+                print(f"\nСтрок в исходных данных: {rows}")
+                print(f"{'форматы':>36} {'время, с':>10} {'размер, МБ':>11}")
+                single = {}
+                for fmt in args.formats:
+                    single[fmt] = export(conn, [fmt], args.batch_rows, False)
+                    size = os.path.getsize(zad.export_path("export", fmt)) / 2**20
+                    print(f"{fmt:>36} {single[fmt]:>10.2f} {size:>11.1f}")
+                print(f"{'сумма по форматам':>36} {sum(single.values()):>10.2f}")
+                print(f"{'самый медленный формат':>36} {max(single.values()):>10.2f}")
+                sequential = export(conn, args.formats, args.batch_rows, False)
+                print(f"{'все форматы по очереди':>36} {sequential:>10.2f}")
+                fan_out = export(conn, args.formats, args.batch_rows, True)
+                print(f"{'все форматы в потоках':>36} {fan_out:>10.2f}")
+                conn.close()
+            finally:
+                os.chdir(original_dir)
+
+
+if __name__ == "__main__":
+    main()
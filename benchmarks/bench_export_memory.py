@@ -0,0 +1,86 @@
+"""Сравнение пикового RSS при экспорте большого результата через pandas и потоково.
+
+Запуск: python benchmarks/bench_export_memory.py --rows 1000000 5000000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Загрузка тоже идет в отдельном процессе: пиковый RSS родителя наследуется
+# потомком через fork и исказил бы замеры экспорта
+LOAD_SCRIPT = """
+import sqlite3, sys
+sys.path.insert(0, {src!r})
+import zad
+conn = sqlite3.connect(zad.DATABASE_PATH)
+zad.load_data(conn, zad.RunOptions(loader="bulk"))
+conn.close()
+"""
+
+EXPORT_SCRIPT = """
+import sqlite3, sys
+sys.path.insert(0, {src!r})
+import zad
+conn = sqlite3.connect(zad.DATABASE_PATH)
+query = zad.CatalogQuery("export", "Все пассажиры", "SELECT * FROM all_passengers")
+batch_rows = {batch_rows!r}
+if batch_rows is None:
+    result = zad.QueryRunner(conn).run(query)
+    df = result.to_frame()
+    df.to_csv("csv_results/export.csv", index=False, encoding="utf-8")
+    df.to_json("json_results/export.json", orient="records", indent=2, force_ascii=False)
+else:
+    stream = zad.StreamExport(batch_rows=batch_rows)
+    zad.QueryRunner(conn, stream=stream).run(query)
+conn.close()
+"""
+
+
+def measure(work_dir: str, batch_rows: int | None) -> tuple[float, float]:
+    """Запускает экспорт в отдельном процессе, возвращает (секунды, пиковый RSS в МБ)"""
+    for directory in ("csv_results", "json_results"):
+        os.makedirs(os.path.join(work_dir, directory), exist_ok=True)
+
+    script = EXPORT_SCRIPT.format(src=os.path.abspath(SRC_DIR), batch_rows=batch_rows)
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", script], cwd=work_dir)
+    # wait4 возвращает ресурсы конкретного потомка, а не максимум по всем
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    if status != 0:
+        raise RuntimeError(f"экспорт завершился с кодом {status}")
+    # ru_maxrss в Linux измеряется в килобайтах
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    parser.add_argument("--batch-rows", type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f"{'строк':>12} {'режим':>18} {'время, с':>10} {'пик RSS, МБ':>12}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work_dir:
+            write_synthetic_dataset(work_dir, rows)
+            script = LOAD_SCRIPT.format(src=os.path.abspath(SRC_DIR))
+            subprocess.run([sys.executable, "-c", script], cwd=work_dir, check=True)
+
+            for label, batch_rows in (
+                ("pandas", None),
+                (f"поток {args.batch_rows}", args.batch_rows),
+            ):
+                elapsed, peak_mb = measure(work_dir, batch_rows)
+                print(f"{rows:>12} {label:>18} {elapsed:>10.2f} {peak_mb:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Сравнение пикового RSS при загрузке CSV целиком и порциями.
+
+Запуск: python benchmarks/bench_ingest_memory.py --rows 100000 1000000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+LOAD_SCRIPT = """
+import sqlite3, sys
+sys.path.insert(0, {src!r})
+import zad
+conn = sqlite3.connect(zad.DATABASE_PATH)
+zad.load_data(conn, zad.RunOptions(chunk_rows={chunk_rows!r}))
+conn.close()
+"""
+
+
+def measure(work_dir: str, chunk_rows: int | None) -> tuple[float, float]:
+    """Запускает загрузку в отдельном процессе, возвращает (секунды, пиковый RSS в МБ)"""
+    db_path = os.path.join(work_dir, "titanic_database.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    script = LOAD_SCRIPT.format(src=os.path.abspath(SRC_DIR), chunk_rows=chunk_rows)
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", script], cwd=work_dir)
+    # wait4 возвращает ресурсы конкретного потомка, а не максимум по всем
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    if status != 0:
+        raise RuntimeError(f"загрузка завершилась с кодом {status}")
+    # ru_maxrss в Linux измеряется в килобайтах
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    print(f"{'строк':>12} {'режим':>18} {'время, с':>10} {'пик RSS, МБ':>12}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work_dir:
+            write_synthetic_dataset(work_dir, rows)
+            for label, chunk_rows in (
+                ("весь файл", None),
+                (f"порции {args.chunk_rows}", args.chunk_rows),
+            ):
+                elapsed, peak_mb = measure(work_dir, chunk_rows)
+                print(f"{rows:>12} {label:>18} {elapsed:>10.2f} {peak_mb:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Чтение большого результата на стороне потребителя: разбор CSV против пакета npy.
+
+Запуск: python benchmarks/bench_npy_bundle.py --rows 1000000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from synthetic import write_synthetic_dataset
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import zad  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    args = parser.parse_args()
+
+    print(
+        f"{'строк':>11} {'формат':>7} {'экспорт, с':>11} {'размер, МБ':>11} "
+        f"{'чтение, с':>10} {'сумма Fare, с':>14}"
+    )
+    original_dir = os.getcwd()
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work_dir:
+            write_synthetic_dataset(work_dir, rows)
+            os.chdir(work_dir)
+            try:
+                conn = sqlite3.connect(zad.DATABASE_PATH)
+                zad.load_data(conn, zad.RunOptions(loader="bulk"))
+                for fmt, read in (
+                    ("csv", pd.read_csv),
+                    ("npy", zad.read_npy_bundle),
+                ):
+                    query = zad.CatalogQuery(
+                        "export",
+                        "Все пассажиры",
+                        "SELECT * FROM all_passengers",
+                        outputs=[fmt],
+                    )
+                    runner = zad.QueryRunner(conn, stream=zad.StreamExport())
+                    started = time.perf_counter()
+                    runner.run(query)
+                    export_s = time.perf_counter() - started
+                    path = zad.export_path("export", fmt)
+
+                    started = time.perf_counter()
+                    df = read(path)
+                    read_s = time.perf_counter() - started
+                    started = time.perf_counter()
+                    df["Fare"].sum()
+                    sum_s = time.perf_counter() - started
+                    size = zad._export_size(path) / 2**20
+                    print(
+                        f"{rows:>11} {fmt:>7} {export_s:>11.2f} {size:>11.1f} "
+                        f"{read_s:>10.3f} {sum_s:>14.4f}"
+                    )
+                conn.close()
+            finally:
+                os.chdir(original_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Масштабирование параллельной загрузки по числу процессов.
+
+Запуск: python benchmarks/bench_parallel_load.py --rows 2000000 --workers 1 2 4 8 16 32
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+import zad  # noqa: E402
+
+
+def measure(workers: int, loader: str) -> float:
+    if os.path.exists(zad.DATABASE_PATH):
+        os.remove(zad.DATABASE_PATH)
+    conn = sqlite3.connect(zad.DATABASE_PATH)
+    started = time.perf_counter()
+    zad.load_data(conn, zad.RunOptions(workers=workers, loader=loader))
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--loader", choices=["pandas", "bulk"], default="bulk")
+    args = parser.parse_args()
+
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_synthetic_dataset(work_dir, args.rows)
+        os.chdir(work_dir)
+        try:
+            print(f"{'процессов':>10} {'время, с':>10} {'ускорение':>10}")
+            baseline = None
+            for workers in args.workers:
+                elapsed = measure(workers, args.loader)
+                baseline = baseline or elapsed
+                print(f"{workers:>10} {elapsed:>10.2f} {baseline / elapsed:>9.2f}x")
+        finally:
+            os.chdir(original_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Запросы каталога через сервис zad.py serve против отдельного процесса на запрос.
+
+Клиенты по очереди запрашивают GET /queries/<ключ> по постоянному соединению;
+выводятся пропускная способность и задержки p50/p95/p99.
+Запуск: python benchmarks/bench_query_service.py --rows 100000 --clients 1 4 16
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from synthetic import write_synthetic_dataset
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+SCRIPT = os.path.join(SRC_DIR, "zad.py")
+sys.path.insert(0, SRC_DIR)
+
+import zad  # noqa: E402
+
+KEYS = ["query_02", "query_03", "query_06", "query_08", "query_10"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((zad.SERVICE_HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            client = http.client.HTTPConnection(zad.SERVICE_HOST, port, timeout=1)
+            client.request("GET", "/health")
+            client.getresponse().read()
+            client.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def client_run(port: int, requests: int, offset: int) -> list[float]:
+    """Один клиент с keep-alive, возвращает задержки запросов в секундах"""
+    client = http.client.HTTPConnection(zad.SERVICE_HOST, port, timeout=60)
+    latencies = []
+    for i in range(requests):
+        started = time.perf_counter()
+        client.request("GET", f"/queries/{KEYS[(offset + i) % len(KEYS)]}")
+        client.getresponse().read()
+        latencies.append(time.perf_counter() - started)
+    client.close()
+    return latencies
+
+
+def one_shot(work_dir: str, requests: int) -> list[float]:
+    """Прежний путь: новый процесс zad.py query на каждый запрос"""
+    latencies = []
+    for i in range(requests):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, SCRIPT, "query", "--name", KEYS[i % len(KEYS)]],
+            cwd=work_dir,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def print_row(label: str, latencies: list[float], elapsed: float) -> None:
+    summary = zad.latency_summary(latencies)
+    print(
+        f"{label:>22} {len(latencies) / elapsed:>10.1f} {summary['p50_ms']:>9.1f}"
+        f" {summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=4)
+    args = parser.parse_args()
+    print(f"Ядер: {os.cpu_count()}, строк в исходных данных: {args.rows}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_synthetic_dataset(work_dir, args.rows)
+        subprocess.run(
+            [sys.executable, SCRIPT, "load", "--loader", "bulk"],
+            cwd=work_dir,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+        print(
+            f"{'режим':>22} {'запр./с':>10} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}"
+        )
+        started = time.perf_counter()
+        latencies = one_shot(work_dir, min(args.requests, 20))
+        print_row("процесс на запрос", latencies, time.perf_counter() - started)
+
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, SCRIPT, "serve", "--port", str(port)]
+            + ["--pool-size", str(args.pool_size)],
+            cwd=work_dir,
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(port)
+            for clients in args.clients:
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=clients) as pool:
+                    runs = list(
+                        pool.map(
+                            lambda n: client_run(port, args.requests, n),
+                            range(clients),
+                        )
+                    )
+                elapsed = time.perf_counter() - started
+                latencies = [latency for run in runs for latency in run]
+                print_row(f"сервис, клиентов {clients}", latencies, elapsed)
+
+            client = http.client.HTTPConnection(zad.SERVICE_HOST, port)
+            client.request("GET", "/stats")
+            stats = json.loads(client.getresponse().read())
+            client.close()
+            print(f"Статистика сервиса: {json.dumps(stats, ensure_ascii=False)}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Время фазы запросов при выполнении каталога в 1, 2, 4 и 8 потоках.
+
+Запуск: python benchmarks/bench_query_workers.py --rows 1000000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+import zad  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_synthetic_dataset(work_dir, args.rows)
+        os.chdir(work_dir)
+        try:
+            conn = sqlite3.connect(zad.DATABASE_PATH)
+            zad.load_data(conn, zad.RunOptions(loader="bulk"))
+            catalog = zad.load_catalog()
+
+            print(f"{'потоков':>8} {'фаза запросов, с':>17} {'ускорение':>10}")
+            baseline = None
+            for workers in args.workers:
+                best = float("inf")
+                for _ in range(args.repeats):
+                    started = time.perf_counter()
+                    for _, outcome in zad.iter_query_results(conn, catalog, workers):
+                        if isinstance(outcome, Exception):
+                            raise outcome
+                    best = min(best, time.perf_counter() - started)
+                baseline = baseline or best
+                print(f"{workers:>8} {best:>17.3f} {baseline / best:>9.2f}x")
+            conn.close()
+        finally:
+            os.chdir(original_dir)
+
+
+if __name__ == "__main__":
+    main()
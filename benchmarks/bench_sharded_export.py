@@ -0,0 +1,73 @@
+"""Экспорт большого результата одним файлом и частями с разным числом потоков записи.
+
+Запуск: python benchmarks/bench_sharded_export.py --rows 1000000 --shard-rows 250000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import zad  # noqa: E402
+
+
+def export(
+    conn: sqlite3.Connection,
+    outputs: list[str],
+    batch_rows: int,
+    shard: zad.ShardSpec | None,
+) -> tuple[float, int]:
+    """Экспортирует all_passengers, возвращает (секунды, байт на диске)"""
+    query = zad.CatalogQuery(
+        "export", "Все пассажиры", "SELECT * FROM all_passengers", outputs=outputs
+    )
+    started = time.perf_counter()
+    stream = zad.StreamExport(batch_rows=batch_rows, shard=shard)
+    result = zad.QueryRunner(conn, stream=stream).run(query)
+    elapsed = time.perf_counter() - started
+    return elapsed, sum(stats["bytes"] for stats in result.export_stats.values())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--batch-rows", type=int, default=10_000)
+    parser.add_argument("--shard-rows", type=int, default=250_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--formats", nargs="+", default=["csv.gz", "ndjson.xz"])
+    args = parser.parse_args()
+    print(f"Ядер: {os.cpu_count()}")
+
+    original_dir = os.getcwd()
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work_dir:
+            write_synthetic_dataset(work_dir, rows)
+            os.chdir(work_dir)
+            try:
+                conn = sqlite3.connect(zad.DATABASE_PATH)
+                zad.load_data(conn, zad.RunOptions(loader="bulk"))
+
+                print(f"\nСтрок в исходных данных: {rows}")
+                print(f"{'режим':>28} {'время, с':>10} {'размер, МБ':>11}")
+                elapsed, size = export(conn, args.formats, args.batch_rows, None)
+                print(f"{'одним файлом':>28} {elapsed:>10.2f} {size / 2**20:>11.1f}")
+                for workers in args.workers:
+                    shard = zad.ShardSpec(rows=args.shard_rows, workers=workers)
+                    elapsed, size = export(conn, args.formats, args.batch_rows, shard)
+                    label = f"частями, потоков {workers}"
+                    print(f"{label:>28} {elapsed:>10.2f} {size / 2**20:>11.1f}")
+                conn.close()
+            finally:
+                os.chdir(original_dir)
+
+
+if __name__ == "__main__":
+    main()
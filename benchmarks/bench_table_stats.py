@@ -0,0 +1,71 @@
+"""Сводный отчет по таблицам: COUNT(*) по каждой таблице против сохраненной статистики.
+
+Запуск: python benchmarks/bench_table_stats.py --rows 100000 1000000 5000000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_dataset
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+import zad  # noqa: E402
+
+
+def count_rows(conn: sqlite3.Connection) -> dict[str, int]:
+    """Прежний отчет: COUNT(*) по каждой таблице и представлению"""
+    names = conn.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'
+        """).fetchall()
+    return {
+        name: conn.execute(f"SELECT COUNT(*) FROM {zad._quote(name)}").fetchone()[0]
+        for (name,) in names
+    }
+
+
+def best_of(repeat: int, func, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    original_dir = os.getcwd()
+    print(f"{'строк':>12} {'COUNT(*), с':>12} {'статистика, с':>14} {'сбор, с':>9}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work_dir:
+            write_synthetic_dataset(work_dir, rows)
+            os.chdir(work_dir)
+            try:
+                conn = sqlite3.connect(zad.DATABASE_PATH)
+                zad.load_data(conn, zad.RunOptions(loader="bulk"))
+                tables = [*zad.DATA_TABLES, zad.COMBINED_TABLE]
+                collect_s = best_of(1, zad.collect_table_stats, conn, tables)
+                counted = best_of(args.repeat, count_rows, conn)
+                stored = best_of(args.repeat, zad.report_table_stats, conn)
+                conn.close()
+            finally:
+                os.chdir(original_dir)
+        print(f"{rows:>12} {counted:>12.3f} {stored:>14.3f} {collect_s:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Генерация синтетического датасета Titanic заданного размера для бенчмарков"""
+
+import csv
+import os
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _read_template(name: str) -> tuple[list[str], list[list[str]]]:
+    with open(os.path.join(ROOT_DIR, name), newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        return header, list(reader)
+
+
+def write_synthetic_dataset(target_dir: str, train_rows: int) -> None:
+    """Создает train.csv, test.csv и gender_submission.csv в target_dir.
+
+    Строки исходных файлов повторяются по кругу, PassengerId перенумеровываются,
+    чтобы оставаться уникальными. Тестовая выборка составляет около половины
+    тренировочной, как в оригинальном датасете.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    test_rows = max(1, train_rows // 2)
+    next_id = 1
+
+    header, template = _read_template("train.csv")
+    with open(os.path.join(target_dir, "train.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(train_rows):
+            row = list(template[i % len(template)])
+            row[0] = str(next_id)
+            next_id += 1
+            writer.writerow(row)
+
+    header, template = _read_template("test.csv")
+    _, submissions = _read_template("gender_submission.csv")
+    with (
+        open(os.path.join(target_dir, "test.csv"), "w", newline="") as f_test,
+        open(
+            os.path.join(target_dir, "gender_submission.csv"), "w", newline=""
+        ) as f_sub,
+    ):
+        test_writer = csv.writer(f_test)
+        sub_writer = csv.writer(f_sub)
+        test_writer.writerow(header)
+        sub_writer.writerow(["PassengerId", "Survived"])
+        for i in range(test_rows):
+            row = list(template[i % len(template)])
+            row[0] = str(next_id)
+            test_writer.writerow(row)
+            sub_writer.writerow([str(next_id), submissions[i % len(submissions)][1]])
+            next_id += 1
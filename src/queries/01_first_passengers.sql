@@ -0,0 +1,3 @@
+SELECT PassengerId, Name, Sex, Age, Survived
+FROM passengers_train
+LIMIT :limit;
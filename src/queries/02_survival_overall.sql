@@ -0,0 +1,5 @@
+SELECT
+    COUNT(*) as total_passengers,
+    SUM(Survived) as survived,
+    ROUND(AVG(Survived) * 100, 2) as survival_rate_percent
+FROM passengers_train;
@@ -0,0 +1,8 @@
+SELECT
+    Sex,
+    COUNT(*) as total,
+    SUM(Survived) as survived,
+    ROUND(AVG(Survived) * 100, 2) as survival_rate_percent
+FROM passengers_train
+GROUP BY Sex
+ORDER BY survival_rate_percent DESC;
@@ -0,0 +1,8 @@
+SELECT
+    COUNT(*) as total,
+    ROUND(AVG(Age), 2) as avg_age,
+    MIN(Age) as min_age,
+    MAX(Age) as max_age,
+    COUNT(CASE WHEN Age < 18 THEN 1 END) as children
+FROM all_passengers
+WHERE Age IS NOT NULL;
@@ -0,0 +1,5 @@
+SELECT PassengerId, Name, Pclass, Fare, Embarked
+FROM all_passengers
+WHERE Fare IS NOT NULL
+ORDER BY Fare DESC, PassengerId
+LIMIT :limit;
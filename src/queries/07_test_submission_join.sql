@@ -0,0 +1,12 @@
+SELECT
+    t.PassengerId,
+    t.Name,
+    t.Sex,
+    t.Age,
+    t.Pclass,
+    s.Survived as predicted_survival
+FROM passengers_test t
+LEFT JOIN submission_template s
+ON t.PassengerId = s.PassengerId
+ORDER BY t.PassengerId
+LIMIT :limit;
@@ -0,0 +1,10 @@
+SELECT
+    Pclass,
+    Sex,
+    AVG(SibSp) as avg_siblings_spouses,
+    AVG(Parch) as avg_parents_children,
+    AVG(SibSp + Parch) as avg_family_size,
+    COUNT(*) as passenger_count
+FROM all_passengers
+GROUP BY Pclass, Sex
+ORDER BY Pclass, Sex;
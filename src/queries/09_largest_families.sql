@@ -0,0 +1,16 @@
+SELECT
+    PassengerId,
+    Name,
+    Pclass,
+    SibSp,
+    Parch,
+    (SibSp + Parch) as family_size,
+    CASE
+        WHEN (SibSp + Parch) > 4 THEN 'Большая семья'
+        WHEN (SibSp + Parch) > 1 THEN 'Средняя семья'
+        ELSE 'Маленькая семья/Один'
+    END as family_category
+FROM all_passengers
+WHERE SibSp + Parch > 0
+ORDER BY family_size DESC, PassengerId
+LIMIT :limit;
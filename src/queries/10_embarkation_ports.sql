@@ -0,0 +1,10 @@
+SELECT
+    Embarked,
+    COUNT(*) as total_passengers,
+    ROUND(AVG(Fare), 2) as avg_fare,
+    ROUND(AVG(Age), 2) as avg_age,
+    SUM(Survived) as survived
+FROM passengers_train
+WHERE Embarked IS NOT NULL
+GROUP BY Embarked
+ORDER BY total_passengers DESC;
@@ -1,256 +1,4394 @@
+from __future__ import annotations
+
+import argparse
+import bz2
+import concurrent.futures
+import csv
+import fnmatch
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import lzma
+import math
 import os
+import queue
+import re
+import shutil
 import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from functools import partial
+from http import HTTPStatus
+from json.encoder import encode_basestring
+from types import ModuleType
+from typing import TYPE_CHECKING, BinaryIO, cast
+from urllib.parse import parse_qsl, urlsplit
+
+
+class _LazyModule:
+    """Модуль, который импортируется при первом обращении к его атрибуту.
+
+    pandas и numpy нужны не каждой команде: отчет и запросы SQLite обходятся
+    без них, а импорт pandas - заметная часть холодного старта. После импорта
+    глобальное имя модуля заменяется самим модулем.
+    """
+
+    _name: str
+    _alias: str
+    _module: ModuleType | None
+
+    def __init__(self, name: str, alias: str) -> None:
+        self.__dict__.update(_name=name, _alias=alias, _module=None)
+
+    def _load(self) -> ModuleType:
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            self.__dict__["_module"] = module
+            globals()[self._alias] = module
+        return module
+
+    def __getattr__(self, attr: str) -> object:
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value: object) -> None:
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr: str) -> None:
+        delattr(self._load(), attr)
+
+
+if TYPE_CHECKING:
+    import asyncio
+
+    import numpy as np
+    import pandas as pd
+else:
+    np = _LazyModule("numpy", "np")
+    pd = _LazyModule("pandas", "pd")
+    # asyncio нужен только команде serve
+    asyncio = _LazyModule("asyncio", "asyncio")
+
+DATABASE_PATH = "titanic_database.db"
+
+# Исходные CSV-файлы и таблицы, в которые они загружаются
+DATA_TABLES: dict[str, str] = {
+    "passengers_train": "train.csv",
+    "passengers_test": "test.csv",
+    "submission_template": "gender_submission.csv",
+}
+
+# Объединенная таблица строится из тренировочной и тестовой выборок
+COMBINED_TABLE = "all_passengers"
+COMBINED_SOURCES = ("passengers_train", "passengers_test")
+
+# Объявленная схема таблиц: PassengerId служит первичным ключом (rowid)
+_PASSENGER_COLUMNS = """
+    PassengerId INTEGER PRIMARY KEY,{survived}
+    Pclass INTEGER,
+    Name TEXT,
+    Sex TEXT,
+    Age REAL,
+    SibSp INTEGER,
+    Parch INTEGER,
+    Ticket TEXT,
+    Fare REAL,
+    Cabin TEXT,
+    Embarked TEXT
+"""
+TABLE_SCHEMAS: dict[str, str] = {
+    "passengers_train": "CREATE TABLE passengers_train ("
+    + _PASSENGER_COLUMNS.format(survived="\n    Survived INTEGER,")
+    + ");",
+    "passengers_test": "CREATE TABLE passengers_test ("
+    + _PASSENGER_COLUMNS.format(survived="")
+    + ");",
+    "submission_template": """CREATE TABLE submission_template (
+    PassengerId INTEGER PRIMARY KEY,
+    Survived INTEGER
+);""",
+    "all_passengers": "CREATE TABLE all_passengers ("
+    + _PASSENGER_COLUMNS.format(survived="\n    Survived INTEGER,")
+    + ");",
+}
+
+# Индексы под фильтры, группировки и сортировки аналитических запросов
+_PASSENGER_INDEXES: list[tuple[str, str]] = [
+    ("sex", "Sex"),
+    ("pclass_sex", "Pclass, Sex"),
+    ("embarked", "Embarked"),
+    ("fare", "Fare DESC"),
+    ("family_size", "SibSp + Parch DESC"),
+]
+TABLE_INDEXES: dict[str, list[tuple[str, str]]] = {
+    "passengers_train": _PASSENGER_INDEXES,
+    "passengers_test": _PASSENGER_INDEXES,
+    "all_passengers": _PASSENGER_INDEXES,
+}
+
+# Минимальный размер части CSV при параллельной загрузке
+PARALLEL_PART_BYTES = 8 * 2**20
+
+# Каталог двоичного кэша разобранных CSV (создается рядом с CSV-файлами)
+CSV_CACHE_DIR = ".csv_cache"
+
+# Каталог аналитических запросов: манифест и .sql-файлы
+CATALOG_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "queries", "catalog.json"
+)
+
+# Базовые планы запросов каталога (EXPLAIN QUERY PLAN) по режимам all_passengers
+PLAN_BASELINE_PATH = os.path.join(os.path.dirname(CATALOG_PATH), "query_plans.json")
+# Признаки плана, рост числа которых считается регрессией.
+# Проход по индексу (SCAN .. USING [COVERING] INDEX) полным проходом таблицы не считается
+PLAN_REGRESSIONS: dict[str, str] = {
+    "full_scan": r"^SCAN (?!CONSTANT)(?!.* USING (COVERING )?INDEX )",
+    "automatic_index": r"AUTOMATIC",
+    "temp_btree": r"USE TEMP B-TREE",
+}
+
+# Каталоги и расширения файлов для форматов экспорта
+EXPORT_FORMATS: dict[str, tuple[str, str]] = {
+    "csv": ("csv_results", "csv"),
+    "json": ("json_results", "json"),
+    "ndjson": ("ndjson_results", "ndjson"),
+}
+# Сжатые варианты форматов ("csv.gz", "ndjson.xz"): обертка над открытым файлом.
+# Без имени и времени в заголовке gzip сжатый файл воспроизводим.
+# Файлы модулей сжатия - io.BufferedIOBase, а не typing.IO, отсюда cast
+Compressor = Callable[[BinaryIO], BinaryIO]
+EXPORT_COMPRESSION: dict[str, Compressor] = {
+    "gz": cast(Compressor, partial(gzip.GzipFile, "", "wb", 6, mtime=0)),
+    "bz2": cast(Compressor, partial(bz2.BZ2File, mode="wb")),
+    "xz": cast(Compressor, partial(lzma.LZMAFile, mode="wb", preset=6)),
+}
+
+# Колоночные пакеты: каталог <каталог>/<запрос>/ с .npy на колонку и схемой
+EXPORT_BUNDLES: dict[str, str] = {"npy": "npy_results"}
+NPY_SCHEMA_FILE = "schema.json"
+# Длина заголовка .npy, кратная 64 (выравнивание данных для mmap)
+NPY_HEADER_BYTES = 128
+
+# Экспорт частями: каталог <файл>.parts/ с part-00000.<расширение> и манифестом
+SHARD_SUFFIX = ".parts"
+SHARD_MANIFEST_FILE = "manifest.json"
+
+# Дайджесты экспортированных результатов: неизменный результат не переписывается
+EXPORT_DIGESTS_TABLE = "export_digests"
+
+# Потоковый экспорт: сколько первых строк остается в памяти для предпросмотра
+# и до какого размера результат целиком сохраняется для кэша результатов
+PREVIEW_ROWS = 3
+STREAM_CACHE_ROWS = 100_000
+
+# Машиночитаемый отчет о выполнении запросов
+RUN_REPORT_PATH = "run_report.json"
+
+# Локальный сервис запросов (команда serve): адрес по умолчанию, строк
+# в порции потокового ответа и сколько последних задержек хранится для /stats
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_BATCH_ROWS = 1000
+SERVICE_LATENCY_WINDOW = 10_000
+
+# Профили запросов: JSON и свернутые стеки для flame graph
+PROFILE_PATH = "query_profile.json"
+PROFILE_FOLDED_PATH = "query_profile.folded"
+# Через сколько инструкций VDBE вызывается обработчик прогресса
+# при профилировании и при проверке бюджета запросов
+PROFILE_VM_INTERVAL = 100
+BUDGET_VM_INTERVAL = 1000
+
+# Версии данных таблиц (растут при каждой загрузке) и кэш результатов запросов
+VERSIONS_TABLE = "table_versions"
+RESULT_CACHE_TABLE = "query_result_cache"
+
+# Сводные таблицы summary_<таблица>: счетчики, суммы и суммы квадратов
+# по ячейкам (Sex, Pclass, Embarked), поддерживаемые триггерами
+SUMMARY_TABLES = ("passengers_train", COMBINED_TABLE)
+SUMMARY_KEYS = ("Sex", "Pclass", "Embarked")
+# Имя меры -> (выражение над строкой {row}, нужные колонки источника)
+SUMMARY_COLUMNS: dict[str, tuple[str, tuple[str, ...]]] = {
+    "survived": ("{row}.Survived", ("Survived",)),
+    "fare": ("{row}.Fare", ("Fare",)),
+    "age": ("{row}.Age", ("Age",)),
+    "sibsp": ("{row}.SibSp", ("SibSp",)),
+    "parch": ("{row}.Parch", ("Parch",)),
+    "family": ("{row}.SibSp + {row}.Parch", ("SibSp", "Parch")),
+}
+
+# Таблица с размером, mtime и хешем загруженных CSV-файлов
+MANIFEST_TABLE = "load_manifest"
+
+# Статистика таблиц для сводного отчета: строки и байты на диске, NULL
+# и различные значения по колонкам; обновляется при загрузке и через ANALYZE
+TABLE_STATS_TABLE = "table_stats"
+COLUMN_STATS_TABLE = "column_stats"
+
+# PRAGMA на время массовой загрузки и безопасные значения после нее
+BULK_LOAD_PRAGMAS: dict[str, str] = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "cache_size": "-262144",  # 256 МБ
+    "temp_store": "MEMORY",
+}
+SAFE_PRAGMAS: dict[str, str] = {
+    "journal_mode": "DELETE",
+    "synchronous": "FULL",
+    "cache_size": "-2000",
+    "temp_store": "DEFAULT",
+}
+
+
+# Этапы запуска и команды командной строки, которые их выполняют
+# (без команды выполняются все этапы)
+STAGES = ("load", "query", "export", "report")
+COMMAND_STAGES: dict[str, tuple[str, ...]] = {
+    "load": ("load",),
+    "query": ("query",),
+    "export": ("query", "export"),
+    "report": ("report",),
+    "serve": ("serve",),
+}
+
+
+@dataclass
+class RunOptions:
+    """Параметры запуска скрипта"""
+
+    # Выполняемые этапы: загрузка, запросы, экспорт результатов, сводный отчет
+    # или отдельно serve - сервис запросов
+    stages: tuple[str, ...] = STAGES
+    # Выполнять только запросы, подходящие под шаблоны (ключ или часть имени)
+    query_names: list[str] = field(default_factory=list)
+    # Размер порции строк при потоковой загрузке CSV (None - файл целиком)
+    chunk_rows: int | None = None
+    # Перезагрузить все таблицы, даже если исходные файлы не менялись
+    force_reload: bool = False
+    # CSV-файлы, которые нужно считать измененными
+    invalidate: list[str] = field(default_factory=list)
+    # Пересобрать статистику таблиц, не перезагруженных в этом запуске
+    # (нужно, если данные менялись в обход загрузки)
+    analyze: bool = False
+    # "table" - all_passengers хранится копией, "view" - представление UNION ALL
+    combined_mode: str = "table"
+    # "pandas" - DataFrame.to_sql, "bulk" - executemany с PRAGMA для загрузки
+    loader: str = "pandas"
+    # Число процессов для параллельной загрузки (1 - без параллелизма)
+    workers: int = 1
+    # Читать CSV из двоичного кэша .npy (параллельная загрузка его не использует)
+    csv_cache: bool = False
+    # Манифест каталога запросов
+    catalog_path: str = CATALOG_PATH
+    # Число потоков для параллельного выполнения запросов (1 - по очереди)
+    query_workers: int = 1
+    # Кэш результатов запросов в базе и его лимиты
+    result_cache: bool = False
+    cache_max_entries: int = 256
+    cache_max_bytes: int = 64 * 2**20
+    # "sqlite" - все запросы в SQLite, "numpy" - агрегаты с ядром векторно
+    backend: str = "sqlite"
+    # Агрегаты по одной таблице считать одним общим проходом
+    shared_scan: bool = False
+    # Поддерживать сводные таблицы триггерами и отвечать по ним на агрегаты
+    summary_tables: bool = False
+    # Снять базовые планы запросов или сверить с ними текущие (без выполнения)
+    capture_plans: bool = False
+    check_plans: bool = False
+    plans_path: str = PLAN_BASELINE_PATH
+    # Профилировать запросы: шаги VDBE, трассировка, объем результатов
+    profile: bool = False
+    # Бюджет каждого запроса: время и шаги VDBE (None - без лимита)
+    query_timeout_s: float | None = None
+    query_max_vm_steps: int | None = None
+    # Размер порции fetchmany при потоковом экспорте результатов
+    export_batch_rows: int = 10_000
+    # Форматы экспорта для всех запросов вместо указанных в каталоге
+    export_formats: list[str] | None = None
+    # Экспорт частями: строк и/или мегабайт в части (None - одним файлом)
+    shard_rows: int | None = None
+    shard_mb: float | None = None
+    # Потоки записи частей
+    export_workers: int = 4
+    # Сервис запросов: адрес TCP или путь Unix-сокета и число соединений
+    serve_host: str = SERVICE_HOST
+    serve_port: int = SERVICE_PORT
+    serve_socket: str | None = None
+    serve_pool: int = 4
+
+
+def _quote(name: str) -> str:
+    """Экранирует имя таблицы или колонки для SQL"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _frame_rows(df: pd.DataFrame) -> list[tuple]:
+    """Преобразует DataFrame в кортежи Python-значений (NaN -> NULL)"""
+    columns = []
+    for _, series in df.items():
+        # tolist() отдает встроенные int/float/str, которые sqlite3 принимает напрямую
+        values = series.tolist()
+        if series.hasnans:
+            values = [
+                None if missing else value
+                for value, missing in zip(values, series.isna().tolist())
+            ]
+        columns.append(values)
+    return list(zip(*columns))
+
+
+def _insert_frame(conn: sqlite3.Connection, table: str, df: pd.DataFrame) -> None:
+    """Добавляет строки DataFrame в существующую таблицу"""
+    columns = ", ".join(_quote(column) for column in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+    conn.executemany(
+        f"INSERT INTO {_quote(table)} ({columns}) VALUES ({placeholders})",
+        _frame_rows(df),
+    )
+
+
+def _recreate_table(conn: sqlite3.Connection, table: str) -> None:
+    """Удаляет таблицу и создает ее заново по объявленной схеме"""
+    conn.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+    conn.execute(TABLE_SCHEMAS[table])
+
+
+def create_indexes(conn: sqlite3.Connection, table: str) -> None:
+    """Создает индексы таблицы; вызывается после заполнения, так быстрее"""
+    for name, expression in TABLE_INDEXES.get(table, []):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_{name} "
+            f"ON {_quote(table)} ({expression})"
+        )
+    conn.commit()
+
+
+def _csv_cache_dir(path: str) -> str:
+    """Каталог двоичного кэша рядом с CSV-файлом"""
+    return os.path.join(
+        os.path.dirname(path) or ".", CSV_CACHE_DIR, os.path.basename(path)
+    )
+
+
+def write_csv_cache(
+    path: str, df: pd.DataFrame, stat: os.stat_result, digest: str
+) -> None:
+    """Сохраняет разобранный CSV поколоночно в .npy-файлы.
+
+    Числовые колонки сохраняются как есть (NULL -> NaN), текстовые - как
+    массивы строк фиксированной ширины с отдельной маской NULL, чтобы все
+    файлы можно было открыть через mmap без pickle.
+    """
+    target = _csv_cache_dir(path)
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    columns = []
+    for i, (name, series) in enumerate(df.items()):
+        column = {"name": name, "file": f"{i:03d}.npy"}
+        if series.dtype.kind in "biuf":
+            column["kind"] = "numeric"
+            np.save(os.path.join(staging, column["file"]), series.to_numpy())
+        else:
+            column["kind"] = "text"
+            column["mask"] = f"{i:03d}.mask.npy"
+            mask = series.isna().to_numpy()
+            values = series.where(~mask, "").to_numpy(dtype=str)
+            np.save(os.path.join(staging, column["file"]), values)
+            np.save(os.path.join(staging, column["mask"]), mask)
+        columns.append(column)
+
+    meta = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": digest,
+        "rows": len(df),
+        "columns": columns,
+    }
+    with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+
+
+def _open_csv_cache(path: str) -> tuple[int, list[tuple]] | None:
+    """Открывает кэш через mmap; None, если кэша нет или CSV изменился"""
+    target = _csv_cache_dir(path)
+    try:
+        with open(os.path.join(target, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    stat = os.stat(path)
+    if (stat.st_size, stat.st_mtime_ns) != (meta["size"], meta["mtime_ns"]):
+        if stat.st_size != meta["size"] or file_sha256(path) != meta["sha256"]:
+            return None
+        # Содержимое то же (файл тронут или скопирован): запоминаем новый
+        # mtime, чтобы следующие запуски снова обходились без хэширования
+        meta["mtime_ns"] = stat.st_mtime_ns
+        meta_path = os.path.join(target, "meta.json")
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    columns = []
+    for column in meta["columns"]:
+        values = np.load(os.path.join(target, column["file"]), mmap_mode="r")
+        mask = None
+        if column["kind"] == "text":
+            mask = np.load(os.path.join(target, column["mask"]), mmap_mode="r")
+        columns.append((column["name"], values, mask))
+    return meta["rows"], columns
+
+
+def _cache_frame(columns: list[tuple], start: int, stop: int) -> pd.DataFrame:
+    """Собирает DataFrame из среза отображенных в память колонок"""
+    data = {}
+    for name, values, mask in columns:
+        if mask is None:
+            data[name] = values[start:stop]
+        else:
+            text = values[start:stop].astype(object)
+            text[mask[start:stop]] = None
+            data[name] = text
+    return pd.DataFrame(data, copy=False)
+
+
+def read_source(path: str, use_cache: bool = False) -> pd.DataFrame:
+    """Читает CSV целиком; с use_cache - из двоичного кэша, если он актуален"""
+    if not use_cache:
+        return pd.read_csv(path)
+
+    cached = _open_csv_cache(path)
+    if cached is not None:
+        rows, columns = cached
+        return _cache_frame(columns, 0, rows)
+
+    # Отпечаток снимается до разбора, чтобы не закэшировать устаревшие данные
+    stat = os.stat(path)
+    digest = file_sha256(path)
+    df = pd.read_csv(path)
+    write_csv_cache(path, df, stat, digest)
+    return df
+
+
+def iter_source_chunks(
+    path: str, chunk_rows: int, use_cache: bool = False
+) -> Iterator[pd.DataFrame]:
+    """Отдает CSV порциями; с use_cache - срезами кэша без разбора текста.
+
+    Потоковый режим кэш не заполняет: для этого нужен файл целиком.
+    """
+    cached = _open_csv_cache(path) if use_cache else None
+    if cached is None:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+        return
+
+    rows, columns = cached
+    for start in range(0, rows, chunk_rows):
+        yield _cache_frame(columns, start, min(start + chunk_rows, rows))
+
+
+def load_data_whole(
+    conn: sqlite3.Connection, tables: list[str], use_cache: bool = False
+) -> dict[str, int]:
+    """Загружает указанные таблицы, читая каждый CSV-файл целиком через pandas"""
+    counts: dict[str, int] = {}
+    frames: dict[str, pd.DataFrame] = {}
+
+    for table, path in DATA_TABLES.items():
+        combined_part = COMBINED_TABLE in tables and table in COMBINED_SOURCES
+        if table not in tables and not combined_part:
+            continue
+
+        df = read_source(path, use_cache)
+        if table in tables:
+            _recreate_table(conn, table)
+            df.to_sql(table, conn, if_exists="append", index=False)
+            counts[table] = len(df)
+        if combined_part:
+            frames[table] = df
+
+    if COMBINED_TABLE in tables:
+        # Объединенная таблица - третья полная копия данных в памяти
+        combined_df = pd.concat(
+            [frames[table] for table in COMBINED_SOURCES], ignore_index=True
+        )
+        _recreate_table(conn, COMBINED_TABLE)
+        combined_df.to_sql(COMBINED_TABLE, conn, if_exists="append", index=False)
+        counts[COMBINED_TABLE] = len(combined_df)
+    return counts
+
+
+def _bulk_replace_table(
+    conn: sqlite3.Connection, table: str, parts: list[tuple[list[str], list[tuple]]]
+) -> int:
+    """Пересоздает таблицу и вставляет готовые кортежи в одной транзакции"""
+    total = 0
+    conn.execute("BEGIN")
+    try:
+        _recreate_table(conn, table)
+        for columns, rows in parts:
+            names = ", ".join(_quote(column) for column in columns)
+            placeholders = ", ".join("?" for _ in columns)
+            conn.executemany(
+                f"INSERT INTO {_quote(table)} ({names}) VALUES ({placeholders})", rows
+            )
+            total += len(rows)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return total
+
+
+def load_data_bulk(
+    conn: sqlite3.Connection, tables: list[str], use_cache: bool = False
+) -> dict[str, int]:
+    """Массовая загрузка в обход DataFrame.to_sql.
+
+    Каждый CSV один раз преобразуется в кортежи Python-значений, которые
+    вставляются через executemany, по одной транзакции на таблицу.
+    Для all_passengers повторно используются уже готовые кортежи
+    тренировочной и тестовой выборок вместо pd.concat.
+    """
+    counts: dict[str, int] = {}
+    combined_parts: list[tuple[list[str], list[tuple]]] = []
+
+    for table, path in DATA_TABLES.items():
+        combined_part = COMBINED_TABLE in tables and table in COMBINED_SOURCES
+        if table not in tables and not combined_part:
+            continue
+
+        df = read_source(path, use_cache)
+        part = (list(df.columns), _frame_rows(df))
+        if table in tables:
+            counts[table] = _bulk_replace_table(conn, table, [part])
+        if combined_part:
+            combined_parts.append(part)
+        del df
+
+    if COMBINED_TABLE in tables:
+        counts[COMBINED_TABLE] = _bulk_replace_table(
+            conn, COMBINED_TABLE, combined_parts
+        )
+    return counts
+
+
+@contextmanager
+def bulk_load_pragmas(conn: sqlite3.Connection) -> Iterator[None]:
+    """Включает PRAGMA для быстрой загрузки и затем возвращает безопасные значения.
+
+    Без журнала и fsync база не защищена от сбоя во время загрузки,
+    поэтому записи манифеста для загружаемых файлов удаляются заранее:
+    прерванная загрузка будет повторена при следующем запуске.
+    """
+    conn.commit()
+    for name, value in BULK_LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    try:
+        yield
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        for name, value in SAFE_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+
+def _stream_csv(
+    conn: sqlite3.Connection,
+    path: str,
+    tables: list[str],
+    chunk_rows: int,
+    use_cache: bool = False,
+) -> int:
+    """Читает CSV порциями и дописывает каждую порцию во все указанные таблицы"""
+    total = 0
+    for chunk in iter_source_chunks(path, chunk_rows, use_cache):
+        for table in tables:
+            _insert_frame(conn, table, chunk)
+        total += len(chunk)
+    return total
+
+
+def load_data_chunked(
+    conn: sqlite3.Connection,
+    tables: list[str],
+    chunk_rows: int,
+    use_cache: bool = False,
+) -> dict[str, int]:
+    """Потоковая загрузка: CSV читаются порциями по chunk_rows строк.
+
+    Указанные таблицы пересоздаются в одной транзакции, поэтому при ошибке
+    база остается в прежнем состоянии. В памяти одновременно находится
+    не больше одной порции данных.
+    """
+    counts: dict[str, int] = {}
+    conn.execute("BEGIN")
+    try:
+        for table in tables:
+            _recreate_table(conn, table)
+
+        for table, path in DATA_TABLES.items():
+            targets = [table] if table in tables else []
+            if COMBINED_TABLE in tables and table in COMBINED_SOURCES:
+                targets.append(COMBINED_TABLE)
+            if not targets:
+                continue
+
+            count = _stream_csv(conn, path, targets, chunk_rows, use_cache)
+            for target in targets:
+                counts[target] = counts.get(target, 0) + count
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return counts
+
+
+class _ByteRange:
+    """Файловый объект, отдающий только байты [start, end) исходного файла"""
+
+    def __init__(self, path: str, start: int, end: int) -> None:
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def split_csv(path: str, parts: int) -> tuple[list[str], list[tuple[int, int]]]:
+    """Делит CSV на диапазоны байтов, выровненные по началу строк.
+
+    Возвращает имена колонок из заголовка и список диапазонов данных.
+    Предполагается, что значения в кавычках не содержат переводов строк
+    (для датасета Titanic это так).
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        data_start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+
+        boundaries = [data_start]
+        for k in range(1, parts):
+            f.seek(data_start + (size - data_start) * k // parts)
+            f.readline()
+            boundary = min(f.tell(), size)
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+        if size > boundaries[-1]:
+            boundaries.append(size)
+
+    columns = pd.read_csv(io.BytesIO(header), nrows=0).columns.tolist()
+    return columns, list(zip(boundaries, boundaries[1:]))
+
+
+def _load_csv_part(
+    path: str,
+    columns: list[str],
+    start: int,
+    end: int,
+    table: str,
+    stage_path: str,
+    chunk_rows: int,
+) -> int:
+    """Рабочий процесс: разбирает диапазон CSV и пишет его в отдельную базу"""
+    stage = sqlite3.connect(stage_path)
+    for name, value in BULK_LOAD_PRAGMAS.items():
+        stage.execute(f"PRAGMA {name} = {value}")
+    stage.execute(TABLE_SCHEMAS[table])
+
+    total = 0
+    reader = _ByteRange(path, start, end)
+    try:
+        for chunk in pd.read_csv(
+            reader, header=None, names=columns, chunksize=chunk_rows
+        ):
+            _insert_frame(stage, table, chunk)
+            total += len(chunk)
+        stage.commit()
+    finally:
+        reader.close()
+        stage.close()
+    return total
+
+
+def _merge_stage(
+    conn: sqlite3.Connection, stage_path: str, source: str, targets: list[str]
+) -> None:
+    """Переносит строки промежуточной базы в целевые таблицы основной"""
+    conn.execute("ATTACH DATABASE ? AS stage", (stage_path,))
+    try:
+        columns = ", ".join(
+            _quote(row[1])
+            for row in conn.execute(f"PRAGMA stage.table_info({_quote(source)})")
+        )
+        conn.execute("BEGIN")
+        for target in targets:
+            conn.execute(
+                f"INSERT INTO main.{_quote(target)} ({columns}) "
+                f"SELECT {columns} FROM stage.{_quote(source)}"
+            )
+        conn.commit()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute("DETACH DATABASE stage")
+
+
+def load_data_parallel(
+    conn: sqlite3.Connection, tables: list[str], workers: int, chunk_rows: int
+) -> dict[str, int]:
+    """Параллельная загрузка в нескольких процессах.
+
+    Каждый CSV (а крупный файл - каждая его часть) разбирается отдельным
+    процессом в собственную промежуточную базу. Затем промежуточные базы
+    по очереди подключаются через ATTACH и сливаются в основную.
+    """
+    db_dir = os.path.dirname(os.path.abspath(DATABASE_PATH))
+    stage_dir = tempfile.mkdtemp(prefix=".staging-", dir=db_dir)
+    counts: dict[str, int] = {}
+    try:
+        jobs: list[tuple[str, str, list[str]]] = []
+        for table, path in DATA_TABLES.items():
+            targets = [table] if table in tables else []
+            if COMBINED_TABLE in tables and table in COMBINED_SOURCES:
+                targets.append(COMBINED_TABLE)
+            if targets:
+                jobs.append((table, path, targets))
+
+        # Пул процессов (и multiprocessing) импортируется только здесь
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for table, path, targets in jobs:
+                parts = max(
+                    1, min(workers, os.path.getsize(path) // PARALLEL_PART_BYTES)
+                )
+                columns, ranges = split_csv(path, parts)
+                for i, (start, end) in enumerate(ranges):
+                    stage_path = os.path.join(stage_dir, f"{table}_{i:04d}.db")
+                    future = pool.submit(
+                        _load_csv_part,
+                        path,
+                        columns,
+                        start,
+                        end,
+                        table,
+                        stage_path,
+                        chunk_rows,
+                    )
+                    futures.append((table, targets, stage_path, future))
+
+            for table in tables:
+                _recreate_table(conn, table)
+            conn.commit()
+
+            # Части сливаются в порядке файлов, пока остальные еще разбираются
+            for table, targets, stage_path, future in futures:
+                rows = future.result()
+                _merge_stage(conn, stage_path, table, targets)
+                for target in targets:
+                    counts[target] = counts.get(target, 0) + rows
+                os.remove(stage_path)
+    finally:
+        shutil.rmtree(stage_dir, ignore_errors=True)
+
+    for table in tables:
+        counts.setdefault(table, 0)
+    return counts
+
+
+def _ensure_manifest(conn: sqlite3.Connection) -> None:
+    """Создает таблицу манифеста загрузки"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            source TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            loaded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+
+
+def file_sha256(path: str) -> str:
+    """Считает SHA-256 содержимого файла, читая его блоками"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_fingerprint(path: str) -> tuple[int, int, str]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, file_sha256(path)
+
+
+def _table_sources(table: str) -> list[str]:
+    """CSV-файлы, от которых зависит содержимое таблицы"""
+    if table == COMBINED_TABLE:
+        return [DATA_TABLES[source] for source in COMBINED_SOURCES]
+    return [DATA_TABLES[table]]
+
+
+def invalidate_sources(conn: sqlite3.Connection, paths: list[str]) -> int:
+    """Удаляет файлы из манифеста, чтобы зависящие от них таблицы перезагрузились"""
+    _ensure_manifest(conn)
+    removed = 0
+    for path in paths:
+        cursor = conn.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE source = ?", (path,))
+        removed += cursor.rowcount
+    conn.commit()
+    return removed
+
+
+def _changed_sources(conn: sqlite3.Connection) -> set[str]:
+    """Возвращает CSV-файлы, изменившиеся с момента последней загрузки.
+
+    Совпадение размера и mtime считается признаком неизменности файла.
+    Если mtime сдвинулся, а размер прежний, сверяется хеш содержимого.
+    """
+    changed: set[str] = set()
+    for path in DATA_TABLES.values():
+        row = conn.execute(
+            f"SELECT size, mtime_ns, sha256 FROM {MANIFEST_TABLE} WHERE source = ?",
+            (path,),
+        ).fetchone()
+        if row is None:
+            changed.add(path)
+            continue
+
+        size, mtime_ns, digest = row
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+            continue
+        if stat.st_size == size and file_sha256(path) == digest:
+            # Файл "тронули", но содержимое прежнее - обновляем только mtime
+            conn.execute(
+                f"UPDATE {MANIFEST_TABLE} SET mtime_ns = ? WHERE source = ?",
+                (stat.st_mtime_ns, path),
+            )
+            continue
+        changed.add(path)
+    return changed
+
+
+def _object_type(conn: sqlite3.Connection, name: str) -> str | None:
+    """Возвращает тип объекта схемы ('table', 'view', ...) или None"""
+    row = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = ?", (name,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def stored_combined_mode(conn: sqlite3.Connection) -> str:
+    """Режим all_passengers в базе: view для представления, иначе table"""
+    return "view" if _object_type(conn, COMBINED_TABLE) == "view" else "table"
+
+
+def _tables_to_load(conn: sqlite3.Connection, options: RunOptions) -> list[str]:
+    """Определяет таблицы, которые нужно (пере)загрузить"""
+    changed = _changed_sources(conn)
+    candidates = list(DATA_TABLES)
+    if options.combined_mode == "table":
+        candidates.append(COMBINED_TABLE)
+    return [
+        table
+        for table in candidates
+        if options.force_reload
+        or _object_type(conn, table) != "table"
+        or any(source in changed for source in _table_sources(table))
+    ]
+
+
+def create_combined_view(conn: sqlite3.Connection) -> None:
+    """Создает all_passengers как представление UNION ALL над исходными таблицами.
+
+    Колонки, которых нет в одной из таблиц (Survived в тестовой выборке),
+    заполняются NULL - так же, как это делает pd.concat.
+    """
+    source_columns: dict[str, list[str]] = {}
+    columns: list[str] = []
+    for source in COMBINED_SOURCES:
+        names = [row[1] for row in conn.execute(f"PRAGMA table_info({_quote(source)})")]
+        source_columns[source] = names
+        columns.extend(name for name in names if name not in columns)
+
+    selects = []
+    for source in COMBINED_SOURCES:
+        items = [
+            (
+                _quote(name)
+                if name in source_columns[source]
+                else f"NULL AS {_quote(name)}"
+            )
+            for name in columns
+        ]
+        selects.append(f"SELECT {', '.join(items)} FROM {_quote(source)}")
+
+    if _object_type(conn, COMBINED_TABLE) == "table":
+        conn.execute(f"DROP TABLE {_quote(COMBINED_TABLE)}")
+    conn.execute(f"DROP VIEW IF EXISTS {_quote(COMBINED_TABLE)}")
+    conn.execute(
+        f"CREATE VIEW {_quote(COMBINED_TABLE)} AS\n" + "\nUNION ALL\n".join(selects)
+    )
+    conn.commit()
+
+
+def _summary_table(table: str) -> str:
+    return f"summary_{table}"
+
+
+def _summary_sources(conn: sqlite3.Connection, table: str) -> list[str]:
+    """Таблицы, изменения которых меняют сводку (для представления - базовые)"""
+    if _object_type(conn, table) == "view":
+        return referenced_tables(conn, f"SELECT * FROM {_quote(table)}")
+    return [table]
+
+
+def _summary_triggers(conn: sqlite3.Connection, table: str) -> dict[str, str]:
+    """Имена и тексты триггеров, поддерживающих сводку таблицы"""
+    summary = _summary_table(table)
+    keys = " AND ".join(f"{key} IS {{row}}.{key}" for key in SUMMARY_KEYS)
+    triggers = {}
+    for source in _summary_sources(conn, table):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({source})")}
+
+        def changes(row: str, sign: str) -> str:
+            # Колонок, которых нет в источнике (Survived в тестовой), нет и в сводке
+            values = {
+                name: (
+                    expression.format(row=row)
+                    if all(column in columns for column in SUMMARY_COLUMNS[name][1])
+                    else "NULL"
+                )
+                for name, (expression, _) in SUMMARY_COLUMNS.items()
+            }
+            assignments = [f"rows = rows {sign} 1"]
+            for name, value in values.items():
+                assignments += [
+                    f"{name}_n = {name}_n {sign} ({value} IS NOT NULL)",
+                    f"{name}_sum = {name}_sum {sign} IFNULL({value}, 0)",
+                    f"{name}_sq = {name}_sq {sign} IFNULL(({value}) * ({value}), 0)",
+                ]
+            where = keys.format(row=row)
+            return f"UPDATE {summary} SET {', '.join(assignments)} WHERE {where};"
+
+        key_columns = ", ".join(SUMMARY_KEYS)
+        add = f"""
+            INSERT INTO {summary} ({key_columns})
+            SELECT {', '.join(f'NEW.{key}' for key in SUMMARY_KEYS)}
+            WHERE NOT EXISTS (SELECT 1 FROM {summary} WHERE {keys.format(row='NEW')});
+            {changes('NEW', '+')}"""
+        remove = f"""
+            {changes('OLD', '-')}
+            DELETE FROM {summary} WHERE rows = 0 AND {keys.format(row='OLD')};"""
+        bodies = {"insert": add, "delete": remove, "update": remove + add}
+        for event, body in bodies.items():
+            name = f"trg_{summary}_{source}_{event}"
+            triggers[name] = (
+                f"CREATE TRIGGER {name} AFTER {event.upper()} ON {source}\n"
+                f"BEGIN{body}\nEND;"
+            )
+    return triggers
+
+
+def build_summary(conn: sqlite3.Connection, table: str) -> None:
+    """Пересчитывает сводную таблицу одним проходом и ставит триггеры.
+
+    На время пересчета триггеры снимаются: массовая загрузка идет без них,
+    а сводка строится одним GROUP BY после нее.
+    """
+    summary = _summary_table(table)
+    prefix = f"trg_{summary}_"
+    for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+    ).fetchall():
+        if name.startswith(prefix):
+            conn.execute(f"DROP TRIGGER {name}")
+    conn.execute(f"DROP TABLE IF EXISTS {summary}")
+
+    definitions = [
+        "Sex TEXT",
+        "Pclass INTEGER",
+        "Embarked TEXT",
+        "rows INTEGER NOT NULL DEFAULT 0",
+    ]
+    measures = ["COUNT(*)"]
+    for name, (expression, _) in SUMMARY_COLUMNS.items():
+        kind = "REAL" if name in ("fare", "age") else "INTEGER"
+        value = expression.format(row=_quote(table))
+        definitions += [
+            f"{name}_n INTEGER NOT NULL DEFAULT 0",
+            f"{name}_sum {kind} NOT NULL DEFAULT 0",
+            f"{name}_sq {kind} NOT NULL DEFAULT 0",
+        ]
+        measures += [
+            f"COUNT({value})",
+            f"IFNULL(SUM({value}), 0)",
+            f"IFNULL(SUM(({value}) * ({value})), 0)",
+        ]
+    key_columns = ", ".join(SUMMARY_KEYS)
+    conn.execute(
+        f"CREATE TABLE {summary} (\n    " + ",\n    ".join(definitions) + "\n)"
+    )
+    conn.execute(f"CREATE INDEX idx_{summary}_keys ON {summary} ({key_columns})")
+    conn.execute(f"""
+        INSERT INTO {summary}
+        SELECT {key_columns}, {', '.join(measures)}
+        FROM {_quote(table)}
+        GROUP BY {key_columns}
+        """)
+
+    _ensure_table_versions(conn)
+    for sql in _summary_triggers(conn, table).values():
+        conn.execute(sql)
+    conn.commit()
+
+
+def refresh_summaries(conn: sqlite3.Connection, reloaded: list[str]) -> list[str]:
+    """Пересчитывает сводки, источники которых перезагружены или без триггеров.
+
+    Возвращает таблицы, сводки которых были пересчитаны.
+    """
+    existing = {
+        name
+        for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"
+        )
+    }
+    rebuilt = []
+    for table in SUMMARY_TABLES:
+        if _object_type(conn, table) is None:
+            continue
+        stale = (
+            _summary_table(table) not in existing
+            or table in reloaded
+            or any(source in reloaded for source in _summary_sources(conn, table))
+            or any(name not in existing for name in _summary_triggers(conn, table))
+        )
+        if stale:
+            build_summary(conn, table)
+            rebuilt.append(table)
+    return rebuilt
+
+
+def _ensure_table_stats(conn: sqlite3.Connection) -> None:
+    """Создает таблицы статистики"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_STATS_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL,
+            bytes INTEGER,
+            analyzed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {COLUMN_STATS_TABLE} (
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            nulls INTEGER NOT NULL,
+            distinct_values INTEGER NOT NULL,
+            PRIMARY KEY (table_name, column_name)
+        );
+        """)
+
+
+def _table_bytes(conn: sqlite3.Connection, table: str) -> int | None:
+    """Байты страниц таблицы и ее индексов (None, если SQLite собран без dbstat)"""
+    try:
+        row = conn.execute(
+            """
+            SELECT SUM(pgsize) FROM dbstat
+            WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = ?)
+            """,
+            (table,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] or 0
+
+
+def _stat1_rows(conn: sqlite3.Connection, table: str) -> int:
+    """Число строк таблицы из sqlite_stat1; пустую таблицу ANALYZE не записывает"""
+    rows = 0
+    for (stat,) in conn.execute(
+        "SELECT stat FROM sqlite_stat1 WHERE tbl = ?", (table,)
+    ):
+        rows = max(rows, int(stat.split()[0]))
+    return rows
+
+
+def refresh_table_stats(conn: sqlite3.Connection, tables: list[str]) -> None:
+    """Обновляет число строк и размер таблиц через ANALYZE и sqlite_stat1.
+
+    ANALYZE проходит по индексам (или по таблице без индексов), не разбирая
+    строки, и заодно обновляет статистику для планировщика. Статистика
+    колонок при этом не меняется.
+    """
+    _ensure_table_stats(conn)
+    for table in tables:
+        conn.execute(f"ANALYZE {_quote(table)}")
+        conn.execute(
+            f"""
+            INSERT OR REPLACE INTO {TABLE_STATS_TABLE} (table_name, rows, bytes)
+            VALUES (?, ?, ?)
+            """,
+            (table, _stat1_rows(conn, table), _table_bytes(conn, table)),
+        )
+    conn.commit()
+
+
+def collect_table_stats(conn: sqlite3.Connection, tables: list[str]) -> None:
+    """Собирает полную статистику таблиц после загрузки.
+
+    NULL и различные значения всех колонок считаются за один проход
+    по таблице, строки и размер - через refresh_table_stats.
+    """
+    _ensure_table_stats(conn)
+    for table in tables:
+        columns = [
+            row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table)})")
+        ]
+        items = ["COUNT(*)"]
+        for column in columns:
+            items += [f"COUNT({_quote(column)})", f"COUNT(DISTINCT {_quote(column)})"]
+        counts = conn.execute(
+            f"SELECT {', '.join(items)} FROM {_quote(table)}"
+        ).fetchone()
+        conn.execute(f"DELETE FROM {COLUMN_STATS_TABLE} WHERE table_name = ?", (table,))
+        conn.executemany(
+            f"""
+            INSERT INTO {COLUMN_STATS_TABLE}
+                (table_name, column_name, nulls, distinct_values)
+            VALUES (?, ?, ?, ?)
+            """,
+            [
+                (table, column, counts[0] - counts[1 + 2 * i], counts[2 + 2 * i])
+                for i, column in enumerate(columns)
+            ],
+        )
+    refresh_table_stats(conn, tables)
+
+
+def read_table_stats(conn: sqlite3.Connection) -> dict[str, dict]:
+    """Сохраненная статистика: {таблица: {rows, bytes, analyzed_at, columns}}"""
+    _ensure_table_stats(conn)
+    stats = {
+        table: {"rows": rows, "bytes": size, "analyzed_at": analyzed_at, "columns": {}}
+        for table, rows, size, analyzed_at in conn.execute(
+            f"SELECT table_name, rows, bytes, analyzed_at FROM {TABLE_STATS_TABLE}"
+        )
+    }
+    columns = conn.execute(f"""
+        SELECT table_name, column_name, nulls, distinct_values
+        FROM {COLUMN_STATS_TABLE} ORDER BY rowid
+        """)
+    for table, column, nulls, distinct in columns:
+        if table in stats:
+            stats[table]["columns"][column] = {"nulls": nulls, "distinct": distinct}
+    return stats
+
+
+def report_table_stats(conn: sqlite3.Connection) -> dict[str, dict]:
+    """Статистика таблиц данных для сводного отчета.
+
+    Таблицы данных берутся из статистики, собранной при загрузке, - без
+    прохода по строкам; ANALYZE нужен только таблицам, у которых ее еще нет.
+    Служебные таблицы (манифест, версии, кэши, сводки) в отчет не входят.
+    Строки представления - сумма по его таблицам (all_passengers - UNION ALL
+    исходных).
+    """
+    objects = [
+        (name, kind)
+        for name in (*DATA_TABLES, COMBINED_TABLE)
+        if (kind := _object_type(conn, name)) in ("table", "view")
+    ]
+    stats = read_table_stats(conn)
+    missing = [name for name, kind in objects if kind == "table" and name not in stats]
+    if missing:
+        refresh_table_stats(conn, missing)
+        stats = read_table_stats(conn)
+    report = {}
+    for name, kind in objects:
+        if kind == "view":
+            tables = referenced_tables(conn, f"SELECT * FROM {_quote(name)}")
+            rows = sum(stats[table]["rows"] for table in tables if table in stats)
+            report[name] = {"type": kind, "rows": rows, "bytes": None}
+        else:
+            report[name] = {"type": kind, **stats[name]}
+    return report
+
+
+def load_data(conn: sqlite3.Connection, options: RunOptions) -> dict[str, int]:
+    """Загружает датасет в базу и возвращает количество строк по таблицам.
+
+    Таблицы, исходные файлы которых не изменились с прошлой загрузки,
+    пропускаются и в результат не попадают. В режиме combined_mode="view"
+    all_passengers не загружается, а пересоздается как представление.
+    """
+    _ensure_manifest(conn)
+    if options.invalidate:
+        invalidate_sources(conn, options.invalidate)
+
+    tables = _tables_to_load(conn, options)
+    if COMBINED_TABLE in tables and _object_type(conn, COMBINED_TABLE) == "view":
+        conn.execute(f"DROP VIEW {_quote(COMBINED_TABLE)}")
+    conn.commit()
+
+    counts: dict[str, int] = {}
+    if tables:
+        # Отпечатки снимаются до чтения: если файл изменится во время загрузки,
+        # следующий запуск увидит расхождение и загрузит его снова
+        sources = sorted(
+            {source for table in tables for source in _table_sources(table)}
+        )
+        fingerprints = {path: _file_fingerprint(path) for path in sources}
+        conn.executemany(
+            f"DELETE FROM {MANIFEST_TABLE} WHERE source = ?",
+            [(path,) for path in sources],
+        )
+        conn.commit()
+
+        pragmas = bulk_load_pragmas(conn) if options.loader == "bulk" else nullcontext()
+        with pragmas:
+            if options.workers > 1:
+                counts = load_data_parallel(
+                    conn, tables, options.workers, options.chunk_rows or 100_000
+                )
+            elif options.chunk_rows:
+                counts = load_data_chunked(
+                    conn, tables, options.chunk_rows, options.csv_cache
+                )
+            elif options.loader == "bulk":
+                counts = load_data_bulk(conn, tables, options.csv_cache)
+            else:
+                counts = load_data_whole(conn, tables, options.csv_cache)
+
+        for table in counts:
+            create_indexes(conn, table)
+        bump_table_versions(conn, list(counts))
+        collect_table_stats(conn, list(counts))
+
+        conn.executemany(
+            f"""
+            INSERT OR REPLACE INTO {MANIFEST_TABLE} (source, size, mtime_ns, sha256)
+            VALUES (?, ?, ?, ?)
+            """,
+            [(path, *fingerprint) for path, fingerprint in fingerprints.items()],
+        )
+        conn.commit()
+
+    if options.analyze:
+        collect_table_stats(
+            conn,
+            [
+                table
+                for table in (*DATA_TABLES, COMBINED_TABLE)
+                if table not in counts and _object_type(conn, table) == "table"
+            ],
+        )
+    if options.combined_mode == "view":
+        create_combined_view(conn)
+    install_version_triggers(conn)
+    if options.summary_tables:
+        refresh_summaries(conn, list(counts))
+    return counts
+
+
+@dataclass
+class CatalogQuery:
+    """Запрос из каталога: текст SQL, параметры по умолчанию и форматы экспорта"""
+
+    key: str
+    name: str
+    sql: str
+    params: dict[str, object] = field(default_factory=dict)
+    outputs: list[str] = field(default_factory=lambda: ["csv", "json"])
+    # Векторизованная реализация для бэкенда numpy (None - только SQL)
+    kernel: str | None = None
+    # Бюджет запроса, переопределяющий бюджет запуска
+    budget: "QueryBudget | None" = None
+
+
+@dataclass
+class QueryBudget:
+    """Лимиты на выполнение одного запроса (None - без лимита)"""
+
+    timeout_s: float | None = None
+    max_vm_steps: int | None = None
+
+    def merged(self, override: "QueryBudget | None") -> "QueryBudget":
+        if override is None:
+            return self
+        return QueryBudget(
+            override.timeout_s if override.timeout_s is not None else self.timeout_s,
+            (
+                override.max_vm_steps
+                if override.max_vm_steps is not None
+                else self.max_vm_steps
+            ),
+        )
+
+
+@dataclass
+class ShardSpec:
+    """Экспорт частями: целевой размер части в строках и/или байтах"""
+
+    rows: int | None = None
+    # Байты закодированного текста до сжатия; часть закрывается на границе порции
+    bytes: int | None = None
+    # Потоки, сжимающие и записывающие готовые части
+    workers: int = 4
+
+
+@dataclass
+class StreamExport:
+    """Параметры потокового экспорта при выполнении запросов"""
+
+    # Размер порции fetchmany
+    batch_rows: int = 10_000
+    # Сколько первых строк оставить в результате (предпросмотр, кэш)
+    keep_rows: int = 3
+    # Дайджесты прошлых запусков (load_export_digests)
+    digests: dict[str, tuple[str, int]] | None = None
+    # Экспорт текстовых форматов частями
+    shard: ShardSpec | None = None
+
+
+class QueryBudgetExceeded(Exception):
+    """Запрос прерван обработчиком прогресса из-за превышения бюджета"""
+
+    def __init__(
+        self, query: CatalogQuery, reason: str, elapsed_s: float, vm_steps: int
+    ) -> None:
+        self.query = query
+        self.reason = reason
+        self.elapsed_s = elapsed_s
+        self.vm_steps = vm_steps
+        limit = "времени" if reason == "timeout" else "шагов VDBE"
+        super().__init__(
+            f"превышен бюджет {limit}: {elapsed_s:.3f} с, ~{vm_steps} шагов VDBE"
+        )
+
+
+@dataclass
+class QueryResult:
+    """Результат запроса вместе с замерами фаз выполнения"""
+
+    query: CatalogQuery
+    columns: list[str]
+    rows: list[tuple]
+    timings: dict[str, float]
+    # Фактические параметры, с которыми выполнялся запрос
+    params: dict[str, object] = field(default_factory=dict)
+    # True, если результат взят из кэша результатов
+    cache_hit: bool = False
+    # Бэкенд, вычисливший результат: "sqlite" или "numpy"
+    backend: str = "sqlite"
+    # Таблица общего прохода, из которого свернут результат
+    shared_scan: str | None = None
+    # Сводная таблица, по которой получен результат
+    summary_table: str | None = None
+    # Профиль выполнения (QueryRunner с profile=True)
+    profile: dict | None = None
+    # Всего строк; при потоковом экспорте в rows остаются только первые
+    row_count: int | None = None
+    # Объем значений всех строк, посчитанный по порциям потоковой выборки
+    value_bytes: int | None = None
+    # Файлы, в которые результат уже экспортирован
+    outputs: list[str] = field(default_factory=list)
+    # Замеры экспорта по форматам (ResultExport.stats): {"csv.gz": {"bytes": ...}}
+    export_stats: dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def total_rows(self) -> int:
+        return len(self.rows) if self.row_count is None else self.row_count
+
+    @property
+    def complete(self) -> bool:
+        """В rows все строки результата"""
+        return self.total_rows == len(self.rows)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame.from_records(
+            self.rows, columns=self.columns, coerce_float=True
+        )
+
+
+def load_catalog(
+    path: str = CATALOG_PATH, outputs: list[str] | None = None
+) -> list[CatalogQuery]:
+    """Читает манифест каталога и тексты запросов из .sql-файлов рядом с ним.
+
+    Форматы экспорта берутся из поля outputs запроса, иначе из outputs
+    всего каталога; переданные outputs заменяют их для всех запросов.
+    """
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    base_dir = os.path.dirname(path)
+    run_outputs = manifest.get("outputs", ["csv", "json"])
+    catalog = []
+    for entry in manifest["queries"]:
+        for required in ("key", "name", "file"):
+            if required not in entry:
+                raise ValueError(f"В записи каталога {entry} нет поля '{required}'")
+        query_outputs = outputs or entry.get("outputs", run_outputs)
+        for fmt in query_outputs:
+            try:
+                _split_format(fmt)
+            except ValueError as e:
+                raise ValueError(f"{entry['key']}: {e}") from None
+
+        kernel = entry.get("kernel")
+        if kernel is not None and kernel not in NUMPY_KERNELS:
+            raise ValueError(f"{entry['key']}: неизвестное ядро '{kernel}'")
+        budget = None
+        if "timeout_s" in entry or "max_vm_steps" in entry:
+            budget = QueryBudget(entry.get("timeout_s"), entry.get("max_vm_steps"))
+
+        with open(os.path.join(base_dir, entry["file"]), encoding="utf-8") as f:
+            sql = f.read()
+        catalog.append(
+            CatalogQuery(
+                key=entry["key"],
+                name=entry["name"],
+                sql=sql,
+                params=entry.get("params", {}),
+                outputs=list(query_outputs),
+                kernel=kernel,
+                budget=budget,
+            )
+        )
+    return catalog
+
+
+def filter_catalog(
+    catalog: list[CatalogQuery], patterns: list[str]
+) -> list[CatalogQuery]:
+    """Запросы, ключ которых подходит под шаблон (query_0*) или имя содержит его"""
+    return [
+        query
+        for query in catalog
+        if any(
+            fnmatch.fnmatchcase(query.key, pattern)
+            or pattern.lower() in query.name.lower()
+            for pattern in patterns
+        )
+    ]
+
+
+class ColumnStore:
+    """Колоночное представление таблиц: каждая колонка - массив NumPy.
+
+    Колонки читаются из базы при первом обращении. Все колонки таблицы
+    читаются одним запросом: отдельные SELECT могут пройти по разным
+    покрывающим индексам и вернуть строки в разном порядке, поэтому при
+    первом обращении к таблице сразу читаются и колонки из prefetch. Числовые
+    колонки хранятся как float64 (NULL -> NaN), текстовые кодируются словарем
+    (pd.Categorical), чтобы группировка шла по целочисленным кодам.
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        prefetch: dict[str, list[str]] | None = None,
+    ) -> None:
+        self.conn = conn
+        self.prefetch = KERNEL_COLUMNS if prefetch is None else prefetch
+        self._tables: dict[str, dict[str, np.ndarray | pd.Categorical]] = {}
+        # Суммарное время чтения колонок из базы
+        self.load_s = 0.0
+
+    def load(
+        self, table: str, columns: list[str]
+    ) -> dict[str, np.ndarray | pd.Categorical]:
+        stored = self._tables.get(table, {})
+        if any(name not in stored for name in columns):
+            started = time.perf_counter()
+            names = list(
+                dict.fromkeys([*stored, *self.prefetch.get(table, []), *columns])
+            )
+            declared = {
+                row[1]: row[2].upper()
+                for row in self.conn.execute(f"PRAGMA table_info({_quote(table)})")
+            }
+            select = ", ".join(_quote(name) for name in names)
+            rows = self.conn.execute(f"SELECT {select} FROM {_quote(table)}").fetchall()
+            values = list(zip(*rows)) if rows else [()] * len(names)
+
+            stored = {}
+            for name, column in zip(names, values):
+                affinity = declared.get(name, "")
+                numeric = "INT" in affinity or "REAL" in affinity
+                if numeric:
+                    stored[name] = np.array(column, dtype=np.float64)
+                else:
+                    stored[name] = pd.Categorical(np.array(column, dtype=object))
+            self._tables[table] = stored
+            self.load_s += time.perf_counter() - started
+        return {name: stored[name] for name in columns}
+
+
+def _sqlite_round(value: float | None, digits: int = 2) -> float | None:
+    """ROUND() как в SQLite: половина от нуля по 15 значащим цифрам"""
+    if value is None or np.isnan(value):
+        return None
+    quantum = Decimal(1).scaleb(-digits)
+    return float(Decimal(f"{value:.15g}").quantize(quantum, rounding=ROUND_HALF_UP))
+
+
+def _sql_value(value: object) -> object:
+    """Приводит ключ группы к значению, которое вернул бы sqlite3"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return int(value)
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _group_by(*keys: np.ndarray | pd.Categorical) -> tuple[np.ndarray, list[tuple]]:
+    """Номера групп для строк и ключи групп в порядке GROUP BY SQLite.
+
+    NULL образует отдельную группу и сортируется первым, как в SQLite.
+    """
+    codes = []
+    uniques = []
+    for key in keys:
+        key_codes, key_uniques = pd.factorize(key, use_na_sentinel=False)
+        codes.append(key_codes)
+        uniques.append([_sql_value(value) for value in key_uniques])
+
+    shape = tuple(max(len(values), 1) for values in uniques)
+    # Комбинированные коды плотные и небольшие: подсчет вместо сортировки
+    combined = np.ravel_multi_index(codes, shape)
+    present = np.flatnonzero(np.bincount(combined, minlength=int(np.prod(shape))))
+    lookup = np.zeros(int(np.prod(shape)), dtype=np.int64)
+    lookup[present] = np.arange(len(present))
+    ids = lookup[combined]
+    groups = [
+        tuple(uniques[i][code] for i, code in enumerate(np.unravel_index(flat, shape)))
+        for flat in present
+    ]
+
+    # Перенумеровываем группы в порядке сортировки ключей (NULL первым)
+    order = sorted(
+        range(len(groups)),
+        key=lambda g: [(value is not None, value) for value in groups[g]],
+    )
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[ids], [groups[g] for g in order]
+
+
+def _sum_count(
+    ids: np.ndarray, values: np.ndarray, groups: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Сумма и число не-NULL значений по группам"""
+    known = ~np.isnan(values)
+    sums = np.bincount(ids[known], weights=values[known], minlength=groups)
+    counts = np.bincount(ids[known], minlength=groups)
+    return sums, counts
+
+
+def _avg(total: float, count: int) -> float | None:
+    return None if count == 0 else float(total) / int(count)
+
+
+def _int_sum(total: float, count: int) -> int | None:
+    return None if count == 0 else int(total)
+
+
+def _order_desc(rows: list[tuple], index: int) -> list[tuple]:
+    """ORDER BY ... DESC: устойчивая сортировка, NULL в конце"""
+    return sorted(rows, key=lambda row: (row[index] is None, -(row[index] or 0)))
+
+
+def _survival_by(store: ColumnStore, key: str) -> list[tuple]:
+    cols = store.load("passengers_train", [key, "Survived"])
+    ids, groups = _group_by(cols[key])
+    total = np.bincount(ids, minlength=len(groups))
+    sums, counts = _sum_count(ids, cols["Survived"], len(groups))
+    rows = []
+    for g, (value,) in enumerate(groups):
+        rate = _avg(sums[g], counts[g])
+        rows.append(
+            (
+                value,
+                int(total[g]),
+                _int_sum(sums[g], counts[g]),
+                _sqlite_round(None if rate is None else rate * 100),
+            )
+        )
+    return rows
+
+
+def _kernel_survival_overall(store: ColumnStore) -> tuple[list[str], list[tuple]]:
+    survived = store.load("passengers_train", ["Survived"])["Survived"]
+    known = survived[~np.isnan(survived)]
+    total = float(known.sum())
+    rate = _avg(total, len(known))
+    row = (
+        len(survived),
+        _int_sum(total, len(known)),
+        _sqlite_round(None if rate is None else rate * 100),
+    )
+    return ["total_passengers", "survived", "survival_rate_percent"], [row]
+
+
+def _kernel_survival_by_sex(store: ColumnStore) -> tuple[list[str], list[tuple]]:
+    rows = _order_desc(_survival_by(store, "Sex"), 3)
+    return ["Sex", "total", "survived", "survival_rate_percent"], rows
+
+
+def _kernel_survival_by_class(store: ColumnStore) -> tuple[list[str], list[tuple]]:
+    rows = _survival_by(store, "Pclass")
+    return ["Pclass", "total", "survived", "survival_rate_percent"], rows
+
+
+def _kernel_age_stats(store: ColumnStore) -> tuple[list[str], list[tuple]]:
+    age = store.load(COMBINED_TABLE, ["Age"])["Age"]
+    age = age[~np.isnan(age)]
+    row: tuple
+    if len(age):
+        row = (
+            len(age),
+            _sqlite_round(_avg(age.sum(), len(age))),
+            float(age.min()),
+            float(age.max()),
+            int(np.count_nonzero(age < 18)),
+        )
+    else:
+        row = (0, None, None, None, 0)
+    return ["total", "avg_age", "min_age", "max_age", "children"], [row]
+
+
+def _kernel_family_by_class_sex(store: ColumnStore) -> tuple[list[str], list[tuple]]:
+    cols = store.load(COMBINED_TABLE, ["Pclass", "Sex", "SibSp", "Parch"])
+    ids, groups = _group_by(cols["Pclass"], cols["Sex"])
+    total = np.bincount(ids, minlength=len(groups))
+    aggregates = [
+        _sum_count(ids, values, len(groups))
+        for values in (cols["SibSp"], cols["Parch"], cols["SibSp"] + cols["Parch"])
+    ]
+    rows = [
+        (
+            pclass,
+            sex,
+            *(_avg(sums[g], counts[g]) for sums, counts in aggregates),
+            int(total[g]),
+        )
+        for g, (pclass, sex) in enumerate(groups)
+    ]
+    columns = [
+        "Pclass",
+        "Sex",
+        "avg_siblings_spouses",
+        "avg_parents_children",
+        "avg_family_size",
+        "passenger_count",
+    ]
+    return columns, rows
+
+
+def _kernel_embarkation_ports(store: ColumnStore) -> tuple[list[str], list[tuple]]:
+    cols = store.load("passengers_train", ["Embarked", "Fare", "Age", "Survived"])
+    embarked = pd.notna(cols["Embarked"])
+    ids, groups = _group_by(cols["Embarked"][embarked])
+    total = np.bincount(ids, minlength=len(groups))
+    fare = _sum_count(ids, cols["Fare"][embarked], len(groups))
+    age = _sum_count(ids, cols["Age"][embarked], len(groups))
+    survived = _sum_count(ids, cols["Survived"][embarked], len(groups))
+    rows = [
+        (
+            value,
+            int(total[g]),
+            _sqlite_round(_avg(fare[0][g], fare[1][g])),
+            _sqlite_round(_avg(age[0][g], age[1][g])),
+            _int_sum(survived[0][g], survived[1][g]),
+        )
+        for g, (value,) in enumerate(groups)
+    ]
+    columns = ["Embarked", "total_passengers", "avg_fare", "avg_age", "survived"]
+    return columns, _order_desc(rows, 1)
+
+
+# Колонки, которые читают ядра: каждая таблица читается из базы один раз
+KERNEL_COLUMNS: dict[str, list[str]] = {
+    "passengers_train": ["Survived", "Sex", "Pclass", "Embarked", "Fare", "Age"],
+    COMBINED_TABLE: ["Age", "Pclass", "Sex", "SibSp", "Parch"],
+}
+
+# Векторизованные реализации агрегатных запросов каталога (поле "kernel")
+NUMPY_KERNELS = {
+    "survival_overall": _kernel_survival_overall,
+    "survival_by_sex": _kernel_survival_by_sex,
+    "survival_by_class": _kernel_survival_by_class,
+    "age_stats": _kernel_age_stats,
+    "family_by_class_sex": _kernel_family_by_class_sex,
+    "embarkation_ports": _kernel_embarkation_ports,
+}
+
+
+# Меры общего прохода по таблице: один GROUP BY по объединению ключей
+# нескольких запросов, из которого каждый запрос сворачивает свой результат
+SHARED_SCAN_MEASURES: dict[str, str] = {
+    "rows": "COUNT(*)",
+    "survived_sum": "SUM(Survived)",
+    "survived_n": "COUNT(Survived)",
+    "fare_sum": "SUM(Fare)",
+    "fare_n": "COUNT(Fare)",
+    "age_sum": "SUM(Age)",
+    "age_n": "COUNT(Age)",
+    "age_min": "MIN(Age)",
+    "age_max": "MAX(Age)",
+    "children": "COUNT(CASE WHEN Age < 18 THEN 1 END)",
+    "sibsp_sum": "SUM(SibSp)",
+    "sibsp_n": "COUNT(SibSp)",
+    "parch_sum": "SUM(Parch)",
+    "parch_n": "COUNT(Parch)",
+    "family_sum": "SUM(SibSp + Parch)",
+    "family_n": "COUNT(SibSp + Parch)",
+}
+
+
+@dataclass
+class SharedAggregate:
+    """Агрегатный запрос, который сворачивается из общего прохода по таблице"""
+
+    table: str
+    # Колонки GROUP BY запроса
+    keys: list[str]
+    # Нужные меры из SHARED_SCAN_MEASURES
+    measures: list[str]
+    # Свертка: группы (ключ, меры) в порядке GROUP BY -> колонки и строки
+    rollup: Callable[[list[tuple[tuple, dict]]], tuple[list[str], list[tuple]]]
+    # Условие WHERE запроса, проверяемое на ключах ячейки
+    where: Callable[[dict], bool] | None = None
+
+
+# Значение меры в ячейке: счетчик, сумма, минимум или максимум (NULL - None)
+Measure = int | float | None
+
+
+def _combine_measure(name: str, left: Measure, right: Measure) -> Measure:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if name.endswith("_min"):
+        return min(left, right)
+    if name.endswith("_max"):
+        return max(left, right)
+    return left + right
+
+
+def _rollup_cells(
+    cells: list[dict], aggregate: SharedAggregate
+) -> list[tuple[tuple, dict]]:
+    """Сворачивает ячейки общего прохода до группировки запроса"""
+    groups: dict[tuple, dict] = {}
+    if not aggregate.keys:
+        # Агрегат без GROUP BY возвращает строку и на пустой таблице
+        groups[()] = {
+            name: 0 if SHARED_SCAN_MEASURES[name].startswith("COUNT") else None
+            for name in aggregate.measures
+        }
+    for cell in cells:
+        if aggregate.where is not None and not aggregate.where(cell):
+            continue
+        key = tuple(cell[column] for column in aggregate.keys)
+        measures = groups.get(key)
+        if measures is None:
+            groups[key] = {name: cell[name] for name in aggregate.measures}
+            continue
+        for name in aggregate.measures:
+            measures[name] = _combine_measure(name, measures[name], cell[name])
+    return sorted(
+        groups.items(), key=lambda item: [(v is not None, v) for v in item[0]]
+    )
+
+
+def _ratio(total: Measure, count: int) -> float | None:
+    return None if not count or total is None else total / count
+
+
+def _rate_percent(measures: dict) -> float | None:
+    rate = _ratio(measures["survived_sum"], measures["survived_n"])
+    return _sqlite_round(None if rate is None else rate * 100)
+
+
+def _rollup_survival(groups: list[tuple[tuple, dict]]) -> list[tuple]:
+    return [(*key, m["rows"], m["survived_sum"], _rate_percent(m)) for key, m in groups]
+
+
+def _rollup_age_stats(
+    groups: list[tuple[tuple, dict]],
+) -> tuple[list[str], list[tuple]]:
+    m = groups[0][1]
+    row = (
+        m["age_n"],
+        _sqlite_round(_ratio(m["age_sum"], m["age_n"])),
+        m["age_min"],
+        m["age_max"],
+        m["children"],
+    )
+    return ["total", "avg_age", "min_age", "max_age", "children"], [row]
+
+
+def _rollup_family(groups: list[tuple[tuple, dict]]) -> tuple[list[str], list[tuple]]:
+    rows = [
+        (
+            pclass,
+            sex,
+            _ratio(m["sibsp_sum"], m["sibsp_n"]),
+            _ratio(m["parch_sum"], m["parch_n"]),
+            _ratio(m["family_sum"], m["family_n"]),
+            m["rows"],
+        )
+        for (pclass, sex), m in groups
+    ]
+    columns = [
+        "Pclass",
+        "Sex",
+        "avg_siblings_spouses",
+        "avg_parents_children",
+        "avg_family_size",
+        "passenger_count",
+    ]
+    return columns, rows
+
+
+def _rollup_ports(groups: list[tuple[tuple, dict]]) -> tuple[list[str], list[tuple]]:
+    rows = [
+        (
+            embarked,
+            m["rows"],
+            _sqlite_round(_ratio(m["fare_sum"], m["fare_n"])),
+            _sqlite_round(_ratio(m["age_sum"], m["age_n"])),
+            m["survived_sum"],
+        )
+        for (embarked,), m in groups
+    ]
+    columns = ["Embarked", "total_passengers", "avg_fare", "avg_age", "survived"]
+    return columns, _order_desc(rows, 1)
+
+
+_SURVIVAL_MEASURES = ["rows", "survived_sum", "survived_n"]
+_SURVIVAL_COLUMNS = ["total", "survived", "survival_rate_percent"]
+
+# Свертки агрегатных запросов каталога по имени ядра (поле "kernel")
+SHARED_AGGREGATES: dict[str, SharedAggregate] = {
+    "survival_overall": SharedAggregate(
+        "passengers_train",
+        [],
+        _SURVIVAL_MEASURES,
+        lambda groups: (
+            ["total_passengers", *_SURVIVAL_COLUMNS[1:]],
+            _rollup_survival(groups),
+        ),
+    ),
+    "survival_by_sex": SharedAggregate(
+        "passengers_train",
+        ["Sex"],
+        _SURVIVAL_MEASURES,
+        lambda groups: (
+            ["Sex", *_SURVIVAL_COLUMNS],
+            _order_desc(_rollup_survival(groups), 3),
+        ),
+    ),
+    "survival_by_class": SharedAggregate(
+        "passengers_train",
+        ["Pclass"],
+        _SURVIVAL_MEASURES,
+        lambda groups: (["Pclass", *_SURVIVAL_COLUMNS], _rollup_survival(groups)),
+    ),
+    "age_stats": SharedAggregate(
+        COMBINED_TABLE,
+        [],
+        ["age_n", "age_sum", "age_min", "age_max", "children"],
+        _rollup_age_stats,
+    ),
+    "family_by_class_sex": SharedAggregate(
+        COMBINED_TABLE,
+        ["Pclass", "Sex"],
+        [
+            "rows",
+            "sibsp_sum",
+            "sibsp_n",
+            "parch_sum",
+            "parch_n",
+            "family_sum",
+            "family_n",
+        ],
+        _rollup_family,
+    ),
+    "embarkation_ports": SharedAggregate(
+        "passengers_train",
+        ["Embarked"],
+        ["rows", "fare_sum", "fare_n", "age_sum", "age_n", "survived_sum"],
+        _rollup_ports,
+        where=lambda cell: cell["Embarked"] is not None,
+    ),
+}
+
+
+def _measure_columns(measures: list[str]) -> list[str]:
+    """Колонки таблицы, которые читают меры (в выражениях они с заглавной буквы)"""
+    found = (
+        re.findall(r"\b[A-Z][a-z]\w*", SHARED_SCAN_MEASURES[name]) for name in measures
+    )
+    return list(dict.fromkeys(column for columns in found for column in columns))
+
+
+def shared_scan(
+    conn: sqlite3.Connection,
+    table: str,
+    key_sets: list[list[str]],
+    measures: list[str],
+) -> list[list[dict]]:
+    """Один последовательный проход по таблице и GROUP BY по каждому набору ключей.
+
+    Нужные колонки читаются один раз в материализованное CTE (NOT INDEXED -
+    подряд, без выборки строк по rowid через индекс), а группировка по каждому
+    набору ключей идет по нему внутри SQLite. Суммы внутри группы складываются
+    по строкам в порядке таблицы, как и в отдельном запросе, а не из частичных
+    сумм ячеек, поэтому AVG и SUM по REAL совпадают с отдельным запросом.
+    Возвращает группы каждого набора ключей в виде {ключи и меры}.
+    """
+    keys = list(dict.fromkeys(key for key_set in key_sets for key in key_set))
+    columns = list(dict.fromkeys([*keys, *_measure_columns(measures)]))
+    source = f"SELECT {', '.join(map(_quote, columns))} FROM {_quote(table)}"
+    if _object_type(conn, table) == "table":
+        source += " NOT INDEXED"
+
+    selects = []
+    for i, key_set in enumerate(key_sets):
+        items = [f"{i} AS grouping_set"]
+        items += [
+            _quote(key) if key in key_set else f"NULL AS {_quote(key)}" for key in keys
+        ]
+        items += [f"{SHARED_SCAN_MEASURES[name]} AS {name}" for name in measures]
+        select = f"SELECT {', '.join(items)} FROM scan"
+        if key_set:
+            select += " GROUP BY " + ", ".join(map(_quote, key_set))
+        selects.append(select)
+    sql = f"WITH scan AS MATERIALIZED ({source})\n" + "\nUNION ALL\n".join(selects)
+
+    cursor = conn.execute(sql)
+    names = [column[0] for column in cursor.description]
+    groups: list[list[dict]] = [[] for _ in key_sets]
+    for row in cursor.fetchall():
+        groups[row[0]].append(dict(zip(names[1:], row[1:])))
+    return groups
+
+
+def _grouping_rows(
+    cells: list[dict], aggregate: SharedAggregate
+) -> list[tuple[tuple, dict]]:
+    """Группы запроса из GROUP BY по его ключам, в порядке ключей (NULL первым)"""
+    groups = [
+        (
+            tuple(cell[key] for key in aggregate.keys),
+            {name: cell[name] for name in aggregate.measures},
+        )
+        for cell in cells
+        if aggregate.where is None or aggregate.where(cell)
+    ]
+    return sorted(groups, key=lambda item: [(v is not None, v) for v in item[0]])
+
+
+def _shared_scan_answers(query: CatalogQuery) -> bool:
+    """Есть ли у запроса свертка общего прохода"""
+    return query.kernel in SHARED_AGGREGATES
+
+
+def run_shared_scans(
+    conn: sqlite3.Connection, queries: list[CatalogQuery]
+) -> dict[str, QueryResult]:
+    """Выполняет агрегатные запросы группами: один проход на таблицу.
+
+    Возвращает результаты по ключу запроса; запросы без свертки
+    в SHARED_AGGREGATES не выполняются.
+    """
+    groups: dict[str, list[tuple[CatalogQuery, SharedAggregate]]] = {}
+    for query in queries:
+        aggregate = SHARED_AGGREGATES.get(query.kernel or "")
+        if aggregate is not None:
+            groups.setdefault(aggregate.table, []).append((query, aggregate))
+
+    results = {}
+    for table, members in groups.items():
+        aggregates = [aggregate for _, aggregate in members]
+        key_sets = list(dict.fromkeys(tuple(agg.keys) for agg in aggregates))
+        measures = list(dict.fromkeys(m for agg in aggregates for m in agg.measures))
+
+        started = time.perf_counter()
+        cells = shared_scan(conn, table, [list(keys) for keys in key_sets], measures)
+        scan_s = time.perf_counter() - started
+
+        for query, aggregate in members:
+            started = time.perf_counter()
+            grouped = cells[key_sets.index(tuple(aggregate.keys))]
+            columns, rows = aggregate.rollup(_grouping_rows(grouped, aggregate))
+            timings = {"scan_s": scan_s, "rollup_s": time.perf_counter() - started}
+            results[query.key] = QueryResult(
+                query,
+                columns,
+                rows,
+                timings,
+                dict(query.params),
+                shared_scan=table,
+            )
+    return results
+
+
+def summary_cells(conn: sqlite3.Connection, table: str) -> list[dict] | None:
+    """Ячейки сводной таблицы в виде мер общего прохода.
+
+    Возвращает None, если сводки нет или она не поддерживается триггерами.
+    """
+    summary = _summary_table(table)
+    existing = {
+        name
+        for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"
+        )
+    }
+    if summary not in existing or any(
+        name not in existing for name in _summary_triggers(conn, table)
+    ):
+        return None
+
+    cursor = conn.execute(f"SELECT * FROM {summary}")
+    names = [column[0] for column in cursor.description]
+    cells = []
+    for row in cursor.fetchall():
+        cell = dict(zip(names, row))
+        # SUM() по одним NULL дает NULL, а в сводке хранится 0
+        for name in SUMMARY_COLUMNS:
+            if cell[f"{name}_n"] == 0:
+                cell[f"{name}_sum"] = None
+        cells.append(cell)
+    return cells
+
+
+def _summary_answers(query: CatalogQuery) -> bool:
+    """Хватает ли свертке запроса счетчиков и сумм сводной таблицы"""
+    aggregate = SHARED_AGGREGATES.get(query.kernel or "")
+    available = {"rows"} | {
+        f"{name}_{suffix}" for name in SUMMARY_COLUMNS for suffix in ("n", "sum")
+    }
+    return aggregate is not None and set(aggregate.measures) <= available
+
+
+def run_summary_queries(
+    conn: sqlite3.Connection, queries: list[CatalogQuery]
+) -> dict[str, QueryResult]:
+    """Отвечает на агрегатные запросы по сводным таблицам за O(групп).
+
+    Подходят запросы, свертке которых хватает счетчиков и сумм сводки
+    (MIN/MAX при удалении строк не поддерживаются); остальные пропускаются.
+    """
+    cells: dict[str, list[dict] | None] = {}
+    results = {}
+    for query in queries:
+        if not _summary_answers(query):
+            continue
+        aggregate = SHARED_AGGREGATES[query.kernel or ""]
+        started = time.perf_counter()
+        if aggregate.table not in cells:
+            cells[aggregate.table] = summary_cells(conn, aggregate.table)
+        table_cells = cells[aggregate.table]
+        if table_cells is None:
+            continue
+
+        columns, rows = aggregate.rollup(_rollup_cells(table_cells, aggregate))
+        timings = {"summary_s": time.perf_counter() - started}
+        results[query.key] = QueryResult(
+            query,
+            columns,
+            rows,
+            timings,
+            dict(query.params),
+            summary_table=_summary_table(aggregate.table),
+        )
+    return results
+
+
+def _json_value(value: object) -> str:
+    """Значение в JSON так, как его пишет pandas to_json (double_precision=10)"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return repr(round(value, 10)) if math.isfinite(value) else "null"
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    return encode_basestring(str(value))
+
+
+def _json_column(values: tuple) -> list[str]:
+    """Кодирует колонку порции строк в JSON; однотипные колонки без вызова на значение"""
+    types = set(map(type, values)) - {type(None)}
+    if types <= {float}:
+        # v - v равно 0.0 только у конечных чисел: inf и nan пишутся как null
+        return ["null" if v is None or v - v else repr(round(v, 10)) for v in values]
+    if types <= {int}:
+        return ["null" if v is None else str(v) for v in values]
+    if types <= {str}:
+        return ["null" if v is None else encode_basestring(v) for v in values]
+    return [_json_value(v) for v in values]
+
+
+class CsvEncoder:
+    """Кодирует порции строк результата в CSV (как DataFrame.to_csv)"""
+
+    def __init__(self, columns: list[str]) -> None:
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._columns = columns
+
+    def _flush(self) -> str:
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+    def header(self) -> str:
+        self._writer.writerow(self._columns)
+        return self._flush()
+
+    def encode(self, rows: list[tuple]) -> str:
+        self._writer.writerows(rows)
+        return self._flush()
+
+    def footer(self) -> str:
+        return ""
+
+
+class JsonArrayEncoder:
+    """Кодирует порции строк результата в JSON-массив объектов.
+
+    Разметка повторяет to_json(orient="records", indent=2), включая
+    экранирование "/" как в ujson: объекты кодируются порциями по мере
+    выборки, весь массив в памяти не собирается.
+    """
+
+    def __init__(self, columns: list[str]) -> None:
+        fields = ",\n".join(
+            f"    {encode_basestring(column).replace('%', '%%')}:%s"
+            for column in columns
+        )
+        self._template = f"\n  {{\n{fields}\n  }}"
+        self._rows = 0
+
+    def header(self) -> str:
+        return "["
+
+    def encode(self, rows: list[tuple]) -> str:
+        if not rows:
+            return ""
+        columns = [_json_column(values) for values in zip(*rows)]
+        chunk = ",".join(self._template % row for row in zip(*columns))
+        separator = "," if self._rows else ""
+        self._rows += len(rows)
+        return separator + chunk.replace("/", "\\/")
+
+    def footer(self) -> str:
+        return "\n]\n" if self._rows else "]\n"
+
+
+class NdjsonEncoder:
+    """Кодирует порции строк результата в NDJSON: один объект на строку файла"""
+
+    def __init__(self, columns: list[str]) -> None:
+        fields = ",".join(
+            f"{encode_basestring(column).replace('%', '%%')}:%s" for column in columns
+        )
+        self._template = f"{{{fields}}}\n"
+
+    def header(self) -> str:
+        return ""
+
+    def encode(self, rows: list[tuple]) -> str:
+        if not rows:
+            return ""
+        columns = [_json_column(values) for values in zip(*rows)]
+        return "".join(self._template % row for row in zip(*columns))
+
+    def footer(self) -> str:
+        return ""
+
+
+# Кодировщики форматов экспорта
+EXPORT_ENCODERS: dict[
+    str, type[CsvEncoder] | type[JsonArrayEncoder] | type[NdjsonEncoder]
+] = {
+    "csv": CsvEncoder,
+    "json": JsonArrayEncoder,
+    "ndjson": NdjsonEncoder,
+}
+
+
+def _split_format(fmt: str) -> tuple[str, str | None]:
+    """Разбирает формат экспорта "<формат>[.<сжатие>]", например "ndjson.gz" """
+    base, _, compression = fmt.partition(".")
+    if base in EXPORT_BUNDLES and not compression:
+        return base, None
+    if base not in EXPORT_FORMATS or (
+        compression and compression not in EXPORT_COMPRESSION
+    ):
+        raise ValueError(f"Неизвестный формат экспорта '{fmt}'")
+    return base, compression or None
+
+
+def _format_extension(fmt: str) -> str:
+    base, compression = _split_format(fmt)
+    extension = EXPORT_FORMATS[base][1]
+    return f"{extension}.{compression}" if compression else extension
+
+
+def export_path(key: str, fmt: str, sharded: bool = False) -> str:
+    """Путь файла (или каталога пакета, частей) экспорта результата в заданном формате"""
+    base, _ = _split_format(fmt)
+    if base in EXPORT_BUNDLES:
+        return f"{EXPORT_BUNDLES[base]}/{key}"
+    path = f"{EXPORT_FORMATS[base][0]}/{key}.{_format_extension(fmt)}"
+    return f"{path}{SHARD_SUFFIX}" if sharded else path
+
+
+class _AtomicFile:
+    """Файл экспорта, который пишется во временный файл рядом с целевым.
+
+    commit() атомарно заменяет целевой файл (os.replace), discard() удаляет
+    временный, так что целевой файл либо прежний, либо дописан целиком.
+    """
+
+    def __init__(self, path: str, compression: str | None) -> None:
+        self.path = path
+        directory, name = os.path.split(path)
+        fd, self.temp_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{name}.", suffix=".tmp"
+        )
+        self._raw = os.fdopen(fd, "wb")
+        self._file: BinaryIO = self._raw
+        if compression is not None:
+            self._file = EXPORT_COMPRESSION[compression](self._raw)
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+
+    def close(self) -> None:
+        try:
+            self._file.close()
+        finally:
+            self._raw.close()
+
+    def commit(self) -> None:
+        os.replace(self.temp_path, self.path)
+
+    def discard(self) -> None:
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class _FormatWriter:
+    """Кодировщик одного формата и все его файлы (несжатый и сжатые варианты)"""
+
+    def __init__(self, encoder, files: dict[str, _AtomicFile]) -> None:
+        self.encoder = encoder
+        self.files = files
+        self.encode_s = 0.0
+        self.write_s = dict.fromkeys(files, 0.0)
+        # Объем и SHA-256 закодированного текста до сжатия
+        self.raw_bytes = 0
+        self.digest = hashlib.sha256()
+
+    def _emit(self, text: str) -> None:
+        # Порция пишется одним вызовом: сжатие большого буфера идет без GIL
+        data = text.encode("utf-8")
+        self.raw_bytes += len(data)
+        self.digest.update(data)
+        for fmt, file in self.files.items():
+            started = time.perf_counter()
+            file.write(data)
+            self.write_s[fmt] += time.perf_counter() - started
+
+    def write(self, rows: list[tuple]) -> None:
+        started = time.perf_counter()
+        text = self.encoder.encode(rows)
+        self.encode_s += time.perf_counter() - started
+        self._emit(text)
+
+    def close(self) -> None:
+        self._emit(self.encoder.footer())
+        for fmt, file in self.files.items():
+            started = time.perf_counter()
+            file.close()
+            self.write_s[fmt] += time.perf_counter() - started
+
+
+class _AtomicDir:
+    """Каталог пакета экспорта, который собирается во временном каталоге рядом.
+
+    commit() заменяет целевой каталог новым (прежний сначала отодвигается,
+    затем удаляется), discard() удаляет временный.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        parent, name = os.path.split(path)
+        self.temp_path = tempfile.mkdtemp(dir=parent, prefix=f".{name}.", suffix=".tmp")
+
+    def commit(self) -> None:
+        old = None
+        if os.path.exists(self.path):
+            old = tempfile.mkdtemp(
+                dir=os.path.dirname(self.path), prefix=".old.", suffix=".tmp"
+            )
+            os.replace(self.path, os.path.join(old, "bundle"))
+        os.replace(self.temp_path, self.path)
+        if old is not None:
+            shutil.rmtree(old)
+
+    def discard(self) -> None:
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+
+
+def _npy_header(dtype: str, rows: int) -> bytes:
+    """Заголовок .npy версии 1.0 фиксированной длины NPY_HEADER_BYTES.
+
+    Длина не зависит от числа строк, поэтому заголовок пишется заранее
+    и переписывается на месте, когда число строк известно.
+    """
+    header = repr(
+        {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            "fortran_order": False,
+            "shape": (rows,),
+        }
+    )
+    # 10 байт: сигнатура, версия и длина заголовка
+    header = header.ljust(NPY_HEADER_BYTES - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode()
+
+
+def _npy_kind(values: tuple) -> str | None:
+    """Вид колонки по порции значений: int, float, text или None (только NULL)"""
+    types = set(map(type, values))
+    if bytes in types:
+        raise ValueError("BLOB-значения не поддерживаются форматом npy")
+    if str in types:
+        return "text"
+    if float in types or (int in types and type(None) in types):
+        return "float"
+    return "int" if int in types else None
+
+
+# Порядок расширения вида колонки: int -> float -> text
+_NPY_KINDS = {None: 0, "int": 1, "float": 2, "text": 3}
+_NPY_DTYPES = {"int": "<i8", "float": "<f8", "text": "<i4"}
+
+
+class _NpyColumn:
+    """Одна колонка пакета npy, которая дописывается порциями.
+
+    Целые без NULL хранятся как int64, прочие числа как float64 (NULL -> NaN),
+    текст кодируется словарем: коды int32 (NULL -> -1) и отдельный файл
+    .categories.npy со значениями. Если новая порция требует более широкого
+    вида (например, NULL в целой колонке), уже записанные данные переводятся
+    в него один раз.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.kind: str | None = None
+        self.rows = 0
+        self.categories: dict[str, int] = {}
+        self._file = open(path, "w+b")
+        self._file.write(_npy_header(_NPY_DTYPES["float"], 0))
+
+    def _text_codes(self, values: Iterable[object]) -> np.ndarray:
+        categories = self.categories
+        codes = [
+            (
+                -1
+                if v is None
+                else categories.setdefault(
+                    v if isinstance(v, str) else repr(v), len(categories)
+                )
+            )
+            for v in values
+        ]
+        return np.array(codes, dtype=_NPY_DTYPES["text"])
+
+    def _encode(self, values: Iterable[object], kind: str) -> np.ndarray:
+        if kind == "text":
+            return self._text_codes(values)
+        return np.array(list(values), dtype=_NPY_DTYPES[kind])
+
+    def _widen(self, kind: str) -> None:
+        # Перекодирует уже записанные строки в более широкий вид
+        if self.kind is None:
+            values = [None] * self.rows
+        else:
+            self._file.seek(NPY_HEADER_BYTES)
+            values = np.fromfile(self._file, dtype=_NPY_DTYPES[self.kind]).tolist()
+            if self.kind == "float":
+                values = [None if v != v else v for v in values]
+        data = self._encode(values, kind)
+        self._file.seek(NPY_HEADER_BYTES)
+        self._file.truncate()
+        self._file.write(data.tobytes())
+        self.kind = kind
+
+    def append(self, values: tuple) -> None:
+        kind = _npy_kind(values)
+        # NULL после целых (или целые после NULL) требуют float64
+        if (kind, self.kind) == (None, "int") or (
+            (kind, self.kind) == ("int", None) and self.rows
+        ):
+            kind = "float"
+        if kind is not None and _NPY_KINDS[kind] > _NPY_KINDS[self.kind]:
+            if self.rows:
+                self._widen(kind)
+            self.kind = kind
+        if self.kind is not None:
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(self._encode(values, self.kind).tobytes())
+        self.rows += len(values)
+
+    def close(self) -> dict[str, object]:
+        """Дописывает заголовок и словарь, возвращает описание колонки для схемы"""
+        kind = self.kind
+        if kind is None:
+            # Колонка из одних NULL
+            kind = "float"
+            self._widen(kind)
+        self._file.seek(0)
+        self._file.write(_npy_header(_NPY_DTYPES[kind], self.rows))
+        self._file.close()
+        categories = None
+        if kind == "text":
+            categories = self.path.replace(".npy", ".categories.npy")
+            np.save(categories, np.array(list(self.categories), dtype=str))
+            categories = os.path.basename(categories)
+        return {
+            "file": os.path.basename(self.path),
+            "kind": kind,
+            "dtype": _NPY_DTYPES[kind],
+            "categories": categories,
+        }
+
+
+class NpyBundleWriter:
+    """Пишет результат колоночным пакетом: .npy на колонку и schema.json.
+
+    Потребитель открывает колонки через np.load(..., mmap_mode="r") без
+    разбора текста (см. read_npy_bundle). Интерфейс тот же, что у записи
+    текстовых форматов, поэтому пакет участвует в раздаче порций наравне
+    с CSV и JSON.
+    """
+
+    def __init__(self, columns: list[str], files: dict[str, _AtomicDir]) -> None:
+        self.files = files
+        self.bundle = next(iter(files.values()))
+        self.names = columns
+        self.columns = []
+        for i, name in enumerate(columns):
+            # Номер колонки и ее имя без символов, недопустимых в путях
+            safe = re.sub(r"\W+", "_", name)
+            path = os.path.join(self.bundle.temp_path, f"{i:02d}_{safe}.npy")
+            self.columns.append(_NpyColumn(path))
+        self.rows = 0
+        self.encode_s = 0.0
+        self.write_s = dict.fromkeys(files, 0.0)
+        self.raw_bytes = 0
+        self.digest = hashlib.sha256()
+
+    def write(self, rows: list[tuple]) -> None:
+        started = time.perf_counter()
+        for column, values in zip(self.columns, zip(*rows)):
+            column.append(values)
+        self.rows += len(rows)
+        self.encode_s += time.perf_counter() - started
+
+    def close(self) -> None:
+        started = time.perf_counter()
+        schema = {
+            "rows": self.rows,
+            "columns": [
+                {"name": name, **column.close()}
+                for name, column in zip(self.names, self.columns)
+            ],
+        }
+        with open(
+            os.path.join(self.bundle.temp_path, NPY_SCHEMA_FILE), "w", encoding="utf-8"
+        ) as f:
+            json.dump(schema, f, ensure_ascii=False, indent=2)
+        # Дайджест по готовым файлам: расширение вида колонки переписывает данные
+        for name in sorted(os.listdir(self.bundle.temp_path)):
+            path = os.path.join(self.bundle.temp_path, name)
+            self.digest.update(name.encode("utf-8"))
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    self.digest.update(block)
+            self.raw_bytes += os.path.getsize(path)
+        for fmt in self.write_s:
+            self.write_s[fmt] += time.perf_counter() - started
+
+
+def read_npy_bundle(path: str, mmap: bool = True) -> pd.DataFrame:
+    """Читает пакет npy в DataFrame; числовые колонки отображаются в память"""
+    with open(os.path.join(path, NPY_SCHEMA_FILE), encoding="utf-8") as f:
+        schema = json.load(f)
+    data = {}
+    for column in schema["columns"]:
+        values = np.load(
+            os.path.join(path, column["file"]), mmap_mode="r" if mmap else None
+        )
+        if column["categories"] is not None:
+            categories = np.load(os.path.join(path, column["categories"]))
+            values = pd.Categorical.from_codes(values, categories=categories)
+        data[column["name"]] = values
+    return pd.DataFrame(data, columns=[c["name"] for c in schema["columns"]])
+
+
+def _export_size(path: str) -> int:
+    """Размер файла экспорта или суммарный размер файлов пакета"""
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path))
+    return os.path.getsize(path)
+
+
+class _ShardedWriter:
+    """Кодировщик одного формата, который режет результат на файлы-части.
+
+    Порции кодируются по мере поступления; закодированная часть целиком
+    передается в пул (ShardSpec.workers), где она сжимается и пишется во все
+    варианты формата параллельно с кодированием следующих частей. Рядом
+    с частями пишется manifest.json: строки, размер и SHA-256 каждой части.
+    В памяти не больше workers + 1 закодированных частей.
+    """
+
+    def __init__(
+        self,
+        encoder_type: type,
+        columns: list[str],
+        files: dict[str, _AtomicDir],
+        shard: ShardSpec,
+        pool: ThreadPoolExecutor,
+    ) -> None:
+        self.encoder_type = encoder_type
+        self.columns = columns
+        self.files = files
+        self.shard = shard
+        self._pool = pool
+        self.encode_s = 0.0
+        self.write_s = dict.fromkeys(files, 0.0)
+        self.raw_bytes = 0
+        self.digest = hashlib.sha256()
+        # Части по номерам: пишутся параллельно и завершаются в любом порядке
+        self.parts: dict[str, dict[int, dict]] = {fmt: {} for fmt in files}
+        self._lock = threading.Lock()
+        self._in_flight: list[Future] = []
+        self._index = 0
+        self._start_part()
+
+    def _start_part(self) -> None:
+        self._encoder = self.encoder_type(self.columns)
+        # Порции хранятся уже в UTF-8: размер части считается в байтах
+        self._chunks = [self._encoder.header().encode("utf-8")]
+        self._part_rows = 0
+        self._part_bytes = len(self._chunks[0])
+
+    def _finish_part(self) -> None:
+        self._chunks.append(self._encoder.footer().encode("utf-8"))
+        data = b"".join(self._chunks)
+        self.raw_bytes += len(data)
+        self.digest.update(data)
+        # Ограничение памяти: ждем самую старую часть, если пул занят
+        while len(self._in_flight) > self.shard.workers:
+            self._in_flight.pop(0).result()
+        self._in_flight.append(
+            self._pool.submit(self._write_part, self._index, data, self._part_rows)
+        )
+        self._index += 1
+
+    def _write_part(self, index: int, data: bytes, rows: int) -> None:
+        for fmt, bundle in self.files.items():
+            started = time.perf_counter()
+            _, compression = _split_format(fmt)
+            name = f"part-{index:05d}.{_format_extension(fmt)}"
+            path = os.path.join(bundle.temp_path, name)
+            with open(path, "wb") as raw:
+                file = EXPORT_COMPRESSION[compression](raw) if compression else raw
+                file.write(data)
+                file.close()
+            part = {
+                "file": name,
+                "rows": rows,
+                "bytes": os.path.getsize(path),
+                "sha256": file_sha256(path),
+            }
+            with self._lock:
+                self.parts[fmt][index] = part
+                self.write_s[fmt] += time.perf_counter() - started
+
+    def _full(self) -> bool:
+        return (self.shard.rows is not None and self._part_rows >= self.shard.rows) or (
+            self.shard.bytes is not None and self._part_bytes >= self.shard.bytes
+        )
+
+    def write(self, rows: list[tuple]) -> None:
+        started = time.perf_counter()
+        while rows:
+            take = len(rows)
+            if self.shard.rows is not None:
+                take = min(take, self.shard.rows - self._part_rows)
+            data = self._encoder.encode(rows[:take]).encode("utf-8")
+            self._chunks.append(data)
+            self._part_rows += take
+            self._part_bytes += len(data)
+            rows = rows[take:]
+            if self._full():
+                self._finish_part()
+                self._start_part()
+        self.encode_s += time.perf_counter() - started
+
+    def close(self) -> None:
+        # Последняя часть пишется и пустой, если строк не было вовсе
+        if self._part_rows or not self._index:
+            self._finish_part()
+        for future in self._in_flight:
+            future.result()
+        for fmt, bundle in self.files.items():
+            parts = [self.parts[fmt][index] for index in sorted(self.parts[fmt])]
+            manifest = {
+                "format": fmt,
+                "columns": self.columns,
+                "rows": sum(part["rows"] for part in parts),
+                "parts": parts,
+            }
+            with open(
+                os.path.join(bundle.temp_path, SHARD_MANIFEST_FILE),
+                "w",
+                encoding="utf-8",
+            ) as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    def cancel(self) -> None:
+        for future in self._in_flight:
+            future.exception()
+
+
+class ResultExport:
+    """Запись результата во все форматы каталога по мере выборки строк.
+
+    Порции строк выбираются из курсора один раз и раздаются всем форматам.
+    Каждая порция кодируется один раз на формат, и тот же текст пишется
+    в несжатый файл и в сжатые варианты. При нескольких форматах каждый
+    кодируется и пишется в своем потоке, пока выбирается следующая порция.
+    Кодирование в Python держит GIL, а сжатие и запись в файл его отпускают,
+    поэтому параллельно идут именно они; на одном ядре (threads=None)
+    потоки не запускаются.
+
+    Файлы пишутся во временные и переименовываются в close(). Если SHA-256
+    содержимого формата до сжатия и размер файла совпадают с записанными
+    в previous (load_export_digests), файл не трогается, а временный удаляется.
+
+    С shard текстовые форматы пишутся частями (_ShardedWriter) в каталоги
+    <файл>.parts/; пакеты npy не делятся.
+    """
+
+    def __init__(
+        self,
+        query: CatalogQuery,
+        columns: list[str],
+        threads: bool | None = None,
+        previous: dict[str, tuple[str, int]] | None = None,
+        shard: ShardSpec | None = None,
+    ) -> None:
+        self.key = query.key
+        self.paths: list[str] = []
+        self._paths: dict[str, str] = {}
+        self.rows = 0
+        self.seconds = 0.0
+        self.previous = previous or {}
+        # Файлы, оставленные без изменений
+        self.unchanged: set[str] = set()
+        started = time.perf_counter()
+        files: dict[str, dict] = {}
+        try:
+            for fmt in query.outputs:
+                base, compression = _split_format(fmt)
+                path = export_path(query.key, fmt, shard is not None)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self.paths.append(path)
+                self._paths[fmt] = path
+                if base in EXPORT_BUNDLES or shard is not None:
+                    files.setdefault(base, {})[fmt] = _AtomicDir(path)
+                else:
+                    files.setdefault(base, {})[fmt] = _AtomicFile(path, compression)
+        except BaseException:
+            for opened in files.values():
+                for file in opened.values():
+                    if isinstance(file, _AtomicFile):
+                        file.close()
+                    file.discard()
+            raise
+        self._parts_pool = None
+        if shard is not None:
+            self._parts_pool = ThreadPoolExecutor(
+                max_workers=shard.workers, thread_name_prefix="export-part"
+            )
+        self.writers: list[_FormatWriter | NpyBundleWriter | _ShardedWriter] = []
+        for base, opened in files.items():
+            if base in EXPORT_BUNDLES:
+                self.writers.append(NpyBundleWriter(columns, opened))
+                continue
+            if shard is not None:
+                assert self._parts_pool is not None
+                self.writers.append(
+                    _ShardedWriter(
+                        EXPORT_ENCODERS[base], columns, opened, shard, self._parts_pool
+                    )
+                )
+                continue
+            writer = _FormatWriter(EXPORT_ENCODERS[base](columns), opened)
+            writer._emit(writer.encoder.header())
+            self.writers.append(writer)
+        if threads is None:
+            threads = (os.cpu_count() or 1) > 1
+        self._pool = None
+        if threads and len(self.writers) > 1:
+            self._pool = ThreadPoolExecutor(
+                max_workers=len(self.writers), thread_name_prefix="export"
+            )
+        self._pending: list[Future] = []
+        self.seconds += time.perf_counter() - started
 
-import pandas as pd
+    def _fan_out(self, method: str, *args: object) -> None:
+        # Предыдущая порция должна быть записана: в памяти не больше двух порций,
+        # а каждый формат получает порции по порядку
+        self._wait()
+        for writer in self.writers:
+            if self._pool is None:
+                getattr(writer, method)(*args)
+            else:
+                self._pending.append(self._pool.submit(getattr(writer, method), *args))
 
+    def _wait(self) -> None:
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
 
-def main() -> None:
-    print("=" * 60)
-    print("РАБОТА С ДАТАСЕТОМ TITANIC")
-    print("=" * 60)
+    def write(self, rows: list[tuple]) -> None:
+        started = time.perf_counter()
+        self._fan_out("write", rows)
+        self.rows += len(rows)
+        self.seconds += time.perf_counter() - started
+
+    def close(self) -> list[str]:
+        started = time.perf_counter()
+        try:
+            self._fan_out("close")
+            self._wait()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+            if self._parts_pool is not None:
+                self._parts_pool.shutdown()
+        for writer in self.writers:
+            digest = writer.digest.hexdigest()
+            for file in writer.files.values():
+                stored = self.previous.get(file.path)
+                if (
+                    stored is not None
+                    and stored[0] == digest
+                    and os.path.exists(file.path)
+                    and _export_size(file.path) == stored[1]
+                ):
+                    file.discard()
+                    self.unchanged.add(file.path)
+                else:
+                    file.commit()
+        self.seconds += time.perf_counter() - started
+        return self.paths
 
-    # Проверяем наличие файлов датасета
-    csv_files = ["train.csv", "test.csv", "gender_submission.csv"]
-    missing_files = []
+    def stats(self) -> dict[str, dict]:
+        """Замеры по файлам после close().
 
-    for file in csv_files:
-        if not os.path.exists(file):
-            missing_files.append(file)
+        encode_s - кодирование (общее для вариантов формата), write_s - сжатие
+        и запись, bytes - размер файла, mb_per_s - мегабайты закодированного
+        текста в секунду кодирования и записи этого файла, sha256 - дайджест
+        текста до сжатия, unchanged - файл оставлен прежним.
+        """
+        stats = {}
+        for writer in self.writers:
+            for fmt, write_s in writer.write_s.items():
+                path = self._paths[fmt]
+                seconds = writer.encode_s + write_s
+                stats[fmt] = {
+                    "encode_s": writer.encode_s,
+                    "write_s": write_s,
+                    "bytes": _export_size(path),
+                    "mb_per_s": writer.raw_bytes / 2**20 / seconds if seconds else 0.0,
+                    "sha256": writer.digest.hexdigest(),
+                    "unchanged": path in self.unchanged,
+                }
+        return stats
 
-    if missing_files:
-        print(f"⚠️  Отсутствуют файлы датасета: {', '.join(missing_files)}")
-        print("Пожалуйста, скачайте датасет Titanic с Kaggle:")
-        print("https://www.kaggle.com/c/titanic/data")
-        print(
-            "И поместите файлы train.csv, test.csv и gender_submission.csv в текущую папку"
+    def abort(self) -> None:
+        """Закрывает и удаляет временные файлы; прежние файлы остаются"""
+        for future in self._pending:
+            future.exception()
+        if self._pool is not None:
+            self._pool.shutdown()
+        for writer in self.writers:
+            if isinstance(writer, _ShardedWriter):
+                writer.cancel()
+        if self._parts_pool is not None:
+            self._parts_pool.shutdown()
+        for writer in self.writers:
+            if isinstance(writer, NpyBundleWriter):
+                for column in writer.columns:
+                    column._file.close()
+            for file in writer.files.values():
+                if isinstance(file, _AtomicFile):
+                    try:
+                        file.close()
+                    except Exception:
+                        pass
+                file.discard()
+
+
+def load_export_digests(conn: sqlite3.Connection) -> dict[str, tuple[str, int]]:
+    """Дайджесты и размеры файлов экспорта с прошлых запусков: {путь: (sha256, байты)}"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {EXPORT_DIGESTS_TABLE} (
+            path TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            written_at REAL NOT NULL
         )
-        return
+        """)
+    conn.commit()
+    return {
+        path: (digest, size)
+        for path, digest, size in conn.execute(
+            f"SELECT path, digest, bytes FROM {EXPORT_DIGESTS_TABLE}"
+        )
+    }
 
-    print("✓ Файлы датасета найдены")
 
-    # Шаг 1: Создаем соединение с базой данных
-    conn: sqlite3.Connection = sqlite3.connect("titanic_database.db")
-    cursor: sqlite3.Cursor = conn.cursor()
+def store_export_digests(conn: sqlite3.Connection, result: QueryResult) -> None:
+    """Запоминает дайджесты переписанных файлов экспорта результата"""
+    now = time.time()
+    entries = []
+    for fmt, path in zip(result.query.outputs, result.outputs):
+        stats = result.export_stats[fmt]
+        if not stats["unchanged"]:
+            entries.append(
+                (path, stats["sha256"], stats["bytes"], result.total_rows, now)
+            )
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {EXPORT_DIGESTS_TABLE} VALUES (?, ?, ?, ?, ?)",
+        entries,
+    )
+    conn.commit()
 
-    print("\n1. ЗАГРУЗКА ДАННЫХ В БАЗУ...")
 
-    # Загружаем тренировочные данные
-    train_df = pd.read_csv("train.csv")
-    train_df.to_sql("passengers_train", conn, if_exists="replace", index=False)
-    print(f"✓ Таблица 'passengers_train' создана: {len(train_df)} записей")
+class _ProgressMonitor:
+    """Считает шаги виртуальной машины SQLite и трассирует выражения.
 
-    # Загружаем тестовые данные
-    test_df = pd.read_csv("test.csv")
-    test_df.to_sql("passengers_test", conn, if_exists="replace", index=False)
-    print(f"   ✓ Таблица 'passengers_test' создана: {len(test_df)} записей")
+    Обработчик прогресса вызывается каждые interval инструкций VDBE, поэтому
+    число шагов известно с точностью до interval. mark() относит шаги,
+    сделанные после предыдущей отметки, к фазе выполнения запроса.
 
-    # Загружаем данные для submission
-    submission_df = pd.read_csv("gender_submission.csv")
-    submission_df.to_sql("submission_template", conn, if_exists="replace", index=False)
-    print(f"   ✓ Таблица 'submission_template' создана: {len(submission_df)} записей")
+    Если задан бюджет, обработчик возвращает 1 при его превышении: SQLite
+    прерывает выражение с OperationalError, а причина остается в exceeded.
+    """
 
-    # Создаем объединенную таблицу для анализа
-    combined_df = pd.concat([train_df, test_df], ignore_index=True)
-    combined_df.to_sql("all_passengers", conn, if_exists="replace", index=False)
-    print(f"   ✓ Таблица 'all_passengers' создана: {len(combined_df)} записей")
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        interval: int = PROFILE_VM_INTERVAL,
+        budget: QueryBudget | None = None,
+    ) -> None:
+        self.conn = conn
+        self.interval = interval
+        self.budget = budget or QueryBudget()
+        self.calls = 0
+        self.statements: list[str] = []
+        self.steps: dict[str, int] = {}
+        self.exceeded: str | None = None
+        self.started = time.perf_counter()
+        self._marked = 0
 
-    # Шаг 2: Выполняем запросы
-    print("\n2. ВЫПОЛНЕНИЕ SQL-ЗАПРОСОВ...")
+    def __enter__(self) -> "_ProgressMonitor":
+        self.started = time.perf_counter()
+        self.conn.set_progress_handler(self._progress, self.interval)
+        self.conn.set_trace_callback(self.statements.append)
+        return self
 
-    # Список запросов с описанием
-    queries: list[dict[str, str]] = [
-        {
-            "name": "1. Первые 10 пассажиров из тренировочной выборки",
-            "sql": "SELECT PassengerId, Name, Sex, Age, Survived FROM passengers_train LIMIT 10;",
-        },
-        {
-            "name": "2. Общая статистика по выживанию",
-            "sql": """
-            SELECT
-                COUNT(*) as total_passengers,
-                SUM(Survived) as survived,
-                ROUND(AVG(Survived) * 100, 2) as survival_rate_percent
-            FROM passengers_train;
-            """,
-        },
-        {
-            "name": "3. Выживаемость по полу",
-            "sql": """
-            SELECT
-                Sex,
-                COUNT(*) as total,
-                SUM(Survived) as survived,
-                ROUND(AVG(Survived) * 100, 2) as survival_rate_percent
-            FROM passengers_train
-            GROUP BY Sex
-            ORDER BY survival_rate_percent DESC;
-            """,
-        },
-        {
-            "name": "4. Выживаемость по классу каюты",
-            "sql": """
-            SELECT
-                Pclass,
-                COUNT(*) as total,
-                SUM(Survived) as survived,
-                ROUND(AVG(Survived) * 100, 2) as survival_rate_percent
-            FROM passengers_train
-            GROUP BY Pclass
-            ORDER BY Pclass;
-            """,
-        },
-        {
-            "name": "5. Статистика по возрасту",
-            "sql": """
-            SELECT
-                COUNT(*) as total,
-                ROUND(AVG(Age), 2) as avg_age,
-                MIN(Age) as min_age,
-                MAX(Age) as max_age,
-                COUNT(CASE WHEN Age < 18 THEN 1 END) as children
-            FROM all_passengers
-            WHERE Age IS NOT NULL;
-            """,
-        },
-        {
-            "name": "6. Топ-5 самых дорогих билетов",
-            "sql": """
-            SELECT PassengerId, Name, Pclass, Fare, Embarked
-            FROM all_passengers
-            WHERE Fare IS NOT NULL
-            ORDER BY Fare DESC
-            LIMIT 5;
-            """,
-        },
-        {
-            "name": "7. JOIN: Объединение тестовых данных с шаблоном submission",
-            "sql": """
-            SELECT
-                t.PassengerId,
-                t.Name,
-                t.Sex,
-                t.Age,
-                t.Pclass,
-                s.Survived as predicted_survival
-            FROM passengers_test t
-            LEFT JOIN submission_template s
-            ON t.PassengerId = s.PassengerId
-            ORDER BY t.PassengerId
-            LIMIT 15;
-            """,
-        },
-        {
-            "name": "8. JOIN: Детальный анализ семьи (Сибли + Родители/Дети)",
-            "sql": """
-            SELECT
-                Pclass,
-                Sex,
-                AVG(SibSp) as avg_siblings_spouses,
-                AVG(Parch) as avg_parents_children,
-                AVG(SibSp + Parch) as avg_family_size,
-                COUNT(*) as passenger_count
-            FROM all_passengers
-            GROUP BY Pclass, Sex
-            ORDER BY Pclass, Sex;
+    def __exit__(self, *exc_info: object) -> None:
+        self.conn.set_progress_handler(None, 0)
+        self.conn.set_trace_callback(None)
+
+    @property
+    def elapsed_s(self) -> float:
+        return time.perf_counter() - self.started
+
+    def _progress(self) -> int:
+        self.calls += 1
+        max_steps = self.budget.max_vm_steps
+        if max_steps is not None and self.calls * self.interval > max_steps:
+            self.exceeded = "vm_steps"
+            return 1
+        timeout_s = self.budget.timeout_s
+        if timeout_s is not None and self.elapsed_s > timeout_s:
+            self.exceeded = "timeout"
+            return 1
+        return 0
+
+    def mark(self, phase: str) -> None:
+        steps = self.calls * self.interval
+        self.steps[phase] = steps - self._marked
+        self._marked = steps
+
+
+def _materialized_bytes(rows: list[tuple]) -> int:
+    """Объем значений результата: строки в UTF-8 и BLOB по длине, числа по 8 байт"""
+    total = 0
+    for row in rows:
+        for value in row:
+            if isinstance(value, str):
+                total += len(value.encode("utf-8"))
+            elif isinstance(value, bytes):
+                total += len(value)
+            elif value is not None:
+                total += 8
+    return total
+
+
+class QueryRunner:
+    """Выполняет запросы каталога и замеряет фазы выполнения.
+
+    Скомпилированные выражения хранятся в кэше соединения sqlite3
+    (cached_statements) по тексту SQL, поэтому повторный запуск того же
+    запроса с другими параметрами не компилирует его заново. Модуль sqlite3
+    не разделяет подготовку и первый шаг выполнения, поэтому они замеряются
+    вместе как execute_s.
+
+    С бэкендом numpy запросы, у которых в каталоге указано ядро, считаются
+    векторно по колоночному представлению таблиц; время чтения колонок из
+    базы замеряется отдельно как columns_s.
+
+    С profile=True на время запроса ставятся обработчик прогресса и трассировка
+    выражений: в result.profile попадают шаги VDBE по фазам, выполненные
+    выражения, число строк и объем материализованных значений.
+
+    Бюджет (время и шаги VDBE; у запроса из каталога может быть свой)
+    проверяется тем же обработчиком прогресса: выражение, вышедшее за него,
+    прерывается, и run() поднимает QueryBudgetExceeded. Ядро numpy по уже
+    прочитанным колонкам прервать нельзя, поэтому запрос с бюджетом
+    выполняется в SQLite.
+
+    С stream результат SQL-запроса выбирается порциями fetchmany и сразу
+    пишется во все форматы экспорта; в памяти остаются только первые
+    stream.keep_rows строк.
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        backend: str = "sqlite",
+        profile: bool = False,
+        budget: QueryBudget | None = None,
+        stream: StreamExport | None = None,
+    ) -> None:
+        self.conn = conn
+        self.backend = backend
+        self.profile = profile
+        self.budget = budget or QueryBudget()
+        self.stream = stream
+        self.store = ColumnStore(conn)
+
+    def run(
+        self, query: CatalogQuery, params: dict[str, object] | None = None
+    ) -> QueryResult:
+        bound = {**query.params, **(params or {})}
+        budget = self.budget.merged(query.budget)
+        monitor = None
+        if self.profile:
+            monitor = _ProgressMonitor(self.conn, PROFILE_VM_INTERVAL, budget)
+        elif budget != QueryBudget():
+            monitor = _ProgressMonitor(self.conn, BUDGET_VM_INTERVAL, budget)
+
+        try:
+            with monitor or nullcontext():
+                # Вычисления ядра по колонкам в памяти обработчик прогресса
+                # не прерывает, поэтому запрос с бюджетом выполняет SQLite
+                if (
+                    self.backend == "numpy"
+                    and query.kernel is not None
+                    and budget == QueryBudget()
+                ):
+                    result = self._run_kernel(query, bound, monitor)
+                else:
+                    result = self._run_sql(query, bound, monitor)
+        except sqlite3.OperationalError:
+            if monitor is None or monitor.exceeded is None:
+                raise
+            raise QueryBudgetExceeded(
+                query,
+                monitor.exceeded,
+                monitor.elapsed_s,
+                monitor.calls * monitor.interval,
+            ) from None
+
+        if monitor is not None:
+            result.profile = {
+                "vm_steps": sum(monitor.steps.values()),
+                "vm_steps_by_phase": monitor.steps,
+                "statements": monitor.statements,
+                "rows": result.total_rows,
+                "bytes": (
+                    _materialized_bytes(result.rows)
+                    if result.value_bytes is None
+                    else result.value_bytes
+                ),
+            }
+        return result
+
+    def _run_sql(
+        self,
+        query: CatalogQuery,
+        bound: dict[str, object],
+        monitor: _ProgressMonitor | None,
+    ) -> QueryResult:
+        started = time.perf_counter()
+        cursor = self.conn.execute(query.sql, bound)
+        executed = time.perf_counter()
+        if monitor is not None:
+            monitor.mark("execute")
+        columns = [column[0] for column in cursor.description or []]
+        if self.stream is not None:
+            result = self._stream_rows(query, cursor, columns)
+        else:
+            rows = cursor.fetchall()
+            result = QueryResult(
+                query,
+                columns,
+                rows,
+                {"fetch_s": time.perf_counter() - executed},
+            )
+        if monitor is not None:
+            monitor.mark("fetch")
+
+        result.params = bound
+        result.timings = {"execute_s": executed - started, **result.timings}
+        return result
+
+    def _stream_rows(
+        self, query: CatalogQuery, cursor: sqlite3.Cursor, columns: list[str]
+    ) -> QueryResult:
+        assert self.stream is not None
+        export = ResultExport(
+            query, columns, previous=self.stream.digests, shard=self.stream.shard
+        )
+        kept: list[tuple] = []
+        fetch_s = 0.0
+        value_bytes = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                batch = cursor.fetchmany(self.stream.batch_rows)
+                fetch_s += time.perf_counter() - started
+                if not batch:
+                    break
+                export.write(batch)
+                if self.profile:
+                    value_bytes += _materialized_bytes(batch)
+                if len(kept) < self.stream.keep_rows:
+                    kept.extend(batch[: self.stream.keep_rows - len(kept)])
+        except BaseException:
+            export.abort()
+            raise
+        outputs = export.close()
+
+        timings = {"fetch_s": fetch_s}
+        if query.outputs:
+            timings["export_s"] = export.seconds
+        result = QueryResult(query, columns, kept, timings)
+        result.row_count = export.rows
+        if self.profile:
+            result.value_bytes = value_bytes
+        result.outputs = outputs
+        result.export_stats = export.stats()
+        return result
+
+    def _run_kernel(
+        self,
+        query: CatalogQuery,
+        bound: dict[str, object],
+        monitor: _ProgressMonitor | None,
+    ) -> QueryResult:
+        assert query.kernel is not None
+        kernel = NUMPY_KERNELS[query.kernel]
+        loaded_s = self.store.load_s
+        started = time.perf_counter()
+        columns, rows = kernel(self.store)
+        elapsed = time.perf_counter() - started
+        columns_s = self.store.load_s - loaded_s
+        if monitor is not None:
+            # Шаги VDBE здесь - только чтение колонок в ColumnStore
+            monitor.mark("columns")
+
+        timings = {"columns_s": columns_s, "execute_s": elapsed - columns_s}
+        return QueryResult(query, columns, rows, timings, bound, backend="numpy")
+
+
+def normalize_sql(sql: str) -> str:
+    """Схлопывает пробелы вне строковых литералов и убирает завершающую ';'"""
+    normalized = re.sub(
+        r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|\s+""",
+        lambda match: match.group(1) or " ",
+        sql,
+    )
+    return normalized.strip().rstrip(";").strip()
+
+
+def referenced_tables(conn: sqlite3.Connection, sql: str) -> list[str]:
+    """Находит таблицы, которые читает запрос; представления раскрываются"""
+    objects = {
+        name.lower(): (name, kind, definition)
+        for name, kind, definition in conn.execute(
+            "SELECT name, type, sql FROM sqlite_master WHERE type IN ('table', 'view')"
+        )
+    }
+    found: set[str] = set()
+    pending = [sql]
+    while pending:
+        text = re.sub(r"'(?:[^']|'')*'", "''", pending.pop())
+        for word in set(re.findall(r"[A-Za-z_][A-Za-z0-9_]*", text)):
+            obj = objects.get(word.lower())
+            if obj is None or obj[0] in found:
+                continue
+            name, kind, definition = obj
+            found.add(name)
+            if kind == "view":
+                pending.append(definition)
+    return sorted(name for name in found if objects[name.lower()][1] == "table")
+
+
+def _ensure_table_versions(conn: sqlite3.Connection) -> None:
+    """Создает таблицу версий данных"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+        """)
+
+
+def bump_table_versions(conn: sqlite3.Connection, tables: list[str]) -> None:
+    """Увеличивает версию данных таблиц после их изменения"""
+    _ensure_table_versions(conn)
+    conn.executemany(
+        f"""
+        INSERT INTO {VERSIONS_TABLE} (table_name, version) VALUES (?, 1)
+        ON CONFLICT(table_name) DO UPDATE SET version = version + 1
+        """,
+        [(table,) for table in tables],
+    )
+    conn.commit()
+
+
+def install_version_triggers(conn: sqlite3.Connection) -> None:
+    """Ставит триггеры, увеличивающие версию таблицы при любом изменении строк.
+
+    Загрузка пересоздает таблицы вместе с триггерами, поэтому они ставятся
+    после нее; без них изменения в обход загрузки оставляли бы кэш устаревшим.
+    """
+    _ensure_table_versions(conn)
+    for table in (*DATA_TABLES, COMBINED_TABLE):
+        if _object_type(conn, table) != "table":
+            continue
+        for event in ("insert", "update", "delete"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_version_{table}_{event}
+                AFTER {event.upper()} ON {_quote(table)}
+                BEGIN
+                    INSERT INTO {VERSIONS_TABLE} (table_name, version)
+                    VALUES ('{table}', 1)
+                    ON CONFLICT(table_name) DO UPDATE SET version = version + 1;
+                END
+                """)
+    conn.commit()
+
+
+def table_versions(conn: sqlite3.Connection, tables: list[str]) -> dict[str, int]:
+    """Текущие версии данных таблиц (0 для таблиц без записи)"""
+    versions = dict.fromkeys(tables, 0)
+    for table in tables:
+        row = conn.execute(
+            f"SELECT version FROM {VERSIONS_TABLE} WHERE table_name = ?", (table,)
+        ).fetchone()
+        if row is not None:
+            versions[table] = row[0]
+    return versions
+
+
+class ResultCache:
+    """Кэш результатов запросов в базе с вытеснением LRU и по размеру.
+
+    Ключ - нормализованный SQL, параметры и версии данных всех таблиц, на
+    которые ссылается запрос. Попадание читает только таблицы кэша и версий,
+    не трогая таблицы пассажиров. Записи с устаревшими версиями вытесняются
+    первыми, затем самые давно использованные, пока кэш не уложится
+    в лимиты по числу записей и объему.
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        max_entries: int = 256,
+        max_bytes: int = 64 * 2**20,
+    ) -> None:
+        self.conn = conn
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        install_version_triggers(conn)
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {RESULT_CACHE_TABLE} (
+                cache_key TEXT PRIMARY KEY,
+                sql TEXT NOT NULL,
+                versions TEXT NOT NULL,
+                columns TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            );
+            """)
+        conn.commit()
+
+    def _key(self, sql: str, params: dict[str, object]) -> tuple[str, dict[str, int]]:
+        versions = table_versions(self.conn, referenced_tables(self.conn, sql))
+        material = json.dumps(
+            [normalize_sql(sql), params, versions], sort_keys=True, default=str
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest(), versions
+
+    def get(
+        self, query: CatalogQuery, params: dict[str, object] | None = None
+    ) -> QueryResult | None:
+        bound = {**query.params, **(params or {})}
+        started = time.perf_counter()
+        key, _ = self._key(query.sql, bound)
+        row = self.conn.execute(
+            f"SELECT columns, payload FROM {RESULT_CACHE_TABLE} WHERE cache_key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.conn.execute(
+            f"""
+            UPDATE {RESULT_CACHE_TABLE}
+            SET hits = hits + 1, last_used_at = ?
+            WHERE cache_key = ?
             """,
-        },
-        {
-            "name": "9. Пассажиры с максимальным размером семьи",
-            "sql": """
-            SELECT
-                PassengerId,
-                Name,
-                Pclass,
-                SibSp,
-                Parch,
-                (SibSp + Parch) as family_size,
-                CASE
-                    WHEN (SibSp + Parch) > 4 THEN 'Большая семья'
-                    WHEN (SibSp + Parch) > 1 THEN 'Средняя семья'
-                    ELSE 'Маленькая семья/Один'
-                END as family_category
-            FROM all_passengers
-            WHERE SibSp + Parch > 0
-            ORDER BY family_size DESC
-            LIMIT 10;
+            (time.time(), key),
+        )
+        self.conn.commit()
+        self.stats["hits"] += 1
+        rows = [tuple(values) for values in json.loads(zlib.decompress(row[1]))]
+        timings = {"cache_s": time.perf_counter() - started}
+        return QueryResult(
+            query, json.loads(row[0]), rows, timings, bound, cache_hit=True
+        )
+
+    def put(self, result: QueryResult) -> None:
+        if not result.complete:
+            # Потоковый результат без части строк кэшировать нечего
+            return
+        try:
+            payload = zlib.compress(json.dumps(result.rows).encode("utf-8"))
+        except TypeError:
+            # Значения, не представимые в JSON (BLOB), не кэшируются
+            return
+        key, versions = self._key(result.query.sql, result.params)
+        now = time.time()
+        self.conn.execute(
+            f"""
+            INSERT OR REPLACE INTO {RESULT_CACHE_TABLE}
+                (cache_key, sql, versions, columns, payload, size_bytes,
+                 created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """,
-        },
+            (
+                key,
+                normalize_sql(result.query.sql),
+                json.dumps(versions),
+                json.dumps(result.columns),
+                payload,
+                len(payload),
+                now,
+                now,
+            ),
+        )
+        self._evict()
+        self.conn.commit()
+
+    def _evict(self) -> None:
+        evicted = []
+        for key, versions in self.conn.execute(
+            f"SELECT cache_key, versions FROM {RESULT_CACHE_TABLE}"
+        ).fetchall():
+            stored = json.loads(versions)
+            if table_versions(self.conn, list(stored)) != stored:
+                evicted.append(key)
+
+        entries = self.conn.execute(f"""
+            SELECT cache_key, size_bytes FROM {RESULT_CACHE_TABLE}
+            ORDER BY last_used_at, rowid
+            """).fetchall()
+        live = [(key, size) for key, size in entries if key not in evicted]
+        count = len(live)
+        total = sum(size for _, size in live)
+        for key, size in live:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evicted.append(key)
+            count -= 1
+            total -= size
+
+        self.conn.executemany(
+            f"DELETE FROM {RESULT_CACHE_TABLE} WHERE cache_key = ?",
+            [(key,) for key in evicted],
+        )
+        self.stats["evictions"] += len(evicted)
+
+
+def open_readonly_connections(db_path: str, count: int) -> list[sqlite3.Connection]:
+    """Открывает соединения только для чтения (mode=ro), пригодные для потоков"""
+    # urllib.request тянет за собой http.client и email - импорт по требованию
+    from urllib.request import pathname2url
+
+    uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+    return [
+        sqlite3.connect(uri, uri=True, check_same_thread=False) for _ in range(count)
+    ]
+
+
+def _run_shared_paths(
+    conn: sqlite3.Connection,
+    queries: list[CatalogQuery],
+    budget: QueryBudget,
+    summaries: bool,
+    shared_scan: bool,
+) -> dict[str, QueryResult | Exception]:
+    """Сводки и общие проходы для запросов с одним бюджетом.
+
+    Чтения идут под обработчиком прогресса с этим бюджетом и проверяются
+    целиком: общий проход одной таблицы расходует бюджет каждого своего
+    запроса. При превышении бюджета или ошибке каждый запрос, на который
+    отвечал этот способ, получает исключение и дальше не выполняется.
+    """
+    paths = []
+    if summaries:
+        paths.append((run_summary_queries, _summary_answers))
+    if shared_scan:
+        paths.append((run_shared_scans, _shared_scan_answers))
+
+    results: dict[str, QueryResult | Exception] = {}
+    for run, answers in paths:
+        queries = [query for query in queries if query.key not in results]
+        monitor = None
+        if budget != QueryBudget():
+            monitor = _ProgressMonitor(conn, BUDGET_VM_INTERVAL, budget)
+        try:
+            with monitor or nullcontext():
+                results.update(run(conn, queries))
+        except Exception as e:
+            for query in filter(answers, queries):
+                error: Exception = e
+                if monitor is not None and monitor.exceeded is not None:
+                    error = QueryBudgetExceeded(
+                        query,
+                        monitor.exceeded,
+                        monitor.elapsed_s,
+                        monitor.calls * monitor.interval,
+                    )
+                results[query.key] = error
+    return results
+
+
+def iter_query_results(
+    conn: sqlite3.Connection,
+    catalog: list[CatalogQuery],
+    workers: int = 1,
+    cache: ResultCache | None = None,
+    backend: str = "sqlite",
+    shared_scan: bool = False,
+    summaries: bool = False,
+    profile: bool = False,
+    budget: QueryBudget | None = None,
+    stream: StreamExport | None = None,
+) -> Iterator[tuple[CatalogQuery, QueryResult | Exception]]:
+    """Выполняет запросы каталога и отдает результаты в порядке каталога.
+
+    Если передан кэш, попадания отдаются без выполнения запроса, а новые
+    результаты сохраняются в кэш (запись идет через основное соединение).
+    С shared_scan агрегатные запросы бэкенда sqlite выполняются общими
+    проходами по таблицам (run_shared_scans), остальные - как обычно.
+    С summaries агрегаты, которые можно свернуть из сводных таблиц,
+    считаются по ним до всех остальных способов.
+    Сводки и общие проходы выполняются под обработчиком прогресса с бюджетом
+    своих запросов (см. _run_shared_paths).
+    Со stream SQL-запросы экспортируются по ходу выборки (см. QueryRunner).
+    """
+    hits: dict[int, QueryResult] = {}
+    if cache is not None:
+        for i, query in enumerate(catalog):
+            hit = cache.get(query)
+            if hit is not None:
+                hits[i] = hit
+
+    pending = [query for i, query in enumerate(catalog) if i not in hits]
+    shared: dict[str, QueryResult | Exception] = {}
+    if summaries or (shared_scan and backend == "sqlite"):
+        # Сводки и общие проходы выполняются отдельно для каждого бюджета
+        groups: list[tuple[QueryBudget, list[CatalogQuery]]] = []
+        for query in pending:
+            query_budget = (budget or QueryBudget()).merged(query.budget)
+            for known, members in groups:
+                if known == query_budget:
+                    members.append(query)
+                    break
+            else:
+                groups.append((query_budget, [query]))
+        for query_budget, members in groups:
+            shared.update(
+                _run_shared_paths(
+                    conn,
+                    members,
+                    query_budget,
+                    summaries,
+                    shared_scan and backend == "sqlite",
+                )
+            )
+    pending = [query for query in pending if query.key not in shared]
+
+    outcomes = _execute_queries(
+        conn, pending, workers, backend, profile, budget, stream
+    )
+    for i, query in enumerate(catalog):
+        if i in hits:
+            yield query, hits[i]
+            continue
+        if query.key in shared:
+            outcome = shared[query.key]
+        else:
+            _, outcome = next(outcomes)
+        if cache is not None and isinstance(outcome, QueryResult):
+            cache.put(outcome)
+        yield query, outcome
+
+
+def _execute_queries(
+    conn: sqlite3.Connection,
+    catalog: list[CatalogQuery],
+    workers: int,
+    backend: str = "sqlite",
+    profile: bool = False,
+    budget: QueryBudget | None = None,
+    stream: StreamExport | None = None,
+) -> Iterator[tuple[CatalogQuery, QueryResult | Exception]]:
+    """Выполняет запросы по очереди или в пуле потоков, сохраняя порядок.
+
+    При workers > 1 база переводится в WAL, а запросы распределяются по пулу
+    потоков, у каждого из которых свое соединение только для чтения.
+    sqlite3 отпускает GIL на время работы движка, поэтому независимые
+    запросы действительно выполняются параллельно.
+    """
+    if backend == "numpy":
+        # Ядро numpy по прочитанным колонкам бюджет не прерывает (см. QueryRunner)
+        fallback = [
+            query.key
+            for query in catalog
+            if query.kernel is not None
+            and (budget or QueryBudget()).merged(query.budget) != QueryBudget()
+        ]
+        if fallback:
+            print(
+                "⚠️  Ядра numpy не прерываются по бюджету, запросы с бюджетом"
+                f" выполняются в SQLite: {', '.join(fallback)}"
+            )
+    if workers <= 1:
+        runner = QueryRunner(conn, backend, profile, budget, stream)
+        for query in catalog:
+            try:
+                yield query, runner.run(query)
+            except Exception as e:
+                yield query, e
+        return
+
+    conn.commit()
+    conn.execute("PRAGMA journal_mode = WAL")
+    db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    runners: queue.SimpleQueue[QueryRunner] = queue.SimpleQueue()
+    connections = open_readonly_connections(db_path, workers)
+    for readonly in connections:
+        runners.put(QueryRunner(readonly, backend, profile, budget, stream))
+
+    def run(query: CatalogQuery) -> QueryResult:
+        runner = runners.get()
+        try:
+            return runner.run(query)
+        finally:
+            runners.put(runner)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(query, pool.submit(run, query)) for query in catalog]
+            for query, future in futures:
+                try:
+                    yield query, future.result()
+                except Exception as e:
+                    yield query, e
+    finally:
+        for readonly in connections:
+            readonly.close()
+
+
+def count_table_passes(conn: sqlite3.Connection, results: list[QueryResult]) -> int:
+    """Число полных проходов по таблицам, которые понадобились результатам.
+
+    Общий проход и чтение колонок для numpy считаются один раз на таблицу,
+    ответы по сводным таблицам проходов не требуют.
+    Запрос SQLite считается проходом, если не останавливается на LIMIT:
+    план без временного B-дерева отдает строки в LIMIT по мере чтения.
+    """
+    shared: set[str] = set()
+    passes = 0
+    for result in results:
+        if result.summary_table is not None:
+            continue
+        if result.shared_scan is not None:
+            shared.add(result.shared_scan)
+        elif result.backend == "numpy":
+            shared.update(referenced_tables(conn, result.query.sql))
+        else:
+            plan = [
+                row[3]
+                for row in conn.execute(
+                    "EXPLAIN QUERY PLAN " + result.query.sql, result.params
+                )
+            ]
+            has_limit = re.search(r"\bLIMIT\b", result.query.sql, re.I) is not None
+            sorts = any("TEMP B-TREE" in step for step in plan)
+            passes += 0 if has_limit and not sorts else 1
+    return passes + len(shared)
+
+
+def explain_query_plan(conn: sqlite3.Connection, query: CatalogQuery) -> list[str]:
+    """План EXPLAIN QUERY PLAN с параметрами по умолчанию; отступ - глубина узла"""
+    depth: dict[int, int] = {0: -1}
+    steps = []
+    for node, parent, _, detail in conn.execute(
+        "EXPLAIN QUERY PLAN " + query.sql, query.params
+    ):
+        depth[node] = depth.get(parent, -1) + 1
+        steps.append("  " * depth[node] + detail)
+    return steps
+
+
+def capture_query_plans(
+    conn: sqlite3.Connection, catalog: list[CatalogQuery]
+) -> dict[str, list[str]]:
+    """Планы всех запросов каталога по ключу запроса"""
+    return {query.key: explain_query_plan(conn, query) for query in catalog}
+
+
+def _plan_features(plan: list[str]) -> dict[str, int]:
+    """Сколько раз в плане встречается каждый признак из PLAN_REGRESSIONS"""
+    return {
+        feature: sum(1 for step in plan if re.search(pattern, step.strip()))
+        for feature, pattern in PLAN_REGRESSIONS.items()
+    }
+
+
+def compare_query_plans(
+    baseline: dict[str, list[str]], current: dict[str, list[str]]
+) -> tuple[list[str], list[str]]:
+    """Сравнивает планы с базовыми: (регрессии, прочие изменения)"""
+    regressions = []
+    changes = []
+    for key, plan in current.items():
+        if key not in baseline:
+            changes.append(f"{key}: нет базового плана")
+            continue
+        if plan == baseline[key]:
+            continue
+        before = _plan_features(baseline[key])
+        after = _plan_features(plan)
+        worse = [
+            f"{feature} {before[feature]} -> {after[feature]}"
+            for feature in PLAN_REGRESSIONS
+            if after[feature] > before[feature]
+        ]
+        if worse:
+            regressions.append(f"{key}: {', '.join(worse)}")
+        else:
+            changes.append(f"{key}: план изменился без ухудшения")
+    return regressions, changes
+
+
+def load_plan_baseline(path: str, mode: str) -> dict[str, list[str]] | None:
+    """Базовые планы для режима all_passengers (None, если их нет)"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("modes", {}).get(mode)
+
+
+def write_plan_baseline(plans: dict[str, list[str]], mode: str, path: str) -> None:
+    """Сохраняет планы как базовые для режима, не трогая другие режимы"""
+    baseline: dict = {"modes": {}}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            baseline = json.load(f)
+    baseline["sqlite_version"] = sqlite3.sqlite_version
+    baseline.setdefault("modes", {})[mode] = plans
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def check_query_plans(
+    conn: sqlite3.Connection, catalog: list[CatalogQuery], options: RunOptions
+) -> bool:
+    """Снимает или проверяет планы запросов; False - есть регрессии"""
+    plans = capture_query_plans(conn, catalog)
+    if options.capture_plans:
+        write_plan_baseline(plans, options.combined_mode, options.plans_path)
+        print(f"   ✓ Планы {len(plans)} запросов сохранены: {options.plans_path}")
+        return True
+
+    baseline = load_plan_baseline(options.plans_path, options.combined_mode)
+    if baseline is None:
+        print(f"   ✗ Нет базовых планов для режима '{options.combined_mode}'")
+        return False
+    regressions, changes = compare_query_plans(baseline, plans)
+    for message in changes:
+        print(f"   ↺ {message}")
+    for message in regressions:
+        print(f"   ✗ {message}")
+    if not regressions:
+        print(f"   ✓ Планы {len(plans)} запросов не хуже базовых")
+    return not regressions
+
+
+def export_result(
+    result: QueryResult,
+    previous: dict[str, tuple[str, int]] | None = None,
+    shard: ShardSpec | None = None,
+) -> list[str]:
+    """Записывает уже выбранный результат во все форматы, указанные в каталоге"""
+    export = ResultExport(result.query, result.columns, previous=previous, shard=shard)
+    try:
+        export.write(result.rows)
+    except BaseException:
+        export.abort()
+        raise
+    result.outputs = export.close()
+    result.timings["export_s"] = export.seconds
+    result.export_stats = export.stats()
+    return result.outputs
+
+
+def write_query_profile(
+    results: list[QueryResult],
+    path: str = PROFILE_PATH,
+    folded_path: str = PROFILE_FOLDED_PATH,
+) -> None:
+    """Сохраняет профили запросов в JSON и в свернутые стеки для flame graph.
+
+    Строка свернутого формата: "zad;<запрос>;<фаза> <микросекунды>".
+    """
+    entries = [
         {
-            "name": "10. Анализ по порту посадки",
-            "sql": """
-            SELECT
-                Embarked,
-                COUNT(*) as total_passengers,
-                ROUND(AVG(Fare), 2) as avg_fare,
-                ROUND(AVG(Age), 2) as avg_age,
-                SUM(Survived) as survived
-            FROM passengers_train
-            WHERE Embarked IS NOT NULL
-            GROUP BY Embarked
-            ORDER BY total_passengers DESC;
-            """,
-        },
+            "key": result.query.key,
+            "name": result.query.name,
+            "backend": result.backend,
+            "timings": result.timings,
+            "profile": result.profile,
+        }
+        for result in results
     ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
 
-    # Шаг 3: Выполняем запросы и экспортируем результаты
-    print("\n3. ЭКСПОРТ РЕЗУЛЬТАТОВ...")
+    with open(folded_path, "w", encoding="utf-8") as f:
+        for result in results:
+            for phase, seconds in result.timings.items():
+                microseconds = round(seconds * 1e6)
+                if microseconds > 0:
+                    stack = f"zad;{result.query.key};{phase.removesuffix('_s')}"
+                    f.write(f"{stack} {microseconds}\n")
+
+
+def write_run_report(report: dict, path: str = RUN_REPORT_PATH) -> None:
+    """Сохраняет отчет о выполнении запросов в JSON"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+# Действия, которые авторизатор разрешает соединениям сервиса: только чтение
+_READONLY_ACTIONS = frozenset(
+    {
+        sqlite3.SQLITE_SELECT,
+        sqlite3.SQLITE_READ,
+        sqlite3.SQLITE_FUNCTION,
+        sqlite3.SQLITE_RECURSIVE,
+    }
+)
+
+
+def _readonly_authorizer(action: int, *args: object) -> int:
+    return sqlite3.SQLITE_OK if action in _READONLY_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def latency_summary(seconds: Iterable[float]) -> dict[str, float]:
+    """Перцентили задержек по ближайшему рангу, в миллисекундах"""
+    values = sorted(seconds)
+    if not values:
+        return {}
+    summary = {
+        f"p{q}_ms": values[max(math.ceil(q / 100 * len(values)) - 1, 0)] * 1000
+        for q in (50, 95, 99)
+    }
+    summary["max_ms"] = values[-1] * 1000
+    return summary
+
+
+def _param_value(text: str) -> object:
+    """Параметр из строки запроса: числа передаются числами, остальное - строкой"""
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return text
+
+
+def _http_chunk(data: bytes) -> bytes:
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> tuple[str, str, dict[str, str], bytes] | None:
+    """Читает запрос HTTP/1.1; None - клиент закрыл соединение"""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, target, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while (header := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = header.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, target, headers, body
+
+
+async def _send_json(
+    writer: asyncio.StreamWriter, status: int, payload: object
+) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+
+
+class ServiceError(Exception):
+    """Ошибка запроса к сервису, о которой клиенту сообщается статусом HTTP"""
 
-    # Создаем папки для результатов
-    os.makedirs("csv_results", exist_ok=True)
-    os.makedirs("json_results", exist_ok=True)
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class QueryService:
+    """Резидентный сервис запросов к базе по HTTP/1.1 (TCP или Unix-сокет).
+
+    Держит открытыми pool_size соединений только для чтения (mode=ro
+    и авторизатор, разрешающий лишь SELECT) и пул потоков того же размера.
+    Запрос берет соединение из очереди, выполняется и выбирается порциями
+    по batch_rows строк в потоке пула, а порции в NDJSON отправляются
+    клиенту по мере выборки (Transfer-Encoding: chunked). Пока поток ждет
+    SQLite, цикл событий обслуживает остальных клиентов.
+
+    GET /health, GET /queries - каталог, GET /queries/<ключ>?параметр=значение -
+    запрос каталога, POST /sql с JSON {"sql": ..., "params": ...} - произвольный
+    SELECT, GET /stats - число запросов и перцентили задержек. Ошибка во время
+    выборки, когда ответ уже начат, приходит последней строкой {"error": ...}.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        catalog: list[CatalogQuery],
+        pool_size: int = 4,
+        batch_rows: int = SERVICE_BATCH_ROWS,
+        budget: QueryBudget | None = None,
+    ) -> None:
+        self.catalog = {query.key: query for query in catalog}
+        self.batch_rows = batch_rows
+        self.budget = budget or QueryBudget()
+        self.requests = 0
+        self.errors = 0
+        self.latencies: deque[float] = deque(maxlen=SERVICE_LATENCY_WINDOW)
+        self._connections = open_readonly_connections(db_path, pool_size)
+        for conn in self._connections:
+            conn.set_authorizer(_readonly_authorizer)
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="service"
+        )
+        self._pool: asyncio.Queue[sqlite3.Connection] | None = None
+
+    async def start(
+        self,
+        host: str = SERVICE_HOST,
+        port: int = SERVICE_PORT,
+        socket_path: str | None = None,
+    ) -> asyncio.Server:
+        """Запускает сервер в текущем цикле событий (port=0 - свободный порт)"""
+        self._pool = asyncio.Queue()
+        for conn in self._connections:
+            self._pool.put_nowait(conn)
+        if socket_path is not None:
+            return await asyncio.start_unix_server(self._handle, path=socket_path)
+        return await asyncio.start_server(self._handle, host, port)
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        for conn in self._connections:
+            conn.close()
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "pool_size": len(self._connections),
+            **latency_summary(self.latencies),
+        }
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        # Соединение клиента живет, пока он не закроет его (keep-alive)
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ValueError:
+                    await _send_json(writer, 400, {"error": "некорректный запрос"})
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                started = time.perf_counter()
+                failed = False
+                try:
+                    await self._respond(writer, method, target, body)
+                except ServiceError as e:
+                    self.errors += 1
+                    await _send_json(writer, e.status, {"error": str(e)})
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    # Непредвиденная ошибка: ответ 500, а соединение закрывается,
+                    # так как ответ мог быть уже начат
+                    failed = True
+                    self.errors += 1
+                    await _send_json(writer, 500, {"error": f"Внутренняя ошибка: {e}"})
+                self.requests += 1
+                self.latencies.append(time.perf_counter() - started)
+                if failed or headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(
+        self, writer: asyncio.StreamWriter, method: str, target: str, body: bytes
+    ) -> None:
+        url = urlsplit(target)
+        path = url.path.rstrip("/")
+        if method == "GET" and path == "/health":
+            await _send_json(writer, 200, {"status": "ok"})
+        elif method == "GET" and path == "/stats":
+            await _send_json(writer, 200, self.stats())
+        elif method == "GET" and path == "/queries":
+            catalog = [
+                {"key": query.key, "name": query.name, "params": query.params}
+                for query in self.catalog.values()
+            ]
+            await _send_json(writer, 200, catalog)
+        elif method == "GET" and path.startswith("/queries/"):
+            query = self.catalog.get(path.removeprefix("/queries/"))
+            if query is None:
+                raise ServiceError(404, f"Нет запроса '{path}' в каталоге")
+            params = {name: _param_value(value) for name, value in parse_qsl(url.query)}
+            await self._stream(
+                writer,
+                query.sql,
+                {**query.params, **params},
+                self.budget.merged(query.budget),
+            )
+        elif method == "POST" and path == "/sql":
+            try:
+                request = json.loads(body)
+            except ValueError:
+                raise ServiceError(400, "Тело запроса должно быть JSON") from None
+            if not isinstance(request, dict) or not isinstance(request.get("sql"), str):
+                raise ServiceError(400, 'Ожидается JSON {"sql": ..., "params": ...}')
+            params = request.get("params", [])
+            if not isinstance(params, (list, dict)):
+                raise ServiceError(400, "params - список или объект")
+            await self._stream(writer, request["sql"], params, self.budget)
+        else:
+            raise ServiceError(404, f"Нет ресурса {method} {url.path}")
+
+    def _execute(
+        self, conn: sqlite3.Connection, sql: str, params: list | dict
+    ) -> tuple[sqlite3.Cursor, NdjsonEncoder, bytes]:
+        try:
+            cursor = conn.execute(sql, params)
+        except (OverflowError, ValueError, TypeError) as e:
+            # Значение, которое нельзя связать: целое вне 64 бит, строка с NUL
+            raise ServiceError(400, f"Некорректный параметр запроса: {e}") from None
+        encoder = NdjsonEncoder([column[0] for column in cursor.description or []])
+        return cursor, encoder, self._fetch(cursor, encoder)
+
+    def _fetch(self, cursor: sqlite3.Cursor, encoder: NdjsonEncoder) -> bytes:
+        return encoder.encode(cursor.fetchmany(self.batch_rows)).encode("utf-8")
+
+    async def _stream(
+        self,
+        writer: asyncio.StreamWriter,
+        sql: str,
+        params: list | dict,
+        budget: QueryBudget,
+    ) -> None:
+        assert self._pool is not None
+        loop = asyncio.get_running_loop()
+        conn = await self._pool.get()
+        monitor = None
+        if budget != QueryBudget():
+            monitor = _ProgressMonitor(conn, BUDGET_VM_INTERVAL, budget)
+        cursor = None
+        try:
+            with monitor or nullcontext():
+                try:
+                    cursor, encoder, chunk = await loop.run_in_executor(
+                        self._executor, self._execute, conn, sql, params
+                    )
+                except sqlite3.Error as e:
+                    raise ServiceError(400, self._error_message(e, monitor)) from None
+
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/x-ndjson; charset=utf-8\r\n"
+                    b"Transfer-Encoding: chunked\r\n\r\n"
+                )
+                try:
+                    while chunk:
+                        writer.write(_http_chunk(chunk))
+                        await writer.drain()
+                        chunk = await loop.run_in_executor(
+                            self._executor, self._fetch, cursor, encoder
+                        )
+                except (sqlite3.Error, OverflowError, ValueError) as e:
+                    self.errors += 1
+                    error = {"error": self._error_message(e, monitor)}
+                    line = json.dumps(error, ensure_ascii=False) + "\n"
+                    writer.write(_http_chunk(line.encode("utf-8")))
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        finally:
+            if cursor is not None:
+                cursor.close()
+            self._pool.put_nowait(conn)
+
+    @staticmethod
+    def _error_message(error: Exception, monitor: _ProgressMonitor | None) -> str:
+        if monitor is not None and monitor.exceeded is not None:
+            limit = "времени" if monitor.exceeded == "timeout" else "шагов VDBE"
+            return f"Запрос прерван: превышен бюджет {limit}"
+        return str(error)
+
+
+def format_rows(columns: list[str], rows: list[tuple]) -> str:
+    """Строки результата таблицей с выравниванием по правому краю, без pandas"""
+    cells = [["NaN" if value is None else str(value) for value in row] for row in rows]
+    widths = [
+        max([len(name)] + [len(row[i]) for row in cells])
+        for i, name in enumerate(columns)
+    ]
+    return "\n".join(
+        "  ".join(cell.rjust(width) for cell, width in zip(line, widths))
+        for line in [columns, *cells]
+    )
+
+
+def _load_stage(conn: sqlite3.Connection, options: RunOptions) -> None:
+    """Шаг 1: загрузка изменившихся CSV в базу"""
+    print("\n1. ЗАГРУЗКА ДАННЫХ В БАЗУ...")
+    if options.chunk_rows:
+        print(f"   Потоковый режим: порции по {options.chunk_rows} строк")
+    if options.loader == "bulk":
+        print("   Массовая загрузка: executemany без журнала и fsync")
+    if options.workers > 1:
+        print(f"   Параллельная загрузка: {options.workers} процессов")
+
+    counts = load_data(conn, options)
+    for table in (*DATA_TABLES, COMBINED_TABLE):
+        if table in counts:
+            print(f"   ✓ Таблица '{table}' создана: {counts[table]} записей")
+        elif table == COMBINED_TABLE and options.combined_mode == "view":
+            print(f"   ✓ Представление '{table}' создано (UNION ALL)")
+        else:
+            print(f"   ↺ Таблица '{table}' не изменилась, загрузка пропущена")
+    if options.analyze:
+        print("   ✓ Статистика таблиц пересобрана (ANALYZE)")
+
+
+def _query_stage(
+    conn: sqlite3.Connection, options: RunOptions
+) -> tuple[list[QueryResult], ResultCache | None]:
+    """Шаги 2 и 3: запросы каталога и, если экспорт входит в stages, экспорт"""
+    # Шаг 2: Выполняем запросы
+    print("\n2. ВЫПОЛНЕНИЕ SQL-ЗАПРОСОВ...")
+    catalog = load_catalog(options.catalog_path, options.export_formats)
+    if options.query_names:
+        catalog = filter_catalog(catalog, options.query_names)
+        print(f"   Отбор по имени: {', '.join(options.query_names)}")
+    export = "export" in options.stages
+    if not export:
+        # Без экспорта строки результата только выбираются порциями
+        for query in catalog:
+            query.outputs = []
+    print(f"   Каталог: {len(catalog)} запросов из {options.catalog_path}")
+    if options.query_workers > 1:
+        print(f"   Параллельное выполнение: {options.query_workers} потоков (WAL)")
+    if options.backend == "numpy":
+        kernels = sum(query.kernel is not None for query in catalog)
+        print(f"   Бэкенд numpy: {kernels} агрегатных запросов считаются векторно")
+    elif options.shared_scan:
+        print("   Общие проходы: агрегаты по одной таблице за один проход")
+    if options.summary_tables:
+        print("   Сводные таблицы: агрегаты по ячейкам (Sex, Pclass, Embarked)")
+    report: dict = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "catalog": options.catalog_path,
+        "query_workers": options.query_workers,
+        "backend": options.backend,
+        "shared_scan": options.shared_scan,
+        "summary_tables": options.summary_tables,
+        "queries": [],
+    }
 
-    for i, query_info in enumerate(queries, 1):
-        query_name = query_info["name"]
-        sql_query = query_info["sql"]
+    # Шаг 3: Выполняем запросы и экспортируем результаты
+    if export:
+        print("\n3. ЭКСПОРТ РЕЗУЛЬТАТОВ...")
+        # Создаем папки для результатов
+        os.makedirs("csv_results", exist_ok=True)
+        os.makedirs("json_results", exist_ok=True)
+    else:
+        print("\n3. РЕЗУЛЬТАТЫ ЗАПРОСОВ (без экспорта)...")
 
-        print(f"\n   Запрос {i}: {query_name}")
-        if len(sql_query) > 80:
-            print(f"   SQL: {sql_query[:80]}...")
+    phase_started = time.perf_counter()
+    cache = None
+    if options.result_cache:
+        cache = ResultCache(conn, options.cache_max_entries, options.cache_max_bytes)
+    executed: list[QueryResult] = []
+    finished: list[QueryResult] = []
+    digests = load_export_digests(conn)
+    shard = None
+    if options.shard_rows is not None or options.shard_mb is not None:
+        shard = ShardSpec(
+            options.shard_rows,
+            None if options.shard_mb is None else int(options.shard_mb * 2**20),
+            options.export_workers,
+        )
+    results = iter_query_results(
+        conn,
+        catalog,
+        options.query_workers,
+        cache,
+        options.backend,
+        options.shared_scan,
+        options.summary_tables,
+        options.profile,
+        QueryBudget(options.query_timeout_s, options.query_max_vm_steps),
+        StreamExport(
+            options.export_batch_rows,
+            STREAM_CACHE_ROWS if cache is not None else PREVIEW_ROWS,
+            digests,
+            shard,
+        ),
+    )
+    for i, (query, outcome) in enumerate(results, 1):
+        print(f"\n   Запрос {i}: {query.name}")
+        if len(query.sql) > 80:
+            print(f"   SQL: {query.sql[:80]}...")
         else:
-            print(f"   SQL: {sql_query}")
+            print(f"   SQL: {query.sql}")
 
+        entry: dict = {"key": query.key, "name": query.name, "params": query.params}
         try:
-            # Выполняем запрос
-            df_result = pd.read_sql_query(sql_query, conn)
+            # Результат запроса или ошибка его выполнения
+            if isinstance(outcome, Exception):
+                raise outcome
+            result = outcome
 
-            # Экспорт в CSV
-            csv_filename = f"csv_results/query_{i:02d}.csv"
-            df_result.to_csv(csv_filename, index=False, encoding="utf-8")
+            # Экспорт во все форматы из каталога (потоковые уже записаны);
+            # файлы с неизменным результатом не переписываются.
+            # Без форматов (запуск только запросов) экспорта нет
+            paths = result.outputs
+            if query.outputs and not paths:
+                paths = export_result(result, digests, shard)
+            if paths:
+                store_export_digests(conn, result)
 
-            # Экспорт в JSON
-            json_filename = f"json_results/query_{i:02d}.json"
-            df_result.to_json(
-                json_filename, orient="records", indent=2, force_ascii=False
+            entry.update(
+                status="completed",
+                rows=result.total_rows,
+                backend=None if result.cache_hit else result.backend,
+                shared_scan=result.shared_scan,
+                summary_table=result.summary_table,
+                cache="hit" if result.cache_hit else "miss" if cache else None,
+                timings=result.timings,
+                outputs=paths,
+                formats=result.export_stats,
             )
 
-            print(f"   ✓ Результат: {len(df_result)} строк")
-            print(f"   ✓ CSV: {csv_filename}")
-            print(f"   ✓ JSON: {json_filename}")
+            finished.append(result)
+            if not result.cache_hit:
+                executed.append(result)
+            source = " (из кэша)" if result.cache_hit else ""
+            print(f"   ✓ Результат: {result.total_rows} строк{source}")
+            for fmt, path in zip(query.outputs, paths):
+                stats = result.export_stats[fmt]
+                note = ", без изменений" if stats["unchanged"] else ""
+                print(
+                    f"   ✓ {fmt.upper()}: {path} ({stats['bytes'] / 1024:.1f} КБ{note})"
+                )
 
-            # Выводим первые 3 строки для наглядности
-            if len(df_result) > 0:
+            # Выводим первые строки для наглядности
+            if result.rows:
                 print("   Пример данных:")
-                print(df_result.head(3).to_string(index=False))
+                print(format_rows(result.columns, result.rows[:PREVIEW_ROWS]))
 
+        except QueryBudgetExceeded as e:
+            entry.update(
+                status="timed_out",
+                budget=e.reason,
+                error=str(e),
+                timings={"elapsed_s": e.elapsed_s},
+                vm_steps=e.vm_steps,
+            )
+            print(f"   ✗ Запрос прерван: {e}")
         except Exception as e:
+            entry.update(status="failed", error=str(e))
             print(f"   ✗ Ошибка: {e}")
+        report["queries"].append(entry)
+
+    report["table_passes"] = count_table_passes(conn, executed)
+    report["statuses"] = {
+        status: sum(1 for entry in report["queries"] if entry["status"] == status)
+        for status in ("completed", "timed_out", "failed")
+    }
+    report["query_phase_s"] = time.perf_counter() - phase_started
+    if cache is not None:
+        report["result_cache"] = cache.stats
+    write_run_report(report)
+    if options.profile:
+        write_query_profile(finished)
+    print(f"\n   ✓ Запросы и экспорт: {report['query_phase_s']:.3f} с")
+    statuses = report["statuses"]
+    print(
+        f"   Выполнено: {statuses['completed']}, прервано: {statuses['timed_out']}, "
+        f"с ошибкой: {statuses['failed']}"
+    )
+    print(f"   ✓ Отчет о выполнении: {RUN_REPORT_PATH}")
+    if options.profile:
+        print(f"   ✓ Профили запросов: {PROFILE_PATH}, {PROFILE_FOLDED_PATH}")
+
+    return finished, cache
+
+
+def _serve_stage(options: RunOptions) -> None:
+    """Команда serve: сервис запросов работает до Ctrl+C"""
+    catalog = load_catalog(options.catalog_path)
+    budget = QueryBudget(options.query_timeout_s, options.query_max_vm_steps)
+    service = QueryService(DATABASE_PATH, catalog, options.serve_pool, budget=budget)
 
+    async def serve() -> None:
+        server = await service.start(
+            options.serve_host, options.serve_port, options.serve_socket
+        )
+        if options.serve_socket is not None:
+            address = f"unix:{options.serve_socket}"
+        else:
+            port = server.sockets[0].getsockname()[1]
+            address = f"http://{options.serve_host}:{port}"
+        print(f"\n   ✓ Сервис запросов: {address}, пул {options.serve_pool} соединений")
+        print("   GET /queries, GET /queries/<ключ>, POST /sql, GET /stats")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n   Сервис остановлен")
+    finally:
+        service.close()
+
+
+def _summary_stage(conn: sqlite3.Connection, cache: ResultCache | None) -> None:
+    """Шаг 4: сводный отчет по сохраненной статистике таблиц"""
     # Шаг 4: Создаем сводный отчет
     print("\n" + "=" * 60)
     print("СВОДНЫЙ ОТЧЕТ")
     print("=" * 60)
 
-    # Общая информация о базе данных
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
-
+    # Общая информация о базе данных - из сохраненной статистики, без COUNT(*)
     print("\nТаблицы в базе данных:")
-    for table in tables:
-        table_name = table[0]
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name};")
-        count_result = cursor.fetchone()
-        count = count_result[0] if count_result else 0
-        print(f"  - {table_name}: {count} записей")
+    for table_name, stats in report_table_stats(conn).items():
+        if stats["type"] == "view":
+            size = " (представление)"
+        elif stats["bytes"] is not None:
+            size = f" ({stats['bytes'] / 1024:.1f} КБ)"
+        else:
+            size = ""
+        print(f"  - {table_name}: {stats['rows']} записей{size}")
+
+    if cache is not None:
+        print(
+            f"\nКэш результатов: попаданий {cache.stats['hits']}, "
+            f"промахов {cache.stats['misses']}, "
+            f"вытеснений {cache.stats['evictions']}"
+        )
+
+
+def main(options: RunOptions | None = None) -> None:
+    """Выполняет этапы options.stages: загрузку, запросы, экспорт и отчет.
+
+    По умолчанию выполняются все этапы. Без загрузки используется уже
+    созданная база, CSV-файлы не нужны.
+    """
+    if options is None:
+        options = RunOptions()
+
+    print("=" * 60)
+    print("РАБОТА С ДАТАСЕТОМ TITANIC")
+    print("=" * 60)
+
+    if "load" in options.stages:
+        # Проверяем наличие файлов датасета
+        csv_files = list(DATA_TABLES.values())
+        missing_files = []
+
+        for file in csv_files:
+            if not os.path.exists(file):
+                missing_files.append(file)
+
+        if missing_files:
+            print(f"⚠️  Отсутствуют файлы датасета: {', '.join(missing_files)}")
+            print("Пожалуйста, скачайте датасет Titanic с Kaggle:")
+            print("https://www.kaggle.com/c/titanic/data")
+            print(
+                "И поместите файлы train.csv, test.csv и gender_submission.csv в текущую папку"
+            )
+            return
+
+        print("✓ Файлы датасета найдены")
+    elif not os.path.exists(DATABASE_PATH):
+        print(f"⚠️  База данных {DATABASE_PATH} не найдена")
+        print("Сначала загрузите данные: python src/zad.py load")
+        return
+    if "serve" in options.stages:
+        _serve_stage(options)
+        return
+
+    # Шаг 1: Создаем соединение с базой данных
+    conn: sqlite3.Connection = sqlite3.connect(DATABASE_PATH)
+    if "load" in options.stages:
+        _load_stage(conn, options)
+    else:
+        # Без загрузки режим all_passengers берется из базы, а не из умолчания
+        options = replace(options, combined_mode=stored_combined_mode(conn))
+
+    if options.capture_plans or options.check_plans:
+        print("\n2. ПЛАНЫ ЗАПРОСОВ...")
+        plans_ok = check_query_plans(conn, load_catalog(options.catalog_path), options)
+        conn.close()
+        if not plans_ok:
+            sys.exit(1)
+        return
+
+    finished: list[QueryResult] = []
+    cache = None
+    if "query" in options.stages:
+        finished, cache = _query_stage(conn, options)
+    if "report" in options.stages:
+        _summary_stage(conn, cache)
 
     # Закрываем соединение
     conn.close()
@@ -258,11 +4396,286 @@ def main() -> None:
     print("\n" + "=" * 60)
     print("ВЫПОЛНЕНИЕ ЗАВЕРШЕНО!")
     print("=" * 60)
-    print("\nРезультаты сохранены в папках:")
-    print("  - csv_results/  (файлы CSV)")
-    print("  - json_results/ (файлы JSON)")
-    print("\nДля просмотра результатов откройте файлы в этих папках.")
+    directories = dict.fromkeys(
+        path.split("/", 1)[0] for result in finished for path in result.outputs
+    )
+    if directories:
+        print("\nРезультаты сохранены в папках:")
+        for directory in directories:
+            print(f"  - {directory}/")
+        print("\nДля просмотра результатов откройте файлы в этих папках.")
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("значение должно быть больше нуля")
+    return number
+
+
+def _positive_float(value: str) -> float:
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError("значение должно быть больше нуля")
+    return number
+
+
+def _export_format(value: str) -> str:
+    try:
+        _split_format(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    return value
+
+
+def _megabytes(value: str) -> int:
+    return _positive_int(value) * 2**20
+
+
+def _add_load_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("загрузка")
+    group.add_argument(
+        "--chunk-rows",
+        type=_positive_int,
+        help="загружать CSV порциями по указанному числу строк",
+    )
+    group.add_argument(
+        "--force-reload",
+        action="store_true",
+        help="перезагрузить все таблицы, даже если CSV не менялись",
+    )
+    group.add_argument(
+        "--invalidate",
+        action="append",
+        metavar="CSV",
+        help="считать указанный CSV-файл измененным (можно повторять)",
+    )
+    group.add_argument(
+        "--analyze",
+        action="store_true",
+        help="пересобрать статистику таблиц для сводного отчета (ANALYZE)",
+    )
+    group.add_argument(
+        "--all-passengers",
+        dest="combined_mode",
+        choices=["table", "view"],
+        help="хранить all_passengers копией (table) или представлением UNION ALL (view)",
+    )
+    group.add_argument(
+        "--loader",
+        choices=["pandas", "bulk"],
+        help="способ вставки строк: DataFrame.to_sql или executemany с PRAGMA",
+    )
+    group.add_argument(
+        "--workers",
+        type=_positive_int,
+        help="число процессов для параллельного разбора CSV",
+    )
+    group.add_argument(
+        "--csv-cache",
+        action="store_true",
+        help="кэшировать разобранные CSV в .npy и читать их через mmap",
+    )
+
+
+def _add_catalog_arguments(group: argparse._ArgumentGroup) -> None:
+    group.add_argument(
+        "--catalog",
+        dest="catalog_path",
+        help="манифест каталога запросов (JSON со ссылками на .sql-файлы)",
+    )
+    group.add_argument(
+        "--query-timeout",
+        dest="query_timeout_s",
+        type=_positive_float,
+        metavar="SECONDS",
+        help="прерывать запрос, выполняющийся дольше указанного времени",
+    )
+    group.add_argument(
+        "--query-max-vm-steps",
+        type=_positive_int,
+        help="прерывать запрос после указанного числа шагов VDBE",
+    )
+
+
+def _add_query_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("запросы")
+    _add_catalog_arguments(group)
+    group.add_argument(
+        "--query-workers",
+        type=_positive_int,
+        help="число потоков для параллельного выполнения запросов",
+    )
+    group.add_argument(
+        "--result-cache",
+        action="store_true",
+        help="кэшировать результаты запросов в базе",
+    )
+    group.add_argument(
+        "--cache-max-entries",
+        type=_positive_int,
+        help="максимальное число записей в кэше результатов",
+    )
+    group.add_argument(
+        "--cache-max-mb",
+        dest="cache_max_bytes",
+        type=_megabytes,
+        help="максимальный объем кэша результатов, МБ",
+    )
+    group.add_argument(
+        "--shared-scan",
+        action="store_true",
+        help="считать агрегаты по одной таблице одним общим проходом",
+    )
+    group.add_argument(
+        "--summary-tables",
+        action="store_true",
+        help="поддерживать сводные таблицы триггерами и считать агрегаты по ним",
+    )
+    plans = group.add_mutually_exclusive_group()
+    plans.add_argument(
+        "--capture-plans",
+        action="store_true",
+        help="сохранить планы запросов каталога как базовые и завершить работу",
+    )
+    plans.add_argument(
+        "--check-plans",
+        action="store_true",
+        help="сверить планы запросов с базовыми; код возврата 1 при ухудшении",
+    )
+    group.add_argument(
+        "--plans",
+        dest="plans_path",
+        help="файл базовых планов запросов",
+    )
+    group.add_argument(
+        "--profile",
+        action="store_true",
+        help="профилировать запросы: шаги VDBE, трассировка, flame graph",
+    )
+    group.add_argument(
+        "--backend",
+        choices=["sqlite", "numpy"],
+        help="выполнять агрегатные запросы в SQLite или векторно в NumPy",
+    )
+    group.add_argument(
+        "--name",
+        dest="query_names",
+        action="append",
+        metavar="PATTERN",
+        help="выполнить только запросы с подходящим ключом (query_0*) "
+        "или с подстрокой в названии (можно повторять)",
+    )
+
+
+def _add_export_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("экспорт")
+    group.add_argument(
+        "--export-batch-rows",
+        type=_positive_int,
+        help="размер порции строк при потоковом экспорте результатов",
+    )
+    group.add_argument(
+        "--formats",
+        dest="export_formats",
+        type=_export_format,
+        nargs="+",
+        metavar="FORMAT",
+        help="форматы экспорта для всех запросов: csv, json, ndjson и их сжатые "
+        "варианты .gz, .bz2, .xz (по умолчанию - из каталога)",
+    )
+    group.add_argument(
+        "--shard-rows",
+        type=_positive_int,
+        help="писать текстовые форматы частями по столько строк (каталог .parts)",
+    )
+    group.add_argument(
+        "--shard-mb",
+        type=_positive_float,
+        help="писать текстовые форматы частями примерно по столько МБ текста",
+    )
+    group.add_argument(
+        "--export-workers",
+        type=_positive_int,
+        help="потоки сжатия и записи частей при экспорте частями",
+    )
+
+
+def _add_serve_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("сервис")
+    _add_catalog_arguments(group)
+    group.add_argument(
+        "--host",
+        dest="serve_host",
+        help=f"адрес, на котором слушает сервис (по умолчанию {SERVICE_HOST})",
+    )
+    group.add_argument(
+        "--port",
+        dest="serve_port",
+        type=int,
+        help=f"порт сервиса (по умолчанию {SERVICE_PORT}, 0 - любой свободный)",
+    )
+    group.add_argument(
+        "--socket",
+        dest="serve_socket",
+        metavar="PATH",
+        help="слушать Unix-сокет вместо TCP",
+    )
+    group.add_argument(
+        "--pool-size",
+        dest="serve_pool",
+        type=_positive_int,
+        help="число соединений только для чтения и потоков выполнения",
+    )
+
+
+# Группы аргументов каждого этапа
+_STAGE_ARGUMENTS = {
+    "load": _add_load_arguments,
+    "query": _add_query_arguments,
+    "export": _add_export_arguments,
+    "serve": _add_serve_arguments,
+}
+
+_COMMAND_HELP = {
+    "load": "загрузить изменившиеся CSV в базу",
+    "query": "выполнить запросы каталога без экспорта",
+    "export": "выполнить запросы каталога и экспортировать результаты",
+    "report": "сводный отчет по таблицам базы",
+    "serve": "сервис запросов по HTTP с ответами в NDJSON",
+}
+
+
+def _parse_args(argv: list[str] | None = None) -> RunOptions:
+    """Разбирает командную строку: команда этапа или без команды - все этапы.
+
+    Значения по умолчанию берутся из RunOptions: аргументы, которых нет
+    в командной строке, в пространство имен не попадают (SUPPRESS).
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in COMMAND_STAGES:
+        command, argv = argv[0], argv[1:]
+        stages = COMMAND_STAGES[command]
+        parser = argparse.ArgumentParser(
+            prog=f"zad.py {command}",
+            description=_COMMAND_HELP[command],
+            argument_default=argparse.SUPPRESS,
+        )
+    else:
+        stages = STAGES
+        parser = argparse.ArgumentParser(
+            description="Анализ датасета Titanic в SQLite. Без команды выполняются "
+            "все этапы; команды: "
+            + "; ".join(f"{name} - {text}" for name, text in _COMMAND_HELP.items()),
+            argument_default=argparse.SUPPRESS,
+        )
+    for stage in stages:
+        if stage in _STAGE_ARGUMENTS:
+            _STAGE_ARGUMENTS[stage](parser)
+    args = parser.parse_args(argv)
+    return RunOptions(stages=stages, **vars(args))
 
 
 if __name__ == "__main__":
-    main()
+    main(_parse_args())
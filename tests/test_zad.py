@@ -1,15 +1,27 @@
+import asyncio
+import bz2
+import gzip
+import hashlib
+import http.client
 import json
+import lzma
 import os
 import shutil
 import sqlite3
+import subprocess
 import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 import pytest
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
-from zad import main
+import zad
+from zad import QueryRunner, RunOptions, load_catalog, main
 
 
 @pytest.fixture
@@ -290,5 +302,1232 @@ def test_data_integrity(setup_test_environment, create_test_csv_files):
     conn.close()
 
 
+def test_table_stats_replace_counts_in_report(
+    setup_test_environment, create_test_csv_files, capsys
+):
+    """Тест статистики таблиц: собирается при загрузке, отчет не считает строки"""
+    main()
+    output = capsys.readouterr().out
+    assert "  - passengers_train: 5 записей (" in output
+    assert "  - all_passengers: 8 записей (" in output
+
+    conn = sqlite3.connect("titanic_database.db")
+    stats = zad.read_table_stats(conn)
+    assert stats["passengers_test"]["rows"] == 3
+    assert stats["passengers_test"]["bytes"] > 0
+    columns = stats["passengers_test"]["columns"]
+    assert columns["Age"] == {"nulls": 1, "distinct": 2}
+    assert columns["Cabin"] == {"nulls": 2, "distinct": 1}
+    assert columns["Sex"] == {"nulls": 0, "distinct": 1}
+    assert stats["all_passengers"]["columns"]["Survived"]["nulls"] == 3
+
+    # Отчет не читает таблицы данных, статистика служебных таблиц не собирается
+    def deny_passenger_tables(action, table, *args):
+        if action == sqlite3.SQLITE_READ and table in zad.TABLE_SCHEMAS:
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(deny_passenger_tables)
+    report = zad.report_table_stats(conn)
+    conn.set_authorizer(None)
+    assert report["passengers_train"]["rows"] == 5
+    assert list(report) == [*zad.DATA_TABLES, zad.COMBINED_TABLE]
+    assert set(zad.read_table_stats(conn)) == set(report)
+
+    # Изменения в обход загрузки видны после --analyze
+    conn.execute("DELETE FROM passengers_train WHERE PassengerId > 3")
+    conn.commit()
+    conn.close()
+    main(RunOptions(analyze=True))
+    assert "  - passengers_train: 3 записей (" in capsys.readouterr().out
+
+    main(RunOptions(combined_mode="view"))
+    assert "  - all_passengers: 6 записей (представление)" in capsys.readouterr().out
+
+
+def test_chunked_loading_matches_whole_file(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест потоковой загрузки порциями: данные совпадают с загрузкой целиком"""
+    main()
+    conn = sqlite3.connect("titanic_database.db")
+    expected = {
+        table: pd.read_sql_query(f"SELECT * FROM {table}", conn)
+        for table in ["passengers_train", "passengers_test", "all_passengers"]
+    }
+    conn.close()
+
+    main(RunOptions(chunk_rows=2, force_reload=True))
+    conn = sqlite3.connect("titanic_database.db")
+    for table, expected_df in expected.items():
+        actual_df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+        assert list(actual_df.columns) == list(expected_df.columns)
+        assert len(actual_df) == len(expected_df)
+        assert actual_df["PassengerId"].tolist() == expected_df["PassengerId"].tolist()
+        assert actual_df["Name"].tolist() == expected_df["Name"].tolist()
+    conn.close()
+
+
+def test_unchanged_sources_are_not_reloaded(
+    setup_test_environment, create_test_csv_files, capsys
+):
+    """Тест манифеста загрузки: неизмененные CSV не перезагружаются"""
+    main()
+    capsys.readouterr()
+
+    main()
+    captured = capsys.readouterr()
+    assert "создана" not in captured.out
+    assert "загрузка пропущена" in captured.out
+
+    conn = sqlite3.connect("titanic_database.db")
+    sources = [row[0] for row in conn.execute("SELECT source FROM load_manifest")]
+    conn.close()
+    assert sorted(sources) == ["gender_submission.csv", "test.csv", "train.csv"]
+
+
+def test_changed_source_reloads_dependent_tables(
+    setup_test_environment, create_test_csv_files, capsys
+):
+    """Тест манифеста загрузки: изменение файла перезагружает зависимые таблицы"""
+    train_df, _, _ = create_test_csv_files
+    main()
+    capsys.readouterr()
+
+    train_df.iloc[:3].to_csv("train.csv", index=False)
+    main()
+    captured = capsys.readouterr()
+    assert "'passengers_train' создана: 3 записей" in captured.out
+    assert "'all_passengers' создана: 6 записей" in captured.out
+    assert "'passengers_test' не изменилась" in captured.out
+
+    main(RunOptions(invalidate=["gender_submission.csv"]))
+    captured = capsys.readouterr()
+    assert "'submission_template' создана" in captured.out
+    assert "'passengers_train' не изменилась" in captured.out
+
+    main(RunOptions(force_reload=True))
+    captured = capsys.readouterr()
+    assert "загрузка пропущена" not in captured.out
+
+
+def test_all_passengers_view_matches_table(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест представления all_passengers: запросы 5, 6, 8, 9 дают те же результаты"""
+    main()
+    expected = {n: pd.read_csv(f"csv_results/query_{n:02d}.csv") for n in (5, 6, 8, 9)}
+
+    main(RunOptions(combined_mode="view"))
+    conn = sqlite3.connect("titanic_database.db")
+    object_type = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'all_passengers'"
+    ).fetchone()[0]
+    count = conn.execute("SELECT COUNT(*) FROM all_passengers").fetchone()[0]
+    conn.close()
+    assert object_type == "view"
+    assert count == 8
+
+    for n, expected_df in expected.items():
+        pd.testing.assert_frame_equal(
+            pd.read_csv(f"csv_results/query_{n:02d}.csv"), expected_df
+        )
+
+    # Обратное переключение снова материализует таблицу
+    main()
+    conn = sqlite3.connect("titanic_database.db")
+    object_type = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'all_passengers'"
+    ).fetchone()[0]
+    conn.close()
+    assert object_type == "table"
+
+
+def test_bulk_loader_matches_pandas(setup_test_environment, create_test_csv_files):
+    """Тест массовой загрузки: данные совпадают, PRAGMA восстановлены"""
+    main()
+    conn = sqlite3.connect("titanic_database.db")
+    expected = {
+        table: pd.read_sql_query(f"SELECT * FROM {table}", conn)
+        for table in [
+            "passengers_train",
+            "passengers_test",
+            "submission_template",
+            "all_passengers",
+        ]
+    }
+    conn.close()
+
+    main(RunOptions(loader="bulk", force_reload=True))
+    conn = sqlite3.connect("titanic_database.db")
+    for table, expected_df in expected.items():
+        actual_df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+        pd.testing.assert_frame_equal(actual_df, expected_df)
+
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    conn.close()
+
+
+def test_schema_and_index_plans(setup_test_environment, create_test_csv_files):
+    """Тест объявленной схемы: запросы 6, 7, 9 используют индексы без сортировки"""
+    main()
+    conn = sqlite3.connect("titanic_database.db")
+
+    columns = {
+        row[1]: (row[2], row[5])
+        for row in conn.execute("PRAGMA table_info(passengers_train)")
+    }
+    assert columns["PassengerId"] == ("INTEGER", 1)
+    assert columns["Age"][0] == "REAL"
+    assert columns["Name"][0] == "TEXT"
+
+    catalog = load_catalog()
+    for n in (6, 7, 9):
+        query = catalog[n - 1]
+        plan = [
+            row[3]
+            for row in conn.execute("EXPLAIN QUERY PLAN " + query.sql, query.params)
+        ]
+        assert any("INDEX" in step or "PRIMARY KEY" in step for step in plan), plan
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+    conn.close()
+
+
+def test_parallel_loading_matches_sequential(
+    setup_test_environment, create_test_csv_files, monkeypatch
+):
+    """Тест параллельной загрузки: файлы делятся на части и сливаются без потерь"""
+    main()
+    conn = sqlite3.connect("titanic_database.db")
+    expected = {
+        table: pd.read_sql_query(f"SELECT * FROM {table}", conn)
+        for table in ["passengers_train", "passengers_test", "all_passengers"]
+    }
+    conn.close()
+
+    # Крошечный размер части, чтобы train.csv разбился на несколько диапазонов
+    monkeypatch.setattr(zad, "PARALLEL_PART_BYTES", 64)
+    columns, ranges = zad.split_csv("train.csv", 3)
+    assert columns[0] == "PassengerId"
+    assert len(ranges) == 3
+
+    main(RunOptions(workers=3, force_reload=True))
+    conn = sqlite3.connect("titanic_database.db")
+    for table, expected_df in expected.items():
+        actual_df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+        pd.testing.assert_frame_equal(actual_df, expected_df)
+    conn.close()
+    assert not [name for name in os.listdir(".") if name.startswith(".staging-")]
+
+
+def test_csv_cache_skips_parsing(
+    setup_test_environment, create_test_csv_files, monkeypatch
+):
+    """Тест двоичного кэша: при теплом кэше CSV не разбирается"""
+    main(RunOptions(csv_cache=True))
+    assert os.path.exists(".csv_cache/train.csv/meta.json")
+    conn = sqlite3.connect("titanic_database.db")
+    expected = pd.read_sql_query("SELECT * FROM all_passengers", conn)
+    conn.close()
+
+    def fail_read_csv(*args, **kwargs):
+        raise AssertionError("CSV не должен разбираться при теплом кэше")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(zad.pd, "read_csv", fail_read_csv)
+        main(RunOptions(csv_cache=True, force_reload=True))
+        main(RunOptions(csv_cache=True, force_reload=True, chunk_rows=2))
+
+    conn = sqlite3.connect("titanic_database.db")
+    actual = pd.read_sql_query("SELECT * FROM all_passengers", conn)
+    conn.close()
+    pd.testing.assert_frame_equal(actual, expected)
+
+    # После touch без изменений содержимого хэш считается один раз
+    os.utime("train.csv", ns=(0, 10**18))
+    hashed = []
+    file_sha256 = zad.file_sha256
+    with monkeypatch.context() as patch:
+        patch.setattr(zad, "file_sha256", lambda p: hashed.append(p) or file_sha256(p))
+        assert zad._open_csv_cache("train.csv") is not None
+        assert zad._open_csv_cache("train.csv") is not None
+    assert hashed == ["train.csv"]
+
+    # Изменение CSV делает кэш недействительным
+    with open("test.csv", "a", encoding="utf-8") as f:
+        f.write("9,3,Extra Passenger,male,30,0,0,111,7.5,,S\n")
+    main(RunOptions(csv_cache=True))
+    conn = sqlite3.connect("titanic_database.db")
+    count = conn.execute("SELECT COUNT(*) FROM passengers_test").fetchone()[0]
+    conn.close()
+    assert count == 4
+
+
+def test_query_catalog_and_run_report(setup_test_environment, create_test_csv_files):
+    """Тест каталога запросов: параметры, повторное использование и отчет"""
+    main()
+
+    catalog = load_catalog()
+    assert [query.key for query in catalog] == [f"query_{n:02d}" for n in range(1, 11)]
+    assert catalog[0].params == {"limit": 10}
+
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    assert len(report["queries"]) == 10
+    for entry in report["queries"]:
+        assert entry["status"] == "completed"
+        assert set(entry["timings"]) == {"execute_s", "fetch_s", "export_s"}
+
+    # Вариант с другими параметрами выполняет то же выражение каталога
+    conn = sqlite3.connect("titanic_database.db")
+    runner = QueryRunner(conn)
+    first = runner.run(catalog[0])
+    variant = runner.run(catalog[0], {"limit": 2})
+    conn.close()
+    assert len(first.rows) == 5
+    assert len(variant.rows) == 2
+    assert variant.columns == ["PassengerId", "Name", "Sex", "Age", "Survived"]
+
+
+def test_parallel_queries_match_sequential(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест параллельного выполнения запросов на соединениях только для чтения"""
+    main()
+    expected = {
+        name: open(f"csv_results/{name}").read() for name in os.listdir("csv_results")
+    }
+
+    main(RunOptions(query_workers=4))
+    for name, content in expected.items():
+        assert open(f"csv_results/{name}").read() == content
+
+    conn = sqlite3.connect("titanic_database.db")
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+    readonly = zad.open_readonly_connections("titanic_database.db", 1)[0]
+    with pytest.raises(sqlite3.OperationalError):
+        readonly.execute("DELETE FROM passengers_train")
+    readonly.close()
+
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    assert report["query_workers"] == 4
+    assert [entry["key"] for entry in report["queries"]] == sorted(
+        entry["key"] for entry in report["queries"]
+    )
+
+
+def test_streaming_export_matches_pandas(setup_test_environment, create_test_csv_files):
+    """Тест потокового экспорта: порции fetchmany дают те же файлы, что pandas"""
+    main(RunOptions(export_batch_rows=1))
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+
+    conn = sqlite3.connect("titanic_database.db")
+    for query, entry in zip(load_catalog(), report["queries"]):
+        result = QueryRunner(conn).run(query)
+        df = result.to_frame()
+        assert entry["rows"] == len(df)
+        assert open(f"csv_results/{query.key}.csv").read() == df.to_csv(index=False)
+        expected = df.to_json(orient="records", indent=2, force_ascii=False)
+        assert open(f"json_results/{query.key}.json").read() == expected + "\n"
+
+    # В памяти остаются только первые строки, остальные сразу уходят в файлы
+    runner = QueryRunner(conn, stream=zad.StreamExport(batch_rows=2, keep_rows=1))
+    streamed = runner.run(load_catalog()[0])
+    conn.close()
+    assert len(streamed.rows) == 1
+    assert streamed.row_count == 5
+    assert not streamed.complete
+    assert streamed.outputs == [
+        "csv_results/query_01.csv",
+        "json_results/query_01.json",
+        "npy_results/query_01",
+    ]
+    assert len(pd.read_csv("csv_results/query_01.csv")) == 5
+
+
+def test_fan_out_export_formats(setup_test_environment, create_test_csv_files):
+    """Тест раздачи порций строк писателям нескольких форматов, в том числе сжатых"""
+    main()
+    conn = sqlite3.connect("titanic_database.db")
+    query = load_catalog()[0]
+    query.outputs = ["csv", "json", "ndjson", "csv.gz", "ndjson.gz"]
+    stream = zad.StreamExport(batch_rows=2)
+    result = QueryRunner(conn, stream=stream).run(query)
+    assert result.outputs == [
+        "csv_results/query_01.csv",
+        "json_results/query_01.json",
+        "ndjson_results/query_01.ndjson",
+        "csv_results/query_01.csv.gz",
+        "ndjson_results/query_01.ndjson.gz",
+    ]
+    assert set(result.export_stats) == set(query.outputs)
+
+    with gzip.open("csv_results/query_01.csv.gz", "rt", encoding="utf-8") as f:
+        assert f.read() == open("csv_results/query_01.csv").read()
+    with gzip.open("ndjson_results/query_01.ndjson.gz", "rt", encoding="utf-8") as f:
+        assert f.read() == open("ndjson_results/query_01.ndjson").read()
+    with open("ndjson_results/query_01.ndjson", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    with open("json_results/query_01.json", encoding="utf-8") as f:
+        assert records == json.load(f)
+
+    # В потоках и без них файлы те же самые, сжатые - побайтно
+    expected = {path: open(path, "rb").read() for path in result.outputs}
+    rows = QueryRunner(conn).run(query).rows
+    conn.close()
+    for threads in (True, False):
+        export = zad.ResultExport(query, result.columns, threads=threads)
+        export.write(rows[:2])
+        export.write(rows[2:])
+        export.close()
+        for path, content in expected.items():
+            assert open(path, "rb").read() == content
+
+    with pytest.raises(ValueError, match="csv.zip"):
+        zad._split_format("csv.zip")
+
+
+def test_export_formats_per_query_and_per_run(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест выбора форматов экспорта в каталоге и для всего запуска, отчет по форматам"""
+    catalog_path = os.path.join(
+        os.path.dirname(zad.__file__), "queries", "catalog.json"
+    )
+    with open(catalog_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest["outputs"] = ["ndjson.xz"]
+    manifest["queries"][0]["outputs"] = ["csv.bz2", "json"]
+    os.makedirs("queries")
+    for entry in manifest["queries"]:
+        shutil.copy(
+            os.path.join(os.path.dirname(catalog_path), entry["file"]), "queries"
+        )
+    with open("queries/catalog.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    main(RunOptions(catalog_path="queries/catalog.json"))
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    first, second = report["queries"][:2]
+    assert first["outputs"] == [
+        "csv_results/query_01.csv.bz2",
+        "json_results/query_01.json",
+    ]
+    assert second["outputs"] == ["ndjson_results/query_02.ndjson.xz"]
+    for entry in (first, second):
+        for fmt, path in zip(entry["formats"], entry["outputs"]):
+            stats = entry["formats"][fmt]
+            assert stats["bytes"] == os.path.getsize(path)
+            assert stats["mb_per_s"] > 0
+
+    with bz2.open("csv_results/query_01.csv.bz2", "rt", encoding="utf-8") as f:
+        assert len(pd.read_csv(f)) == 5
+    with lzma.open("ndjson_results/query_02.ndjson.xz", "rt", encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == [
+            {"total_passengers": 5, "survived": 3, "survival_rate_percent": 60.0}
+        ]
+
+    # Форматы запуска заменяют указанные в каталоге
+    main(RunOptions(catalog_path="queries/catalog.json", export_formats=["csv.xz"]))
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    assert all(list(entry["formats"]) == ["csv.xz"] for entry in report["queries"])
+    with pytest.raises(SystemExit):
+        zad._parse_args(["--formats", "csv.zip"])
+
+
+def test_exports_are_atomic_and_skip_unchanged_results(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест атомарной записи экспорта и пропуска файлов с неизменным результатом"""
+    main()
+    mtimes = {
+        path: os.stat(path).st_mtime_ns
+        for directory in ("csv_results", "json_results")
+        for path in (f"{directory}/{name}" for name in os.listdir(directory))
+    }
+    os.remove("json_results/query_03.json")
+    time.sleep(0.01)
+
+    main()
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    formats = {entry["key"]: entry["formats"] for entry in report["queries"]}
+    assert not formats["query_03"]["json"]["unchanged"]
+    assert formats["query_03"]["csv"]["unchanged"]
+    assert (
+        sum(stats["unchanged"] for f in formats.values() for stats in f.values()) == 29
+    )
+    for path, mtime in mtimes.items():
+        if path != "json_results/query_03.json":
+            assert os.stat(path).st_mtime_ns == mtime
+
+    # Дайджест - SHA-256 содержимого до сжатия, общий для вариантов формата
+    conn = sqlite3.connect("titanic_database.db")
+    query = load_catalog()[0]
+    query.outputs = ["csv", "csv.gz"]
+    runner = QueryRunner(conn, stream=zad.StreamExport(batch_rows=2))
+    streamed = runner.run(query)
+    rows = QueryRunner(conn).run(query).rows
+    digest = hashlib.sha256(open("csv_results/query_01.csv", "rb").read()).hexdigest()
+    assert streamed.export_stats["csv"]["sha256"] == digest
+    assert streamed.export_stats["csv.gz"]["sha256"] == digest
+
+    # Ошибка посреди записи оставляет прежний файл и не оставляет временных
+    before = open("csv_results/query_01.csv").read()
+    export = zad.ResultExport(query, streamed.columns)
+    export.write(rows[:2])
+    export.abort()
+    conn.close()
+    assert open("csv_results/query_01.csv").read() == before
+    assert not [name for name in os.listdir("csv_results") if name.endswith(".tmp")]
+
+
+def test_npy_bundle_round_trip_matches_csv(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест колоночного пакета npy: содержимое совпадает с CSV, колонки в mmap"""
+    main()
+    for query in load_catalog():
+        bundle = f"npy_results/{query.key}"
+        df = zad.read_npy_bundle(bundle)
+        expected = pd.read_csv(f"csv_results/{query.key}.csv")
+        assert list(df.columns) == list(expected.columns)
+        for name in df.columns:
+            column = df[name]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                column = column.astype(object).where(column.notna(), None)
+                expected[name] = expected[name].astype(object)
+                expected[name] = expected[name].where(expected[name].notna(), None)
+            pd.testing.assert_series_equal(
+                column, expected[name], check_dtype=False, check_names=False
+            )
+        with open(f"{bundle}/schema.json", encoding="utf-8") as f:
+            schema = json.load(f)
+        assert schema["rows"] == len(expected)
+        first = np.load(f"{bundle}/{schema['columns'][0]['file']}", mmap_mode="r")
+        assert isinstance(first, np.memmap)
+
+    # Вид колонки расширяется, если следующая порция его не вмещает
+    query = zad.CatalogQuery("widen", "Порции разных типов", "", outputs=["npy"])
+    export = zad.ResultExport(query, ["a", "b", "c", "d"])
+    export.write([(1, None, 1, None), (2, None, 2, None)])
+    export.write([(None, 3, 2.5, None), (4, 5, "x", None)])
+    export.close()
+    df = zad.read_npy_bundle("npy_results/widen", mmap=False)
+    assert df["a"].tolist()[::3] == [1.0, 4.0] and np.isnan(df["a"][2])
+    assert df["b"].dtype == np.float64 and df["b"].tolist()[2:] == [3.0, 5.0]
+    assert df["c"].astype(object).tolist() == ["1", "2", "2.5", "x"]
+    assert df["d"].isna().all()
+
+
+def test_sharded_export_parts_and_manifest(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест экспорта частями: строки по частям, манифест и данные как одним файлом"""
+    main()
+    conn = sqlite3.connect("titanic_database.db")
+    query = zad.CatalogQuery(
+        "passengers",
+        "Все пассажиры",
+        "SELECT * FROM all_passengers",
+        outputs=["csv", "json", "ndjson.gz"],
+    )
+    QueryRunner(conn, stream=zad.StreamExport(batch_rows=2)).run(query)
+    expected = pd.read_csv("csv_results/passengers.csv")
+    with open("json_results/passengers.json", encoding="utf-8") as f:
+        records = json.load(f)
+
+    shard = zad.ShardSpec(rows=3, workers=2)
+    stream = zad.StreamExport(batch_rows=2, shard=shard)
+    result = QueryRunner(conn, stream=stream).run(query)
+    conn.close()
+    assert result.outputs == [
+        "csv_results/passengers.csv.parts",
+        "json_results/passengers.json.parts",
+        "ndjson_results/passengers.ndjson.gz.parts",
+    ]
+    for path in result.outputs:
+        with open(f"{path}/manifest.json", encoding="utf-8") as f:
+            manifest = json.load(f)
+        parts = manifest["parts"]
+        assert manifest["rows"] == len(expected)
+        assert [part["rows"] for part in parts] == [
+            min(3, len(expected) - start) for start in range(0, len(expected), 3)
+        ]
+        for part in parts:
+            content = open(f"{path}/{part['file']}", "rb").read()
+            assert hashlib.sha256(content).hexdigest() == part["sha256"]
+            assert len(content) == part["bytes"]
+        assert sorted(os.listdir(path)) == sorted(
+            ["manifest.json"] + [part["file"] for part in parts]
+        )
+
+    # Каждая часть CSV - заголовок и строки файла без частей
+    path = "csv_results/passengers.csv.parts"
+    parts = json.load(open(f"{path}/manifest.json"))["parts"]
+    header, *body = open("csv_results/passengers.csv", encoding="utf-8").readlines()
+    lines = []
+    for part in parts:
+        part_header, *part_body = open(f"{path}/{part['file']}").readlines()
+        assert part_header == header
+        lines.extend(part_body)
+    assert lines == body
+    path = "json_results/passengers.json.parts"
+    parts = json.load(open(f"{path}/manifest.json"))["parts"]
+    assert [
+        record
+        for part in parts
+        for record in json.load(open(f"{path}/{part['file']}", encoding="utf-8"))
+    ] == records
+    path = "ndjson_results/passengers.ndjson.gz.parts"
+    parts = json.load(open(f"{path}/manifest.json"))["parts"]
+    lines = []
+    for part in parts:
+        with gzip.open(f"{path}/{part['file']}", "rt", encoding="utf-8") as f:
+            lines.extend(json.loads(line) for line in f)
+    assert lines == records
+
+    # Части по размеру закрываются на границе порции
+    query.outputs = ["ndjson"]
+    export = zad.ResultExport(
+        query, result.columns, shard=zad.ShardSpec(bytes=1, workers=1)
+    )
+    rows = [tuple(row) for row in expected.itertuples(index=False)][:4]
+    export.write(rows[:2])
+    export.write(rows[2:])
+    export.close()
+    with open("ndjson_results/passengers.ndjson.parts/manifest.json") as f:
+        assert [part["rows"] for part in json.load(f)["parts"]] == [2, 2]
+
+    # Размер части считается в байтах UTF-8, а не в символах: строка - 32 байта
+    export = zad.ResultExport(query, ["Name"], shard=zad.ShardSpec(bytes=60, workers=1))
+    for _ in range(4):
+        export.write([("ё" * 10,)])
+    export.close()
+    with open("ndjson_results/passengers.ndjson.parts/manifest.json") as f:
+        assert [part["rows"] for part in json.load(f)["parts"]] == [2, 2]
+
+
+def test_cli_commands_run_selected_stages(
+    setup_test_environment, create_test_csv_files, capsys
+):
+    """Тест команд load, query, export и report: этапы, отбор запросов, импорты"""
+    assert zad._parse_args([]) == RunOptions()
+    options = zad._parse_args(["query", "--name", "query_0[23]", "--name", "порт"])
+    assert options.stages == ("query",)
+    assert options.query_names == ["query_0[23]", "порт"]
+    assert zad._parse_args(["export", "--formats", "csv"]).stages == (
+        "query",
+        "export",
+    )
+    with pytest.raises(SystemExit):
+        zad._parse_args(["load", "--formats", "csv"])
+    with pytest.raises(SystemExit):
+        zad._parse_args(["report", "--name", "query_01"])
+
+    main(zad._parse_args(["report"]))
+    assert "не найдена" in capsys.readouterr().out
+    assert not os.path.exists("titanic_database.db")
+
+    main(zad._parse_args(["load"]))
+    output = capsys.readouterr().out
+    assert "'passengers_train' создана: 5 записей" in output
+    assert "ЗАПРОСОВ" not in output and "СВОДНЫЙ ОТЧЕТ" not in output
+
+    main(zad._parse_args(["query", "--name", "query_0[23]", "--name", "порт"]))
+    output = capsys.readouterr().out
+    assert "Выполнено: 3," in output and "ЗАГРУЗКА" not in output
+    assert not os.path.exists("csv_results")
+    with open("run_report.json", encoding="utf-8") as f:
+        entries = json.load(f)["queries"]
+    assert [entry["key"] for entry in entries] == ["query_02", "query_03", "query_10"]
+    # Без этапа экспорта файлы не пишутся и экспорт не замеряется
+    assert all(entry["outputs"] == [] for entry in entries)
+    assert all("export_s" not in entry["timings"] for entry in entries)
+
+    main(zad._parse_args(["export", "--name", "query_01", "--formats", "csv"]))
+    assert os.listdir("csv_results") == ["query_01.csv"]
+    assert "СВОДНЫЙ ОТЧЕТ" not in capsys.readouterr().out
+
+    # Отчет и запросы SQLite обходятся без импорта pandas и numpy
+    script = os.path.join(os.path.dirname(zad.__file__), "zad.py")
+    for command in (["report"], ["query", "--name", "query_02"]):
+        code = (
+            "import runpy, sys; "
+            f"sys.argv = [{script!r}, *{command!r}]; "
+            f"runpy.run_path({script!r}, run_name='__main__'); "
+            "print(sorted({'pandas', 'numpy'} & set(sys.modules)))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        assert output.splitlines()[-1] == "[]"
+
+
+def test_split_commands_use_stored_combined_mode(
+    setup_test_environment, create_test_csv_files, capsys
+):
+    """Тест команд без загрузки: режим all_passengers берется из базы"""
+    main(zad._parse_args(["load", "--all-passengers", "view"]))
+    main(zad._parse_args(["query", "--capture-plans", "--plans", "plans.json"]))
+    with open("plans.json", encoding="utf-8") as f:
+        assert list(json.load(f)["modes"]) == ["view"]
+
+    # Сверка идет с базовыми планами представления, а не режима table
+    capsys.readouterr()
+    main(zad._parse_args(["query", "--check-plans", "--plans", "plans.json"]))
+    assert "не хуже базовых" in capsys.readouterr().out
+
+
+def test_query_service_streams_ndjson(
+    setup_test_environment, create_test_csv_files, monkeypatch
+):
+    """Тест сервиса запросов: каталог и SELECT в NDJSON, только чтение, задержки"""
+    main()
+    service = zad.QueryService(
+        "titanic_database.db",
+        load_catalog(),
+        pool_size=2,
+        batch_rows=2,
+        budget=zad.QueryBudget(max_vm_steps=20_000),
+    )
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start(port=0))
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def request(method: str, path: str, body: object = None) -> tuple[int, str]:
+        client = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        payload = None if body is None else json.dumps(body)
+        client.request(method, path, payload)
+        response = client.getresponse()
+        text = response.read().decode("utf-8")
+        client.close()
+        return response.status, text
+
+    def records(text: str) -> list[dict]:
+        return [json.loads(line) for line in text.splitlines()]
+
+    try:
+        status, text = request("GET", "/queries")
+        assert status == 200 and len(json.loads(text)) == 10
+
+        # Ответ приходит порциями по 2 строки и совпадает с экспортом
+        for key in ("query_01", "query_03", "query_08"):
+            status, text = request("GET", f"/queries/{key}")
+            with open(f"json_results/{key}.json", encoding="utf-8") as f:
+                assert status == 200 and records(text) == json.load(f)
+        status, text = request("GET", "/queries/query_06?limit=2")
+        assert len(records(text)) == 2
+
+        status, text = request(
+            "POST",
+            "/sql",
+            {
+                "sql": "SELECT Name FROM passengers_train WHERE Sex = ?",
+                "params": ["male"],
+            },
+        )
+        assert records(text) == [
+            {"Name": "Braund, Mr. Owen Harris"},
+            {"Name": "Allen, Mr. William Henry"},
+        ]
+
+        # Запись, ATTACH и несколько выражений отклоняются до начала ответа
+        for sql in (
+            "DELETE FROM passengers_train",
+            "ATTACH 'other.db' AS other",
+            "PRAGMA journal_mode = WAL",
+            "SELECT 1; DROP TABLE passengers_train",
+        ):
+            status, text = request("POST", "/sql", {"sql": sql})
+            assert status == 400 and "error" in json.loads(text)
+        assert request("GET", "/queries/query_99")[0] == 404
+        assert request("POST", "/sql", {"query": "SELECT 1"})[0] == 400
+
+        # Параметр, который нельзя связать (целое вне 64 бит), - тоже 400
+        status, text = request("GET", "/queries/query_01?limit=99999999999999999999999")
+        assert status == 400 and "параметр" in json.loads(text)["error"]
+        status, text = request(
+            "POST",
+            "/sql",
+            {"sql": "SELECT ?", "params": [123456789012345678901234567890]},
+        )
+        assert status == 400 and "параметр" in json.loads(text)["error"]
+
+        # Превышение бюджета во время выборки - последней строкой ответа
+        status, text = request(
+            "POST",
+            "/sql",
+            {
+                "sql": "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL "
+                "SELECT x + 1 FROM c WHERE x < 1000000) SELECT x FROM c"
+            },
+        )
+        lines = records(text)
+        assert status == 200 and lines[0] == {"x": 1}
+        assert "бюджет" in lines[-1]["error"]
+
+        # Параллельные клиенты получают те же результаты
+        with open("json_results/query_08.json", encoding="utf-8") as f:
+            expected = json.load(f)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            texts = list(
+                pool.map(lambda _: request("GET", "/queries/query_08")[1], range(16))
+            )
+        assert all(records(text) == expected for text in texts)
+
+        # Непредвиденная ошибка - ответ 500, сервис продолжает работу
+        monkeypatch.setattr(service, "_execute", lambda *args: 1 / 0)
+        status, text = request("GET", "/queries/query_01")
+        assert status == 500 and "error" in json.loads(text)
+        monkeypatch.undo()
+        assert request("GET", "/queries/query_01")[0] == 200
+
+        stats = json.loads(request("GET", "/stats")[1])
+        assert stats["requests"] == 33 and stats["errors"] == 10
+        assert 0 < stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+        service.close()
+    conn = sqlite3.connect("titanic_database.db")
+    assert conn.execute("SELECT COUNT(*) FROM passengers_train").fetchone()[0] == 5
+    conn.close()
+
+
+def test_result_cache_hits_and_invalidation(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест кэша результатов: попадания, инвалидация по версии и вытеснение"""
+    train_df, _, _ = create_test_csv_files
+    main(RunOptions(result_cache=True))
+    expected = {
+        name: open(f"json_results/{name}").read() for name in os.listdir("json_results")
+    }
+
+    main(RunOptions(result_cache=True))
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    assert report["result_cache"] == {"hits": 10, "misses": 0, "evictions": 0}
+    for name, content in expected.items():
+        assert open(f"json_results/{name}").read() == content
+
+    # Попадание не читает таблицы пассажиров
+    conn = sqlite3.connect("titanic_database.db")
+
+    def deny_passenger_tables(action, table, *args):
+        if action == sqlite3.SQLITE_READ and table in zad.TABLE_SCHEMAS:
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(deny_passenger_tables)
+    cache = zad.ResultCache(conn)
+    assert all(cache.get(query) is not None for query in load_catalog())
+    conn.set_authorizer(None)
+
+    conn.close()
+
+    # Перезагрузка train.csv меняет версию таблиц, зависящие запросы промахиваются
+    train_df.iloc[:4].to_csv("train.csv", index=False)
+    main(RunOptions(result_cache=True))
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    cache_states = {entry["key"]: entry["cache"] for entry in report["queries"]}
+    assert cache_states["query_01"] == "miss"
+    assert cache_states["query_05"] == "miss"
+    assert cache_states["query_07"] == "hit"
+
+    # Изменение строк в обход загрузки тоже меняет версию (без --summary-tables)
+    conn = sqlite3.connect("titanic_database.db")
+    conn.execute("DELETE FROM passengers_test WHERE PassengerId = 8")
+    conn.commit()
+    conn.close()
+    main(RunOptions(result_cache=True))
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    cache_states = {entry["key"]: entry["cache"] for entry in report["queries"]}
+    assert cache_states["query_07"] == "miss"
+    assert cache_states["query_01"] == "hit"
+
+    # Лимит на число записей вытесняет устаревшие и давно использованные записи
+    conn = sqlite3.connect("titanic_database.db")
+    small = zad.ResultCache(conn, max_entries=2)
+    small.put(QueryRunner(conn).run(load_catalog()[0], {"limit": 1}))
+    assert conn.execute("SELECT COUNT(*) FROM query_result_cache").fetchone()[0] == 2
+    assert small.stats["evictions"] > 0
+    conn.close()
+
+
+@pytest.mark.parametrize("combined_mode", ["table", "view"])
+def test_numpy_backend_matches_sqlite(
+    setup_test_environment, create_test_csv_files, combined_mode
+):
+    """Тест бэкенда numpy: агрегаты совпадают с SQLite по значениям и типам"""
+    main(RunOptions(combined_mode=combined_mode))
+    conn = sqlite3.connect("titanic_database.db")
+    # Строка с NULL во всех ключах группировки и агрегируемых колонках
+    conn.execute("INSERT INTO passengers_train (PassengerId) VALUES (100)")
+
+    kernels = [query for query in load_catalog() if query.kernel]
+    assert [query.key for query in kernels] == [
+        "query_02",
+        "query_03",
+        "query_04",
+        "query_05",
+        "query_08",
+        "query_10",
+    ]
+    sqlite_runner = QueryRunner(conn)
+    numpy_runner = QueryRunner(conn, backend="numpy")
+    for query in kernels:
+        expected = sqlite_runner.run(query)
+        actual = numpy_runner.run(query)
+        assert actual.backend == "numpy"
+        assert actual.columns == expected.columns
+        assert actual.rows == expected.rows
+        assert [list(map(type, row)) for row in actual.rows] == [
+            list(map(type, row)) for row in expected.rows
+        ]
+    conn.close()
+
+    main(RunOptions(combined_mode=combined_mode, backend="numpy"))
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    backends = {entry["key"]: entry["backend"] for entry in report["queries"]}
+    assert backends["query_03"] == "numpy"
+    assert backends["query_01"] == "sqlite"
+
+
+def test_sqlite_round_matches_sqlite():
+    """Тест округления: совпадает с ROUND() SQLite на половинных значениях"""
+    conn = sqlite3.connect(":memory:")
+    for value in (38.385, 2.675, -2.675, 0.125, 74.2038216560509, 1e-9, 0.0):
+        expected = conn.execute("SELECT ROUND(?, 2)", (value,)).fetchone()[0]
+        assert zad._sqlite_round(value) == expected
+    assert zad._sqlite_round(None) is None
+    conn.close()
+
+
+def test_shared_scan_matches_separate_queries(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест общих проходов: результаты те же, проходов по таблицам меньше"""
+    main()
+    expected = {
+        name: open(f"json_results/{name}").read() for name in os.listdir("json_results")
+    }
+    with open("run_report.json", encoding="utf-8") as f:
+        separate_passes = json.load(f)["table_passes"]
+
+    main(RunOptions(shared_scan=True))
+    for name, content in expected.items():
+        assert open(f"json_results/{name}").read() == content
+
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    scans = {entry["key"]: entry["shared_scan"] for entry in report["queries"]}
+    assert scans["query_03"] == "passengers_train"
+    assert scans["query_08"] == "all_passengers"
+    assert scans["query_06"] is None
+    assert separate_passes == 6
+    assert report["table_passes"] == 2
+
+
+@pytest.mark.parametrize("combined_mode", ["table", "view"])
+def test_shared_scan_rollups_match_sqlite(
+    setup_test_environment, create_test_csv_files, combined_mode
+):
+    """Тест сверток общего прохода: каждый запрос с kernel совпадает с SQLite"""
+    main(RunOptions(combined_mode=combined_mode))
+    conn = sqlite3.connect("titanic_database.db")
+    # Дробные суммы по многим строкам: совпадение должно быть точным,
+    # вплоть до последних разрядов double и типов значений
+    conn.executemany(
+        "INSERT INTO passengers_train "
+        "(PassengerId, Survived, Pclass, Sex, Age, SibSp, Parch, Fare, Embarked) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                100 + i,
+                i % 2,
+                i % 3 + 1,
+                ("male", "female")[i % 5 % 2],
+                None if i % 7 == 0 else (i * 0.37) % 80,
+                i % 4,
+                i % 3,
+                None if i % 11 == 0 else (i * 7.13) % 512,
+                (None, "S", "C", "Q")[i % 4],
+            )
+            for i in range(500)
+        ],
+    )
+    conn.execute("INSERT INTO passengers_train (PassengerId) VALUES (99)")
+
+    kernels = [query for query in load_catalog() if query.kernel]
+    shared = zad.run_shared_scans(conn, kernels)
+    assert sorted(shared) == [query.key for query in kernels]
+    runner = QueryRunner(conn)
+    for query in kernels:
+        expected = runner.run(query)
+        actual = shared[query.key]
+        assert actual.columns == expected.columns
+        assert actual.rows == expected.rows
+        assert [list(map(type, row)) for row in actual.rows] == [
+            list(map(type, row)) for row in expected.rows
+        ]
+    conn.close()
+
+
+def test_summary_tables_follow_inserts_and_deletes(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест сводных таблиц: ответы совпадают с SQL и после изменения данных"""
+    main()
+    expected = {
+        name: open(f"csv_results/{name}").read() for name in os.listdir("csv_results")
+    }
+
+    main(RunOptions(summary_tables=True))
+    for name, content in expected.items():
+        assert open(f"csv_results/{name}").read() == content
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    summaries = {entry["key"]: entry["summary_table"] for entry in report["queries"]}
+    assert summaries["query_03"] == "summary_passengers_train"
+    assert summaries["query_08"] == "summary_all_passengers"
+    assert summaries["query_05"] is None
+
+    conn = sqlite3.connect("titanic_database.db")
+    conn.execute(
+        "INSERT INTO passengers_train (PassengerId, Survived, Pclass, Sex, Fare) "
+        "VALUES (100, 1, 2, 'female', 12.5)"
+    )
+    conn.execute("INSERT INTO passengers_train (PassengerId) VALUES (101)")
+    conn.execute("INSERT INTO all_passengers (PassengerId, Pclass) VALUES (100, 1)")
+    conn.execute("DELETE FROM passengers_train WHERE PassengerId = 1")
+    conn.execute("UPDATE all_passengers SET Sex = 'male' WHERE PassengerId = 2")
+
+    catalog = load_catalog()
+    answered = zad.run_summary_queries(conn, catalog)
+    assert sorted(answered) == [
+        "query_02",
+        "query_03",
+        "query_04",
+        "query_08",
+        "query_10",
+    ]
+    runner = QueryRunner(conn)
+    for query in catalog:
+        if query.key in answered:
+            assert answered[query.key].rows == runner.run(query).rows
+
+    # Без триггеров сводка считается устаревшей и не используется
+    conn.execute("DROP TRIGGER trg_summary_passengers_train_passengers_train_insert")
+    assert zad.summary_cells(conn, "passengers_train") is None
+    assert zad.refresh_summaries(conn, []) == ["passengers_train"]
+    conn.close()
+
+
+def test_query_plan_capture_and_regression_check(
+    setup_test_environment, create_test_csv_files, capsys
+):
+    """Тест планов запросов: базовые планы из репозитория и поиск регрессий"""
+    # Планы текущей схемы не хуже зафиксированных в репозитории
+    main(RunOptions(check_plans=True))
+    assert "не хуже базовых" in capsys.readouterr().out
+    assert not os.path.exists("csv_results")
+
+    main(RunOptions(capture_plans=True, plans_path="plans.json"))
+    with open("plans.json", encoding="utf-8") as f:
+        baseline = json.load(f)
+    assert baseline["modes"]["table"]["query_06"] == [
+        "SEARCH all_passengers USING INDEX idx_all_passengers_fare (Fare>?)"
+    ]
+
+    # Без индекса по Embarked запрос 10 переходит на полный проход с сортировкой
+    conn = sqlite3.connect("titanic_database.db")
+    conn.execute("DROP INDEX idx_passengers_train_embarked")
+    conn.commit()
+    conn.close()
+    with pytest.raises(SystemExit) as exc_info:
+        main(RunOptions(check_plans=True, plans_path="plans.json"))
+    assert exc_info.value.code == 1
+    output = capsys.readouterr().out
+    assert "query_10: full_scan 0 -> 1, temp_btree 1 -> 2" in output
+
+
+def test_plan_regressions_skip_index_scans():
+    """Тест признаков плана: проход по индексу не считается полным проходом"""
+    covering = ["SCAN t USING COVERING INDEX idx_t_sex"]
+    indexed = ["SCAN t USING INDEX idx_t_sex"]
+    full = ["SCAN t"]
+    assert zad.compare_query_plans({"q": covering}, {"q": full})[0] == [
+        "q: full_scan 0 -> 1"
+    ]
+    assert zad.compare_query_plans({"q": indexed}, {"q": full})[0] == [
+        "q: full_scan 0 -> 1"
+    ]
+    assert zad.compare_query_plans({"q": full}, {"q": covering}) == (
+        [],
+        ["q: план изменился без ухудшения"],
+    )
+
+
+def test_query_profile_outputs(setup_test_environment, create_test_csv_files):
+    """Тест профилирования: шаги VDBE, трассировка и свернутые стеки"""
+    main(RunOptions(profile=True))
+    with open("query_profile.json", encoding="utf-8") as f:
+        profiles = {entry["key"]: entry for entry in json.load(f)}
+    assert len(profiles) == 10
+
+    profile = profiles["query_03"]["profile"]
+    assert profile["vm_steps"] > 0
+    assert set(profile["vm_steps_by_phase"]) == {"execute", "fetch"}
+    assert profile["statements"] == [load_catalog()[2].sql.strip()]
+    assert profile["rows"] == 2
+    assert profile["bytes"] > 0
+
+    # При потоковом экспорте объем считается по всем строкам, а не по предпросмотру
+    conn = sqlite3.connect("titanic_database.db")
+    full = QueryRunner(conn).run(load_catalog()[0])
+    conn.close()
+    assert len(full.rows) > zad.PREVIEW_ROWS
+    assert profiles["query_01"]["profile"]["rows"] == len(full.rows)
+    assert profiles["query_01"]["profile"]["bytes"] == zad._materialized_bytes(
+        full.rows
+    )
+    assert set(profiles["query_03"]["timings"]) >= {"execute_s", "fetch_s", "export_s"}
+
+    with open("query_profile.folded", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines
+    for line in lines:
+        stack, value = line.rsplit(" ", 1)
+        assert stack.startswith("zad;query_")
+        assert int(value) > 0
+
+    # После запроса обработчики с соединения снимаются
+    conn = sqlite3.connect("titanic_database.db")
+    result = QueryRunner(conn, profile=True).run(load_catalog()[1])
+    conn.execute("SELECT COUNT(*) FROM passengers_train").fetchall()
+    assert len(result.profile["statements"]) == 1
+    assert QueryRunner(conn).run(load_catalog()[1]).profile is None
+    conn.close()
+
+
+def test_query_budgets_interrupt_long_queries(
+    setup_test_environment, create_test_csv_files
+):
+    """Тест бюджетов: долгий запрос прерывается, остальные выполняются"""
+    endless = (
+        "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) "
+        "SELECT COUNT(*) FROM n;"
+    )
+    files = {
+        "ok.sql": "SELECT COUNT(*) AS total FROM passengers_train;",
+        "endless.sql": endless,
+        "steps.sql": endless,
+        "broken.sql": "SELECT * FROM missing_table;",
+    }
+    os.makedirs("catalog", exist_ok=True)
+    for name, sql in files.items():
+        with open(f"catalog/{name}", "w", encoding="utf-8") as f:
+            f.write(sql)
+    entries = [
+        {"key": "ok", "name": "ok", "file": "ok.sql"},
+        {"key": "endless", "name": "endless", "file": "endless.sql"},
+        {"key": "steps", "name": "steps", "file": "steps.sql", "max_vm_steps": 5000},
+        {"key": "broken", "name": "broken", "file": "broken.sql"},
+    ]
+    with open("catalog/catalog.json", "w", encoding="utf-8") as f:
+        json.dump({"queries": entries}, f)
+
+    started = time.perf_counter()
+    main(RunOptions(catalog_path="catalog/catalog.json", query_timeout_s=0.2))
+    assert time.perf_counter() - started < 30
+
+    with open("run_report.json", encoding="utf-8") as f:
+        report = json.load(f)
+    entries = {entry["key"]: entry for entry in report["queries"]}
+    assert entries["ok"]["status"] == "completed"
+    assert entries["endless"]["status"] == "timed_out"
+    assert entries["endless"]["budget"] == "timeout"
+    assert entries["steps"]["status"] == "timed_out"
+    assert entries["steps"]["budget"] == "vm_steps"
+    assert entries["steps"]["vm_steps"] <= 5000 + zad.BUDGET_VM_INTERVAL
+    assert entries["broken"]["status"] == "failed"
+    assert report["statuses"] == {"completed": 1, "timed_out": 2, "failed": 1}
+
+    # Соединение после прерывания остается рабочим и без обработчиков
+    conn = sqlite3.connect("titanic_database.db")
+    runner = QueryRunner(conn, budget=zad.QueryBudget(max_vm_steps=1000))
+    with pytest.raises(zad.QueryBudgetExceeded):
+        runner.run(load_catalog("catalog/catalog.json")[1])
+    assert conn.execute("SELECT COUNT(*) FROM passengers_train").fetchone()[0] == 5
+    conn.close()
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"summary_tables": True},
+        {"shared_scan": True},
+        {"backend": "numpy"},
+    ],
+)
+def test_query_budgets_cover_every_path(
+    setup_test_environment, create_test_csv_files, capsys, options
+):
+    """Тест бюджетов: сводки, общие проходы и ядра numpy тоже прерываются"""
+    train_df, _, _ = create_test_csv_files
+    # Агрегату по 2000 строк нужно больше 1000 шагов VDBE
+    many = pd.concat([train_df] * 400, ignore_index=True)
+    many["PassengerId"] = range(100, len(many) + 100)
+    many.to_csv("train.csv", index=False)
+    main(RunOptions(**options))
+    capsys.readouterr()
+
+    def run(max_vm_steps: int) -> dict[str, dict]:
+        main(RunOptions(query_max_vm_steps=max_vm_steps, **options))
+        with open("run_report.json", encoding="utf-8") as f:
+            return {entry["key"]: entry for entry in json.load(f)["queries"]}
+
+    entries = run(500)
+    aggregates = ["query_02", "query_03", "query_04", "query_05", "query_08"]
+    if options.get("summary_tables"):
+        # Чтение сводки укладывается в бюджет, а MIN/MAX запроса 5 - нет
+        for key in aggregates[:3] + aggregates[4:]:
+            assert entries[key]["status"] == "completed"
+            assert entries[key]["summary_table"] is not None
+        aggregates = ["query_05"]
+    for key in aggregates:
+        assert entries[key]["status"] == "timed_out"
+    assert entries["query_01"]["status"] == "completed"
+    if options.get("backend") == "numpy":
+        assert "запросы с бюджетом выполняются в SQLite: query_02" in (
+            capsys.readouterr().out
+        )
+
+    # С достаточным бюджетом общие проходы не отключаются
+    entries = run(10**7)
+    assert all(entry["status"] == "completed" for entry in entries.values())
+    if options.get("shared_scan"):
+        assert entries["query_05"]["shared_scan"] == "all_passengers"
+
+    with pytest.raises(SystemExit):
+        zad._parse_args(["query", "--query-timeout", "0"])
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])